@@ -11,6 +11,13 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
     %  -> CHANGE: Please support a path to your python env
     python_path = '/Users/papillon/opt/anaconda3/envs/ML/bin/python3';
     
+    % Optional: set hparam.UseServer = true to query a running CalcParam_Server.py
+    % instead of loading the neural network in every call
+    calc_script = 'CalcParam.py';
+    if isfield(hparam, 'UseServer') && hparam.UseServer
+        calc_script = 'CalcParam_Client.py';
+    end
+    
     % Unity-based normalisation --------
     Func_Normalisation = @(x, min_x, max_x) (x - min_x)/(max_x - min_x);
     Func_NormalisationToValues = @(Z, min_x, max_x) Z.*max_x-Z.*min_x+min_x;
@@ -51,7 +58,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Fx',{' '}, num2str(paramValues(2)),...
                     ' --Fy',{' '}, num2str(paramValues(3)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -72,7 +79,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Scone',{' '}, num2str(paramValues(3)),...
                     ' --Mel',{' '}, num2str(paramValues(4)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -93,7 +100,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Fy',{' '}, num2str(paramValues(3)),...
                     ' --Mel',{' '}, num2str(paramValues(4)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -150,7 +157,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Fx',{' '}, num2str(paramValues(2)),...
                     ' --Fy',{' '}, num2str(paramValues(3)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -171,7 +178,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Scone',{' '}, num2str(paramValues(3)),...
                     ' --Mel',{' '}, num2str(paramValues(4)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -192,7 +199,7 @@ function [out, PupilModelResult] = NNCombinedModel(hparam)
                     ' --Fy',{' '}, num2str(paramValues(3)),...
                     ' --Mel',{' '}, num2str(paramValues(4)));
                 current_path = pwd;
-                optimizer_path = strcat(current_path,'/Python/CalcParam.py');
+                optimizer_path = strcat(current_path,'/Python/', calc_script);
                 call_python = char(strcat(python_path, {' '}, optimizer_path, {' '}, params));
                 cd('Python/');
                 [status, out] = system(call_python);
@@ -0,0 +1,298 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# One archive file (.ckpa) per training run instead of one full Lightning checkpoint every 100 epochs.
+# Only the weights (state_dict) are stored, optionally as float16 and/or zlib compressed. Every tensor is
+# stored once per content: a tensor which did not change between two epochs points to the same entry.
+#
+# Layout of the file:
+#   b'FFCKPA01' | tensor entries ... | JSON index | footer: index offset (uint64), index length (uint64), b'FFCKPA01'
+# The index lists the epochs (tensor names -> entry, global step) and the entries (offset, length, dtype,
+# shape, compression). Loading an epoch reads the footer, the index and only the entries of that epoch.
+# New entries are appended behind the last footer and a new index + footer is written after them, the previous
+# index is never overwritten, so the archive stays readable if a training is interrupted while writing.
+# close() of a written archive removes the old indices (compact()).
+#
+# Run from the folder Python/ to convert the existing checkpoint folders:
+#   python -m A01_Functions.CheckpointArchive --Precision float16 --Compression
+#   -> A03_Models/Archive/<Condition>/<Variant>/FF_Variant_1_BatchSize_7.ckpa
+
+import os
+import re
+import io
+import json
+import glob
+import zlib
+import struct
+import hashlib
+import threading
+import numpy as np
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import ModelRoot, ArchiveRoot
+
+Magic = b'FFCKPA01'
+FooterFormat = '<QQ8s'
+FooterSize = struct.calcsize(FooterFormat)
+
+
+class CheckpointArchive:
+
+    def __init__(self, PATH, Mode='r', Precision='float32', Compression=False, CompressionLevel=6):
+        # Mode: 'r' read, 'a' append (creates the archive if it is missing), 'w' new archive.
+        # Precision ('float32' or 'float16') and Compression are used for newly written entries.
+        if Mode not in ['r', 'a', 'w']:
+            raise ValueError('Unknown Mode ' + str(Mode) + ' (r, a or w)')
+        if Precision not in ['float32', 'float16']:
+            raise ValueError('Unknown Precision ' + str(Precision) + ' (float32 or float16)')
+
+        self.PATH = PATH
+        self.Mode = Mode
+        self.Precision = Precision
+        self.Compression = Compression
+        self.CompressionLevel = CompressionLevel
+        self.Lock = threading.Lock()
+        self.Modified = False
+
+        if Mode == 'w' or (Mode == 'a' and not os.path.isfile(PATH)):
+            if os.path.dirname(PATH) != '':
+                os.makedirs(os.path.dirname(PATH), exist_ok=True)
+            self.File = open(PATH, 'w+b')
+            self.File.write(Magic)
+            self.Index = {'Version': 1, 'hparams': None, 'Epochs': {}, 'Entries': []}
+            self.EndOffset = len(Magic)
+            self.writeIndex()
+        else:
+            self.File = open(PATH, 'rb' if Mode == 'r' else 'r+b')
+            self.readIndex()
+
+        # Content hash -> entry number for the deduplication
+        self.Hashes = {Entry['Hash']: Number for Number, Entry in enumerate(self.Index['Entries'])}
+
+    def readIndex(self):
+        self.File.seek(0)
+        if self.File.read(len(Magic)) != Magic:
+            raise ValueError('Not a checkpoint archive: ' + self.PATH)
+
+        self.File.seek(-FooterSize, io.SEEK_END)
+        [IndexOffset, IndexLength, FooterMagic] = struct.unpack(FooterFormat, self.File.read(FooterSize))
+        if FooterMagic != Magic:
+            [IndexOffset, IndexLength] = self.findFooter()
+
+        self.File.seek(IndexOffset)
+        self.Index = json.loads(self.File.read(IndexLength).decode('utf-8'))
+        # Appended entries go behind the footer, the valid index stays intact until a new one is written
+        self.EndOffset = self.File.seek(0, io.SEEK_END)
+
+    def findFooter(self):
+        # Last complete footer of an archive whose last append was interrupted (entries or index behind it)
+        self.File.seek(0)
+        Content = self.File.read()
+        End = len(Content)
+        while True:
+            End = Content.rfind(Magic, len(Magic), End)
+            if End < 0:
+                raise ValueError('Checkpoint archive without a valid index: ' + self.PATH)
+            Start = End + len(Magic) - FooterSize
+            if Start >= len(Magic):
+                [IndexOffset, IndexLength, _] = struct.unpack(FooterFormat, Content[Start:End + len(Magic)])
+                if IndexOffset + IndexLength == Start:
+                    return IndexOffset, IndexLength
+
+    def writeIndex(self):
+        Content = json.dumps(self.Index, separators=(',', ':')).encode('utf-8')
+        self.File.seek(self.EndOffset)
+        self.File.write(Content)
+        self.File.write(struct.pack(FooterFormat, self.EndOffset, len(Content), Magic))
+        self.File.truncate()
+        self.File.flush()
+        self.EndOffset = self.File.tell()
+
+    def writeEntry(self, Array):
+        Array = np.ascontiguousarray(Array)
+        StoredType = Array.dtype
+        if self.Precision == 'float16' and np.issubdtype(Array.dtype, np.floating):
+            StoredType = np.dtype(np.float16)
+
+        Content = Array.astype(StoredType).tobytes()
+        Hash = hashlib.sha1(Content + str(StoredType).encode('utf-8') + str(Array.shape).encode('utf-8')).hexdigest()
+
+        if Hash in self.Hashes:
+            return self.Hashes[Hash]
+
+        if self.Compression:
+            Content = zlib.compress(Content, self.CompressionLevel)
+
+        self.File.seek(self.EndOffset)
+        self.File.write(Content)
+
+        self.Index['Entries'].append({'Offset': self.EndOffset, 'Length': len(Content), 'DType': str(Array.dtype),
+                                      'StoredDType': str(StoredType), 'Shape': list(Array.shape),
+                                      'Compression': 'zlib' if self.Compression else None, 'Hash': Hash})
+        self.EndOffset += len(Content)
+        self.Hashes[Hash] = len(self.Index['Entries']) - 1
+
+        return self.Hashes[Hash]
+
+    def readEntry(self, Number):
+        Entry = self.Index['Entries'][Number]
+        self.File.seek(Entry['Offset'])
+        Content = self.File.read(Entry['Length'])
+
+        if Entry['Compression'] == 'zlib':
+            Content = zlib.decompress(Content)
+
+        Array = np.frombuffer(Content, dtype=np.dtype(Entry['StoredDType'])).reshape(Entry['Shape'])
+
+        return Array.astype(np.dtype(Entry['DType']))
+
+    def write(self, Epoch, StateDict, hparams=None, GlobalStep=None):
+        # StateDict: names -> torch tensors or numpy arrays, hparams: dict or Namespace (stored once)
+        if self.Mode == 'r':
+            raise IOError('Checkpoint archive opened read-only: ' + self.PATH)
+
+        with self.Lock:
+            Tensors = {}
+            for Name, Tensor in StateDict.items():
+                if hasattr(Tensor, 'detach'):
+                    Tensor = Tensor.detach().cpu().numpy()
+                Tensors[Name] = self.writeEntry(np.asarray(Tensor))
+
+            if hparams is not None:
+                self.Index['hparams'] = dict(vars(hparams)) if not isinstance(hparams, dict) else dict(hparams)
+
+            self.Index['Epochs'][str(int(Epoch))] = {'Tensors': Tensors, 'GlobalStep': GlobalStep}
+            self.writeIndex()
+            self.Modified = True
+
+    def epochs(self):
+        return sorted(int(Epoch) for Epoch in self.Index['Epochs'])
+
+    def hparams(self):
+        return self.Index['hparams']
+
+    def loadNumpy(self, Epoch):
+        # Weights of one epoch as numpy arrays in the stored dtype (float16 entries as float32)
+        Key = str(int(Epoch))
+        if Key not in self.Index['Epochs']:
+            raise KeyError('Epoch ' + Key + ' not in ' + self.PATH + ', available: ' + str(self.epochs()))
+
+        with self.Lock:
+            return {Name: self.readEntry(Number) for Name, Number in self.Index['Epochs'][Key]['Tensors'].items()}
+
+    def load(self, Epoch):
+        # state_dict of one epoch with torch tensors
+        import torch
+
+        return {Name: torch.from_numpy(Array.copy()) for Name, Array in self.loadNumpy(Epoch).items()}
+
+    def loadCheckpoint(self, Epoch):
+        # Same keys as a Lightning checkpoint without the optimizer state
+        return {'epoch': int(Epoch) + 1,
+                'global_step': self.Index['Epochs'][str(int(Epoch))]['GlobalStep'],
+                'state_dict': self.load(Epoch),
+                'hparams': self.hparams(),
+                'hparams_type': 'namespace'}
+
+    def compact(self):
+        # Rewrites the archive without the old indices into a temporary file, which replaces the archive
+        with self.Lock:
+            Index = json.loads(json.dumps(self.Index))
+            TemporaryPath = self.PATH + '.' + str(os.getpid()) + '.tmp'
+            with open(TemporaryPath, 'wb') as Target:
+                Target.write(Magic)
+                for Entry in Index['Entries']:
+                    self.File.seek(Entry['Offset'])
+                    Content = self.File.read(Entry['Length'])
+                    Entry['Offset'] = Target.tell()
+                    Target.write(Content)
+
+                IndexOffset = Target.tell()
+                Content = json.dumps(Index, separators=(',', ':')).encode('utf-8')
+                Target.write(Content)
+                Target.write(struct.pack(FooterFormat, IndexOffset, len(Content), Magic))
+
+            self.File.close()
+            os.replace(TemporaryPath, self.PATH)
+            self.File = open(self.PATH, 'r+b')
+            self.Index = Index
+            self.EndOffset = self.File.seek(0, io.SEEK_END)
+            self.Modified = False
+
+    def close(self):
+        if self.Mode != 'r' and self.Modified:
+            self.compact()
+        self.File.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Arguments):
+        self.close()
+
+
+def Func_loadArchiveModel(PATH, Epoch):
+    # FeedForward in eval mode from one epoch of an archive
+    import A02_Networks.FeedForward as FF_Class
+    from argparse import Namespace
+
+    with CheckpointArchive(PATH) as Archive:
+        model = FF_Class.FeedForward(Namespace(**Archive.hparams()))
+        model.load_state_dict(Archive.load(Epoch))
+
+    model.eval()
+    return model
+
+
+def Func_convertFolder(Folder, ArchivePath, Precision='float32', Compression=False):
+    # All .ckpt files of a folder (one training run) into one archive, ordered by epoch
+    import torch
+
+    Checkpoints = []
+    for PATH in glob.glob(os.path.join(Folder, '*.ckpt')):
+        Match = re.search(r'epoch=(\d+)\.ckpt$', PATH)
+        if Match:
+            Checkpoints.append((int(Match.group(1)), PATH))
+
+    with CheckpointArchive(ArchivePath, 'w', Precision=Precision, Compression=Compression) as Archive:
+        for (Epoch, PATH) in sorted(Checkpoints):
+            Checkpoint = torch.load(PATH, map_location='cpu')
+            Archive.write(Epoch, Checkpoint['state_dict'], hparams=dict(Checkpoint['hparams']),
+                          GlobalStep=Checkpoint.get('global_step'))
+
+    return ArchivePath, len(Checkpoints)
+
+
+def Func_convertTree(ModelRoot, TargetRoot=ArchiveRoot, Precision='float32', Compression=False):
+    # Every checkpoint folder below ModelRoot into TargetRoot/<same folders>/<checkpoint prefix>.ckpa
+    Archives = []
+    Folders = sorted(set(os.path.dirname(PATH) for PATH in glob.glob(os.path.join(ModelRoot, '**', '*.ckpt'),
+                                                                       recursive=True)))
+    for Folder in Folders:
+        Prefixes = sorted(set(re.sub(r'epoch=\d+\.ckpt$', '', os.path.basename(PATH))
+                              for PATH in glob.glob(os.path.join(Folder, '*.ckpt'))))
+        Name = Prefixes[0].rstrip('_') if len(Prefixes) == 1 else 'Checkpoints'
+        ArchivePath = os.path.join(TargetRoot, os.path.relpath(Folder, ModelRoot), Name + '.ckpa')
+
+        [ArchivePath, NumCheckpoints] = Func_convertFolder(Folder, ArchivePath, Precision, Compression)
+        SizeBefore = sum(os.path.getsize(PATH) for PATH in glob.glob(os.path.join(Folder, '*.ckpt')))
+        print('Converted ' + str(NumCheckpoints) + ' checkpoints ({:.1f} MB) -> {} ({:.1f} MB)'.format(
+            SizeBefore / 1e6, ArchivePath, os.path.getsize(ArchivePath) / 1e6))
+        Archives.append(ArchivePath)
+
+    return Archives
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Source', type=str, default=ModelRoot)
+    parser.add_argument('--Target', type=str, default=ArchiveRoot)
+    parser.add_argument('--Precision', type=str, default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--Compression', action='store_true')
+    args = parser.parse_args()
+
+    Func_convertTree(args.Source, args.Target, Precision=args.Precision, Compression=args.Compression)
@@ -0,0 +1,168 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Python port of CombinedPupilModel() from Functions/NNCombinedModel.m for many stimuli at once.
+# Every function takes arrays with one entry per stimulus (N) and returns N x len(t) matrices.
+# The phasic differential equation of Fan & Yao (2011) is integrated for the whole batch in one
+# fixed-step Runge-Kutta (RK4) run on the time grid instead of one ode45 call per stimulus.
+
+import numpy as np
+
+# Arguments of CombinedPupilModel() used in NNCombinedModel.m: age, adaptation luminance in cd/m^2,
+# field diameter in degree and number of eyes of the Watson & Yellot (2012) start diameter
+WatsonParameter = {'Single': {'ageY': 33, 'luminanceCDm2': 199.45, 'fieldDiameterDEG': 53.1, 'eyeNumber': 2},
+                   'Multi': {'ageY': 22.1, 'luminanceCDm2': 199.45, 'fieldDiameterDEG': 53.1, 'eyeNumber': 2}}
+
+# Offset correction of the Watson & Yellot (2012) model
+WatsonOffset = {'Single': 0.25898, 'Multi': 0.41834}
+
+# Parameter masc function, different between Single & Multi
+MascParameter = {'Single': {'q': 1.5524, 'r': 0.0248},
+                 'Multi': {'q': 1.1359, 'r': 0.3517}}
+
+# Constant parameter Fan & Yao (2011) model
+PhasicConstants = {'L_0d': 3.3403, 'l_0c': 1.0710, 'K_d': 1.0714, 'K_c': 0, 'D': 3.4855,
+                   'f_p_i_0': 0, 'f_s_i_0': 0, 'x0_2': 0}
+
+# Order of the 17 model parameters (output of the neural networks)
+ParameterLabels = ['f_p', 'f_s', 'P_0', 'tp', 'ts', 'Delta_tp', 'Delta_ts',
+                   'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p8', 'p9', 'p10']
+
+
+def Func_timeVector():
+    # Time grid of NNCombinedModel.m: 0:0.01:300 seconds
+    return np.linspace(0, 300, 30001)
+
+
+def Func_getPupilSizeWatson(ageY, luminanceCDm2, fieldDiameterDEG, eyeNumber, Offset, Condition):
+    # Offset corrected Watson & Yellot pupil model
+    fieldSizeDeg2 = ((np.asarray(fieldDiameterDEG, dtype=float) / 2) ** 2) * np.pi
+    ReferenceAge = 28.58
+    e = np.where(np.asarray(eyeNumber) == 1, 0.1, 1)
+
+    F = (fieldSizeDeg2 * np.asarray(luminanceCDm2, dtype=float) * e / 846) ** 0.41
+    ResultFunction_1 = 7.75 - 5.75 * (F / (F + 2))
+    ResultA = 0.021323 - (0.0095623 * ResultFunction_1)
+    ResultB = (np.asarray(ageY, dtype=float) - ReferenceAge) * ResultA
+
+    if Offset:
+        return ResultFunction_1 + ResultB - WatsonOffset[Condition]
+
+    return ResultFunction_1 + ResultB
+
+
+def Func_phasicModel(f_p, f_s, P_0, tp, ts, Delta_tp, Delta_ts, x0_1, t, SubSteps=1,
+                     L_0d=PhasicConstants['L_0d'], l_0c=PhasicConstants['l_0c'],
+                     K_d=PhasicConstants['K_d'], K_c=PhasicConstants['K_c'], D=PhasicConstants['D'],
+                     f_p_i_0=PhasicConstants['f_p_i_0'], f_s_i_0=PhasicConstants['f_s_i_0'],
+                     x0_2=PhasicConstants['x0_2']):
+    # Differential equation from Fan & Yao 2011, see Phasic_Model() in NNCombinedModel.m
+    # f_p, ..., x0_1: arrays with one value per stimulus (N), t: time grid of the solution.
+    # SubSteps: number of RK4 steps between two points of t
+    [f_p, f_s, P_0, tp, ts, Delta_tp, Delta_ts, x0_1] = np.broadcast_arrays(
+        *[np.atleast_1d(np.asarray(Value, dtype=float)) for Value in [f_p, f_s, P_0, tp, ts, Delta_tp, Delta_ts, x0_1]])
+
+    t = np.asarray(t, dtype=float)
+    tp_end = tp + Delta_tp
+    ts_end = ts + Delta_ts
+
+    def ddefunc(T, y1, y2):
+        f_p_i_g = f_p_i_0 + np.where((T >= tp) & (T <= tp_end), f_p, 0)
+        f_s_i_g = f_s_i_0 + np.where((T >= ts) & (T <= ts_end), f_s, 0)
+
+        return y2, (-K_c * (l_0c - y1) ** 2) + (K_d * (L_0d - y1) ** 2) - (D * y2) - f_p_i_g + f_s_i_g + P_0
+
+    Result = np.empty((x0_1.shape[0], t.shape[0]))
+    y1 = x0_1.copy()
+    y2 = np.full_like(y1, x0_2)
+    Result[:, 0] = y1
+
+    for Index in range(t.shape[0] - 1):
+        h = (t[Index + 1] - t[Index]) / SubSteps
+        T = t[Index]
+
+        for Step in range(SubSteps):
+            k1_1, k1_2 = ddefunc(T, y1, y2)
+            k2_1, k2_2 = ddefunc(T + h / 2, y1 + h / 2 * k1_1, y2 + h / 2 * k1_2)
+            k3_1, k3_2 = ddefunc(T + h / 2, y1 + h / 2 * k2_1, y2 + h / 2 * k2_2)
+            k4_1, k4_2 = ddefunc(T + h, y1 + h * k3_1, y2 + h * k3_2)
+
+            y1 = y1 + h / 6 * (k1_1 + 2 * k2_1 + 2 * k3_1 + k4_1)
+            y2 = y2 + h / 6 * (k1_2 + 2 * k2_2 + 2 * k3_2 + k4_2)
+            T = T + h
+
+        Result[:, Index + 1] = y1
+
+    return Result
+
+
+def Func_tonicModel(t, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10):
+    # p1*t^9 + p2*t^8 + ... + p9*t + p10 for every stimulus (Horner scheme)
+    t = np.asarray(t, dtype=float)[np.newaxis, :]
+    Result = np.zeros((np.atleast_1d(p1).shape[0], t.shape[1]))
+
+    for p in [p1, p2, p3, p4, p5, p6, p7, p8, p9, p10]:
+        Result = Result * t + np.atleast_1d(np.asarray(p, dtype=float))[:, np.newaxis]
+
+    return Result
+
+
+def Func_mascFunction(t, q, r):
+    g_2 = 0.5 + 0.5 * np.tanh((np.asarray(t, dtype=float) - q) / r)
+    g_1 = 1 - g_2
+
+    return g_1, g_2
+
+
+def Func_combinedPupilModel(Parameters, Condition, t=None, SubSteps=1, ChunkSize=1024, InitalPupilDiameter=None):
+    # Parameters: N x 17 matrix of absolute (denormalised) model parameters in the order of ParameterLabels.
+    # Returns a dict like the table of CombinedPupilModel(): Time, PhasicModel, TonicModel, CombinedModel,
+    # the model results as N x len(t) matrices. The batch is computed in chunks of ChunkSize stimuli.
+    if t is None:
+        t = Func_timeVector()
+
+    Parameters = np.atleast_2d(np.asarray(Parameters, dtype=float))
+    t = np.asarray(t, dtype=float)
+
+    if InitalPupilDiameter is None:
+        # Get inital pupil diameter from offset corrected Watson & Yellot (2012) pupil model
+        InitalPupilDiameter = Func_getPupilSizeWatson(Offset=True, Condition=Condition, **WatsonParameter[Condition])
+
+    InitalPupilDiameter = np.broadcast_to(np.asarray(InitalPupilDiameter, dtype=float), (Parameters.shape[0],))
+
+    [G1, G2] = Func_mascFunction(t, MascParameter[Condition]['q'], MascParameter[Condition]['r'])
+
+    PhasicPupilDiameter = np.empty((Parameters.shape[0], t.shape[0]))
+    TonicPupilDiameter = np.empty((Parameters.shape[0], t.shape[0]))
+
+    for Start in range(0, Parameters.shape[0], ChunkSize):
+        P = Parameters[Start:Start + ChunkSize].T
+
+        # Get the phasic time dependent pupil diameter from Fan & Yao (2011) model
+        PhasicPupilDiameter[Start:Start + ChunkSize] = Func_phasicModel(
+            P[0], P[1], P[2], P[3], P[4], P[5], P[6], InitalPupilDiameter[Start:Start + ChunkSize], t,
+            SubSteps=SubSteps)
+
+        # Get the tonic time dependent pupil diameter from a custom made equation
+        TonicPupilDiameter[Start:Start + ChunkSize] = Func_tonicModel(t, *P[7:17])
+
+    # Combine the phasic and the tonic model with a masc function
+    CombinedModel = TonicPupilDiameter * G2 + PhasicPupilDiameter * G1
+
+    return {'Time': t, 'PhasicModel': PhasicPupilDiameter, 'TonicModel': TonicPupilDiameter,
+            'CombinedModel': CombinedModel}
+
+
+def Func_predictPupilModel(Condition, Variant, Stimuli, t=None, SubSteps=1, ChunkSize=1024, Epoch=None):
+    # Complete model of NNCombinedModel.m in Python: absolute light metrics (N x 3 or N x 4 in the input order
+    # of shapeTrainData()) -> neural network -> absolute model parameters -> combined pupil model
+    from A01_Functions.NumpyInference import Func_predictNumpy
+
+    Parameters = Func_predictNumpy(Condition, Variant, Stimuli, Epoch=Epoch, Physical=True)
+
+    return Func_combinedPupilModel(Parameters, Condition, t=t, SubSteps=SubSteps, ChunkSize=ChunkSize)
@@ -0,0 +1,252 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Training data sources for Func_readDataIn() and FeedForward.prepare_data().
+# DataPath selects the source, the format follows from the extension:
+#   .csv       table with the column names of the training data (A00_Data/TrainData_*.csv)
+#   .npy       structured array with the column names as fields
+#   .npz       one array per column
+#   .parquet   needs pandas with pyarrow or fastparquet
+#   .cols      column store: folder with one .npy file per column and Columns.json (Func_buildColumnStore)
+# The input/target matrices of a Variant are cached as .npz file in A05_Cache/Tensors/. The name contains a
+# fingerprint of the source (path, size and modification time), so a changed file is converted again.
+# Column stores are not loaded into memory: ColumnStoreDataset reads the rows of a batch from memory-mapped
+# columns, so the dataset can be larger than the RAM.
+#
+# Run from the folder Python/ to convert a table into a column store:
+#   python -m A01_Functions.Dataset --Source A00_Data/TrainData_Many_Subject.csv --Target A00_Data/Many.cols
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import torch
+import torch.utils.data
+from argparse import ArgumentParser
+from A01_Functions.Profiling import span
+
+TensorCache_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A05_Cache',
+                                   'Tensors')
+
+DataFormats = ['.csv', '.npy', '.npz', '.parquet', '.cols']
+
+# Version of the tensor cache files, part of the fingerprint
+CacheVersion = 1
+
+
+def Func_dataFormat(DataPath):
+    Extension = os.path.splitext(DataPath.rstrip('/\\'))[1].lower()
+    if Extension not in DataFormats:
+        raise ValueError('Unknown data format ' + str(Extension) + ' of ' + DataPath + ', use one of ' +
+                         str(DataFormats))
+    return Extension
+
+
+def Func_dataFingerprint(DataPath):
+    # sha1 of the absolute path, size and modification time (of Columns.json for column stores)
+    StatusPath = os.path.join(DataPath, 'Columns.json') if Func_dataFormat(DataPath) == '.cols' else DataPath
+    Status = os.stat(StatusPath)
+    Description = [os.path.abspath(DataPath), Status.st_size, Status.st_mtime_ns, CacheVersion]
+
+    return hashlib.sha1(json.dumps(Description).encode('utf-8')).hexdigest()
+
+
+def Func_readColumns(DataPath, Labels):
+    # Dictionary Label -> numpy column of a source
+    Format = Func_dataFormat(DataPath)
+
+    if Format == '.csv':
+        Data = pd.read_csv(DataPath, usecols=Labels)
+        return {Label: Data[Label].values for Label in Labels}
+
+    if Format == '.parquet':
+        Data = pd.read_parquet(DataPath, columns=Labels)
+        return {Label: Data[Label].values for Label in Labels}
+
+    if Format == '.npy':
+        Data = np.load(DataPath, mmap_mode='r')
+        if Data.dtype.names is None:
+            raise ValueError(DataPath + ' has no named fields, save a structured array')
+        return {Label: np.asarray(Data[Label]) for Label in Labels}
+
+    if Format == '.npz':
+        with np.load(DataPath) as Data:
+            return {Label: Data[Label] for Label in Labels}
+
+    Store = ColumnStore(DataPath)
+    return {Label: np.asarray(Store.column(Label)) for Label in Labels}
+
+
+def Func_loadTensors(Variant, DataPath, CacheFolder=TensorCache_Default):
+    # Input and target tensors (float32) of a Variant, read from the tensor cache if the source did not change.
+    # CacheFolder=None: no cache
+    from A01_Functions.ReadData import shapeTrainData
+
+    [InputtLabels, TargetLabels] = shapeTrainData(Variant)
+    CachePath = None
+
+    if CacheFolder is not None:
+        Name = os.path.splitext(os.path.basename(DataPath.rstrip('/\\')))[0]
+        CachePath = os.path.join(CacheFolder, Name + '_Variant_' + str(Variant) + '_' +
+                                 Func_dataFingerprint(DataPath)[:16] + '.npz')
+
+        if os.path.isfile(CachePath):
+            with span('Dataset.loadCache'), np.load(CachePath) as Cached:
+                return [torch.from_numpy(Cached['Input']), torch.from_numpy(Cached['Target'])]
+
+    with span('Dataset.read'):
+        Columns = Func_readColumns(DataPath, InputtLabels + TargetLabels)
+
+    with span('Dataset.toTensor'):
+        InputValues = np.stack([Columns[Label] for Label in InputtLabels], axis=1).astype(np.float32)
+        TargetValues = np.stack([Columns[Label] for Label in TargetLabels], axis=1).astype(np.float32)
+
+    if CachePath is not None:
+        os.makedirs(CacheFolder, exist_ok=True)
+        # Written under a temporary name, parallel runs never read a partial file
+        TemporaryPath = CachePath[:-4] + '.' + str(os.getpid()) + '.tmp.npz'
+        np.savez(TemporaryPath, Input=InputValues, Target=TargetValues)
+        os.replace(TemporaryPath, CachePath)
+
+    return [torch.from_numpy(InputValues), torch.from_numpy(TargetValues)]
+
+
+class ColumnStore:
+    # Folder with Columns.json ({'Rows': N, 'Columns': [...]}) and one float32 .npy file per column
+
+    def __init__(self, PATH):
+        self.PATH = PATH
+        with open(os.path.join(PATH, 'Columns.json')) as File:
+            Description = json.load(File)
+        self.Rows = Description['Rows']
+        self.Columns = Description['Columns']
+        self.Memmaps = {}
+
+    def column(self, Label):
+        if Label not in self.Columns:
+            raise KeyError('Column store ' + self.PATH + ' has no column ' + Label)
+        if Label not in self.Memmaps:
+            self.Memmaps[Label] = np.load(os.path.join(self.PATH, Label + '.npy'), mmap_mode='r')
+        return self.Memmaps[Label]
+
+
+class ColumnStoreDataset(torch.utils.data.Dataset):
+    # Rows of a column store as (input, target) pairs. With a list of indices (BatchSampler, see
+    # Func_dataLoader) the whole batch is gathered from the memory-mapped columns at once
+
+    def __init__(self, PATH, Variant):
+        from A01_Functions.ReadData import shapeTrainData
+
+        self.PATH = PATH
+        self.Variant = Variant
+        [self.InputtLabels, self.TargetLabels] = shapeTrainData(Variant)
+        self.Store = None
+        self.Rows = ColumnStore(PATH).Rows
+
+    def __len__(self):
+        return self.Rows
+
+    def __getstate__(self):
+        # The memory maps are opened again in every DataLoader worker
+        State = dict(self.__dict__)
+        State['Store'] = None
+        return State
+
+    def __getitem__(self, Index):
+        if self.Store is None:
+            self.Store = ColumnStore(self.PATH)
+
+        if np.isscalar(Index):
+            Rows = Index
+        else:
+            # Sorted indices read the memory maps in file order
+            Rows = np.sort(np.asarray(Index))
+
+        InputValues = np.stack([self.Store.column(Label)[Rows] for Label in self.InputtLabels], axis=-1)
+        TargetValues = np.stack([self.Store.column(Label)[Rows] for Label in self.TargetLabels], axis=-1)
+
+        return torch.from_numpy(InputValues), torch.from_numpy(TargetValues)
+
+
+def Func_loadDataset(Variant, DataPath, CacheFolder=TensorCache_Default, MemoryMap=None):
+    # torch Dataset of a source: TensorDataset in memory or ColumnStoreDataset.
+    # MemoryMap=None: memory-mapped for column stores, in memory for all other formats
+    if MemoryMap is None:
+        MemoryMap = Func_dataFormat(DataPath) == '.cols'
+
+    if MemoryMap:
+        if Func_dataFormat(DataPath) != '.cols':
+            raise ValueError('Memory mapping needs a column store (.cols), convert ' + DataPath +
+                             ' with Func_buildColumnStore()')
+        return ColumnStoreDataset(DataPath, Variant)
+
+    return torch.utils.data.TensorDataset(*Func_loadTensors(Variant, DataPath, CacheFolder))
+
+
+def Func_dataLoader(Dataset, BatchSize, Shuffle=True, DropLast=True, NumWorkers=0):
+    # DataLoader of Func_loadDataset(): column stores get whole batches of indices
+    if isinstance(Dataset, ColumnStoreDataset):
+        Sampler = torch.utils.data.RandomSampler(Dataset) if Shuffle else torch.utils.data.SequentialSampler(Dataset)
+        return torch.utils.data.DataLoader(Dataset, batch_size=None, num_workers=NumWorkers,
+                                           sampler=torch.utils.data.BatchSampler(Sampler, BatchSize, DropLast))
+
+    return torch.utils.data.DataLoader(dataset=Dataset, batch_size=BatchSize, shuffle=Shuffle, drop_last=DropLast,
+                                       num_workers=NumWorkers)
+
+
+def Func_buildColumnStore(Source, Target, ChunkSize=1000000):
+    # Converts a .csv or .parquet table with all numeric columns into a column store (float32),
+    # tables are read in chunks of ChunkSize rows, so the source can be larger than the RAM
+    Format = Func_dataFormat(Source)
+
+    if Format == '.csv':
+        Columns = [Label for Label, Values in pd.read_csv(Source, nrows=100).items()
+                   if pd.api.types.is_numeric_dtype(Values)]
+        # Rows the parser yields (blank lines and a missing final newline do not count), one column is enough
+        Rows = sum(len(Chunk) for Chunk in pd.read_csv(Source, usecols=Columns[:1], chunksize=ChunkSize))
+        Chunks = pd.read_csv(Source, usecols=Columns, chunksize=ChunkSize)
+    elif Format == '.parquet':
+        Data = pd.read_parquet(Source)
+        Columns = [Label for Label, Values in Data.items() if pd.api.types.is_numeric_dtype(Values)]
+        Rows = len(Data)
+        Chunks = [Data[Columns]]
+    else:
+        raise ValueError('Column stores are built from .csv or .parquet files')
+
+    os.makedirs(Target, exist_ok=True)
+    Memmaps = {Label: np.lib.format.open_memmap(os.path.join(Target, Label + '.npy'), mode='w+', dtype=np.float32,
+                                                shape=(Rows,)) for Label in Columns}
+
+    Start = 0
+    for Chunk in Chunks:
+        for Label in Columns:
+            Memmaps[Label][Start:Start + len(Chunk)] = Chunk[Label].values
+        Start += len(Chunk)
+    if Start != Rows:
+        raise ValueError(Source + ': ' + str(Start) + ' rows parsed, ' + str(Rows) + ' expected')
+
+    for Memmap in Memmaps.values():
+        Memmap.flush()
+
+    # Columns.json is written last, an interrupted conversion is not a valid store
+    with open(os.path.join(Target, 'Columns.json'), 'w') as File:
+        json.dump({'Rows': Start, 'Columns': Columns, 'Source': os.path.abspath(Source)}, File, indent=2)
+
+    return Target
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Source', type=str, required=True)
+    parser.add_argument('--Target', type=str, required=True, help='Folder of the column store (.cols)')
+    parser.add_argument('--ChunkSize', type=int, default=1000000)
+    args = parser.parse_args()
+
+    Func_buildColumnStore(args.Source, args.Target, args.ChunkSize)
+    print('Column store written to ' + args.Target + ' (' + str(ColumnStore(args.Target).Rows) + ' rows)')
@@ -0,0 +1,253 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Training and inference of K FeedForward networks (an ensemble of seeds) as one batched model.
+# The weights of the K members are stacked into K x out x in tensors and every layer is a single batched
+# matrix multiplication (torch.baddbmm), so K small networks cost about as much as one larger network.
+# Every member draws its own random permutation of the training data in every epoch. The loss is the sum of
+# the K member losses, so the gradient of a member only depends on its own batch. Adam works element by
+# element, therefore one Adam over the stacked tensors is the same as K independent Adam optimizers; the
+# moments of every member are split off again when its checkpoint is written.
+# The members are saved as normal FeedForward checkpoints (Member_<k>/FF_Variant_..._epoch=N.ckpt), which
+# can be used by CalcParam.py, the model registry and FeedForward.load_from_checkpoint().
+
+import os
+import glob
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from argparse import Namespace
+from A01_Functions.ReadData import Func_readDataIn, DataPath_Default
+from A01_Functions.MetricsLogger import MetricsLogger
+from A01_Functions.FastTraining import Func_saveCheckpoint
+import A02_Networks.FeedForward as FF_Class
+
+# Layers of FeedForward in the order of the forward pass, ReLU after the first two layers
+LayerNames = ['input_Layer', 'hidden_layer_1', 'hidden_layer_2', 'output_Layer']
+ReLULayers = ['input_Layer', 'hidden_layer_1']
+
+
+class EnsembleFeedForward(nn.Module):
+
+    def __init__(self, StateDicts, Variant=None):
+        # StateDicts: list of K FeedForward state_dicts with the same layer sizes
+        super().__init__()
+        self.NumMembers = len(StateDicts)
+        self.Variant = Variant
+
+        for Layer in LayerNames:
+            setattr(self, Layer + '_weight', nn.Parameter(
+                torch.stack([State[Layer + '.weight'].detach().float().cpu() for State in StateDicts])))
+            setattr(self, Layer + '_bias', nn.Parameter(
+                torch.stack([State[Layer + '.bias'].detach().float().cpu() for State in StateDicts])))
+
+        self.InputSize = self.input_Layer_weight.shape[2]
+
+    def forward(self, x):
+        # x: N x InputSize (the same inputs for every member) or K x N x InputSize, returns K x N x 17
+        if x.dim() == 2:
+            x = x.unsqueeze(0).expand(self.NumMembers, -1, -1)
+
+        for Layer in LayerNames:
+            Weight = getattr(self, Layer + '_weight')
+            Bias = getattr(self, Layer + '_bias')
+            x = torch.baddbmm(Bias.unsqueeze(1), x, Weight.transpose(1, 2))
+            if Layer in ReLULayers:
+                x = torch.relu(x)
+
+        return x
+
+    def memberStateDict(self, Member):
+        # state_dict of one member with the parameter names of FeedForward
+        State = {}
+        for Layer in LayerNames:
+            State[Layer + '.weight'] = getattr(self, Layer + '_weight')[Member].detach().clone()
+            State[Layer + '.bias'] = getattr(self, Layer + '_bias')[Member].detach().clone()
+
+        return State
+
+
+def Func_memberOptimizer(Ensemble, Optimizer, Member, Model, learningRate):
+    # Adam optimizer of a single FeedForward with the moments of one member of the stacked optimizer
+    MemberOptimizer = optim.Adam(Model.parameters(), lr=learningRate)
+    Parameters = dict(Model.named_parameters())
+
+    for Layer in LayerNames:
+        for Kind in ['weight', 'bias']:
+            State = Optimizer.state.get(getattr(Ensemble, Layer + '_' + Kind), {})
+            if len(State) == 0:
+                continue
+
+            MemberOptimizer.state[Parameters[Layer + '.' + Kind]] = {
+                Name: Value[Member].clone() if torch.is_tensor(Value) and Value.dim() > 0 else Value
+                for Name, Value in State.items()}
+
+    return MemberOptimizer
+
+
+def Func_saveMembers(Ensemble, Optimizer, hparams, ModelFolder, CheckpointNameStr, Epoch, GlobalStep, Seeds):
+    for Member in range(Ensemble.NumMembers):
+        Model = FF_Class.FeedForward(Namespace(**dict(vars(hparams), Seed=Seeds[Member])))
+        Model.load_state_dict(Ensemble.memberStateDict(Member))
+        MemberOptimizer = Func_memberOptimizer(Ensemble, Optimizer, Member, Model, hparams.learningRate)
+
+        Func_saveCheckpoint(os.path.join(ModelFolder, 'Member_' + str(Member), CheckpointNameStr + 'epoch=' +
+                                         str(Epoch) + '.ckpt'), Model, MemberOptimizer, Model.hparams,
+                            Epoch, GlobalStep)
+
+
+def Func_runEnsembleTraining(Epoch, numHiddenNeuron_1, numHiddenNeuron_2, Variant, BatchSize, learningRate,
+                             NumMembers=8, Seed=0, DataPath=DataPath_Default, CheckpointPeriod=100,
+                             PrintPeriod=100, Device='cpu', ModelFolder='A03_Models/FF/Ensemble/',
+                             DataFolder='A04_Results_Training/02_Data/', PlotFolder=None, PlotPeriod=100):
+    # Member k is initialised like a FeedForward created after torch.manual_seed(Seed + k)
+    InputSize = 3 if Variant == 1 else 4
+    Seeds = [Seed + Member for Member in range(NumMembers)]
+
+    hparams = Namespace(layer_1_dim=numHiddenNeuron_1,
+                        layer_2_dim=numHiddenNeuron_2,
+                        Variant=Variant,
+                        BatchSize=BatchSize,
+                        learningRate=learningRate,
+                        InputSize=InputSize,
+                        DataPath=DataPath)
+
+    StateDicts = []
+    for MemberSeed in Seeds:
+        torch.manual_seed(MemberSeed)
+        StateDicts.append(FF_Class.FeedForward(hparams).state_dict())
+
+    # Seed of the shuffles of all members
+    torch.manual_seed(Seed)
+
+    Ensemble = EnsembleFeedForward(StateDicts, Variant).to(Device)
+    Ensemble.train()
+    Optimizer = optim.Adam(Ensemble.parameters(), lr=learningRate)
+
+    [TrainInputMatrix, TrainTargetMatrix] = Func_readDataIn(Variant, DataPath)
+    TrainInputMatrix = TrainInputMatrix.to(Device)
+    TrainTargetMatrix = TrainTargetMatrix.to(Device)
+
+    NumSamples = TrainInputMatrix.shape[0]
+    StepsPerEpoch = NumSamples // BatchSize
+
+    if StepsPerEpoch == 0:
+        raise ValueError('BatchSize ' + str(BatchSize) + ' is larger than the dataset (' + str(NumSamples) + ' rows)')
+
+    DataNameStr = 'FF_Ensemble_' + str(NumMembers) + '_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + \
+                  '_Epoch_' + str(Epoch) + '_Hidden_' + str(numHiddenNeuron_1) + '_' + str(numHiddenNeuron_2)
+    CheckpointNameStr = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_'
+
+    for Member in range(NumMembers):
+        os.makedirs(os.path.join(ModelFolder, 'Member_' + str(Member)), exist_ok=True)
+
+    # MSE, MAE and SD of every step and member, read back from the device once per epoch.
+    # The log contains the average over the members.
+    StepMetrics = torch.zeros(StepsPerEpoch, NumMembers, 3, device=Device)
+    Logger = MetricsLogger(LogPath=DataFolder + DataNameStr + '.csv',
+                           PlotPath=PlotFolder + DataNameStr + '.png' if PlotFolder is not None else None,
+                           MaxEpochs=Epoch, PlotPeriod=PlotPeriod)
+    GlobalStep = 0
+
+    Start = time.time()
+
+    for CurrentEpoch in range(Epoch):
+        # One independent permutation per member
+        Permutation = torch.argsort(torch.rand(NumMembers, NumSamples, device=Device), dim=1)
+
+        for Step in range(StepsPerEpoch):
+            Index = Permutation[:, Step * BatchSize:(Step + 1) * BatchSize]
+            data = TrainInputMatrix[Index]
+            target = TrainTargetMatrix[Index]
+
+            Optimizer.zero_grad()
+            output = Ensemble(data)
+            MemberLoss = ((output - target) ** 2).mean(dim=(1, 2))
+            MemberLoss.sum().backward()
+            Optimizer.step()
+            GlobalStep += 1
+
+            with torch.no_grad():
+                Difference = (output - target).abs().reshape(NumMembers, -1)
+                StepMetrics[Step, :, 0] = MemberLoss
+                StepMetrics[Step, :, 1] = Difference.mean(dim=1)
+                StepMetrics[Step, :, 2] = Difference.std(dim=1)
+
+        MemberValues = StepMetrics.mean(dim=0)
+        Values = MemberValues.mean(dim=0).cpu().numpy()
+        Logger.logEpoch(CurrentEpoch, *Values)
+
+        if CurrentEpoch % CheckpointPeriod == 0:
+            Func_saveMembers(Ensemble, Optimizer, hparams, ModelFolder, CheckpointNameStr, CurrentEpoch, GlobalStep,
+                             Seeds)
+
+        if PrintPeriod > 0 and (CurrentEpoch % PrintPeriod == 0 or CurrentEpoch == Epoch - 1):
+            print('Train Epoch [{}/{}]: Loss (MSE): {:.9f} (members {:.9f} - {:.9f}) Loss (MAE): {:.9f} SD {:.8f}'
+                  ' - {:.1f} Epochs/s'.format(CurrentEpoch, Epoch, Values[0], float(MemberValues[:, 0].min()),
+                                              float(MemberValues[:, 0].max()), Values[1], Values[2],
+                                              (CurrentEpoch + 1) / (time.time() - Start)))
+
+    Duration = time.time() - Start
+
+    Func_saveMembers(Ensemble, Optimizer, hparams, ModelFolder, CheckpointNameStr, Epoch - 1, GlobalStep, Seeds)
+
+    Logger.close()
+
+    print('Ensemble training: ' + str(NumMembers) + ' members, ' + str(Epoch) +
+          ' epochs in {:.2f} seconds ({:.1f} Epochs/s)'.format(Duration, Epoch / Duration))
+
+    return Ensemble, Epoch / Duration
+
+
+def Func_listMembers(ModelFolder, Epoch):
+    # Checkpoints of all members of an ensemble folder for one epoch
+    return sorted(glob.glob(os.path.join(ModelFolder, 'Member_*', '*epoch=' + str(Epoch) + '.ckpt')),
+                  key=lambda PATH: int(os.path.basename(os.path.dirname(PATH))[len('Member_'):]))
+
+
+def Func_loadEnsemble(CheckpointPaths):
+    # EnsembleFeedForward from member checkpoints (e.g. Func_listMembers() or checkpoints of a sweep)
+    if len(CheckpointPaths) == 0:
+        raise ValueError('No checkpoints for the ensemble')
+
+    Checkpoints = [torch.load(PATH, map_location='cpu') for PATH in CheckpointPaths]
+    Ensemble = EnsembleFeedForward([Checkpoint['state_dict'] for Checkpoint in Checkpoints],
+                                   int(dict(Checkpoints[0]['hparams'])['Variant']))
+    Ensemble.eval()
+
+    return Ensemble
+
+
+def Func_predictEnsemble(Ensemble, InputMatrix, ChunkSize=4096, Condition=None, Physical=False):
+    # Returns the mean and the standard deviation over the members (N x 17 each) of all members in one forward.
+    # Physical=True: inputs and outputs in absolute units with the scalers of the Condition
+    # Physical inputs are normalised in float64, the narrow luminance range loses its resolution in float32
+    if Physical:
+        from A01_Functions.Normalisation import Func_getScalers
+        [InputScaler, OutputScaler] = Func_getScalers(Condition, Ensemble.Variant)
+        InputMatrix = InputScaler.normalise(np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64)))
+
+    InputMatrix = torch.as_tensor(InputMatrix, dtype=torch.float32)
+    if InputMatrix.dim() == 1:
+        InputMatrix = InputMatrix.unsqueeze(0)
+
+    Outputs = []
+    with torch.no_grad():
+        for StartRow in range(0, InputMatrix.shape[0], ChunkSize):
+            Outputs.append(Ensemble(InputMatrix[StartRow:StartRow + ChunkSize]))
+    Outputs = torch.cat(Outputs, dim=1)
+
+    if Physical:
+        Outputs = torch.as_tensor(OutputScaler.denormalise(Outputs.numpy()))
+
+    Mean = Outputs.mean(dim=0)
+    Spread = Outputs.std(dim=0) if Ensemble.NumMembers > 1 else torch.zeros_like(Mean)
+
+    return Mean.numpy(), Spread.numpy()
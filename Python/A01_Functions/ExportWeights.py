@@ -0,0 +1,95 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Exports the weights of Lightning checkpoints (.ckpt) into compact .npz bundles for NumpyInference.py.
+# Only the state_dict and the hyperparameters are kept, the optimizer state is dropped.
+#
+# Run from the folder Python/:
+#   python -m A01_Functions.ExportWeights                 -> published models of all Conditions/Variants
+#   python -m A01_Functions.ExportWeights --All           -> every checkpoint in A03_Models/FF
+#   python -m A01_Functions.ExportWeights --Checkpoint A03_Models/FF/.../FF_Variant_1_BatchSize_7_epoch=800.ckpt
+
+import os
+import re
+import glob
+import numpy as np
+import torch
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import ModelRoot, WeightsRoot, DefaultEpochs, ConditionFolders, \
+    Func_getCheckpointPath, Func_getWeightsPath
+from A01_Functions.Normalisation import Func_getScalers
+
+
+def Func_exportCheckpoint(CheckpointPath, WeightsPath, Condition=None, Precision='float32'):
+    # Precision='float16' halves the size of the weights, NumpyFeedForward computes in float32 again
+    Checkpoint = torch.load(CheckpointPath, map_location='cpu')
+    hparams = dict(Checkpoint['hparams'])
+
+    Bundle = {Name: Tensor.detach().cpu().numpy().astype(Precision) for Name, Tensor in
+              Checkpoint['state_dict'].items()}
+    Bundle['Variant'] = np.array(hparams['Variant'])
+    Bundle['InputSize'] = np.array(hparams['InputSize'])
+    Bundle['Epoch'] = np.array(Checkpoint['epoch'])
+
+    Match = re.search(r'epoch=(\d+)\.ckpt$', CheckpointPath)
+    if Match:
+        Bundle['Epoch'] = np.array(int(Match.group(1)))
+
+    # Store the normalisation constants of the Condition alongside the weights
+    if Condition is None:
+        Condition = Func_conditionFromPath(CheckpointPath)
+    if Condition is not None:
+        [InputScaler, OutputScaler] = Func_getScalers(Condition, int(hparams['Variant']))
+        Bundle['InputMin'] = InputScaler.min_x
+        Bundle['InputMax'] = InputScaler.max_x
+        Bundle['OutputMin'] = OutputScaler.min_x
+        Bundle['OutputMax'] = OutputScaler.max_x
+
+    os.makedirs(os.path.dirname(WeightsPath), exist_ok=True)
+    np.savez_compressed(WeightsPath, **Bundle)
+
+    return WeightsPath
+
+
+def Func_conditionFromPath(CheckpointPath):
+    for Condition, Folder in ConditionFolders.items():
+        if Folder in CheckpointPath.split(os.sep):
+            return Condition
+    return None
+
+
+def Func_exportPublished(Precision='float32'):
+    for (Condition, Variant) in DefaultEpochs.keys():
+        WeightsPath = Func_exportCheckpoint(Func_getCheckpointPath(Condition, Variant),
+                                            Func_getWeightsPath(Condition, Variant), Condition, Precision)
+        print('Exported ' + Condition + ' - Variant ' + str(Variant) + ': ' + WeightsPath)
+
+
+def Func_exportAll(Precision='float32'):
+    for CheckpointPath in sorted(glob.glob(os.path.join(ModelRoot, '*', '*', '*.ckpt'))):
+        WeightsPath = os.path.join(WeightsRoot, os.path.relpath(CheckpointPath, ModelRoot))[:-len('.ckpt')] + '.npz'
+        Func_exportCheckpoint(CheckpointPath, WeightsPath, Precision=Precision)
+        print('Exported ' + WeightsPath)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--All', action='store_true')
+    parser.add_argument('--Checkpoint', type=str, default=None)
+    parser.add_argument('--Output', type=str, default=None)
+    parser.add_argument('--Condition', type=str, default=None)
+    parser.add_argument('--Precision', type=str, default='float32', choices=['float32', 'float16'])
+    args = parser.parse_args()
+
+    if args.Checkpoint is not None:
+        Output = args.Output if args.Output is not None else args.Checkpoint[:-len('.ckpt')] + '.npz'
+        print('Exported ' + Func_exportCheckpoint(args.Checkpoint, Output, args.Condition, args.Precision))
+    elif args.All:
+        Func_exportAll(args.Precision)
+    else:
+        Func_exportPublished(args.Precision)
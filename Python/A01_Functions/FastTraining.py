@@ -0,0 +1,156 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Training of the FeedForward networks without DataLoader workers and the Lightning trainer loop.
+# The whole dataset is kept as tensors on the device, the batches are drawn from a random permutation
+# in-process and the optimizer loop has the same semantics as FeedForward.training_step():
+# Adam, MSE loss, shuffle=True, drop_last=True. The checkpoints are written with the same cadence and
+# in the same format as ModelCheckpoint(period=100) + MyCallback.on_train_end, so that
+# FeedForward.load_from_checkpoint() and the model registry can read them. With ArchivePath the periodic
+# checkpoints are written as weights-only epochs of one checkpoint archive (A01_Functions/CheckpointArchive.py).
+
+import os
+import time
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from argparse import Namespace
+from A01_Functions.ReadData import Func_readDataIn, DataPath_Default
+from A01_Functions.MetricsLogger import MetricsLogger
+from A01_Functions.CheckpointArchive import CheckpointArchive
+from A01_Functions.Profiling import span
+import A02_Networks.FeedForward as FF_Class
+
+
+def Func_saveCheckpoint(PATH, Model, Optimizer, hparams, Epoch, GlobalStep, Extra=None):
+    # Same keys as a Lightning 0.7 checkpoint, 'epoch' is stored as current_epoch + 1 like the Lightning trainer.
+    # Extra: additional keys (e.g. 'row_fingerprints' of IncrementalTraining.py), ignored by Lightning
+    Checkpoint = {'epoch': Epoch + 1,
+                  'global_step': GlobalStep,
+                  'checkpoint_callback_best': None,
+                  'optimizer_states': [Optimizer.state_dict()],
+                  'lr_schedulers': [],
+                  'state_dict': {Name: Tensor.detach().cpu() for Name, Tensor in Model.state_dict().items()},
+                  'hparams': vars(hparams),
+                  'hparams_type': 'namespace'}
+    if Extra is not None:
+        Checkpoint.update(Extra)
+
+    torch.save(Checkpoint, PATH)
+
+
+def Func_runFastTraining(Epoch, numHiddenNeuron_1, numHiddenNeuron_2, Variant, BatchSize, learningRate,
+                         DataPath=DataPath_Default, CheckpointPeriod=100, PrintPeriod=100, Seed=None, Device='cpu',
+                         ModelFolder='A03_Models/FF/', DataFolder='A04_Results_Training/02_Data/',
+                         PlotFolder=None, PlotPeriod=100, ArchivePath=None, ArchivePrecision='float32',
+                         ArchiveCompression=False):
+
+    if Seed is not None:
+        torch.manual_seed(Seed)
+
+    InputSize = 3 if Variant == 1 else 4
+
+    hparams = Namespace(layer_1_dim=numHiddenNeuron_1,
+                        layer_2_dim=numHiddenNeuron_2,
+                        Variant=Variant,
+                        BatchSize=BatchSize,
+                        learningRate=learningRate,
+                        InputSize=InputSize,
+                        DataPath=DataPath)
+
+    Model = FF_Class.FeedForward(hparams).to(Device)
+    Model.train()
+    Optimizer = optim.Adam(Model.parameters(), lr=learningRate)
+    criterion = nn.MSELoss()
+
+    [TrainInputMatrix, TrainTargetMatrix] = Func_readDataIn(Variant, DataPath)
+    TrainInputMatrix = TrainInputMatrix.to(Device)
+    TrainTargetMatrix = TrainTargetMatrix.to(Device)
+
+    NumSamples = TrainInputMatrix.shape[0]
+    StepsPerEpoch = NumSamples // BatchSize
+
+    if StepsPerEpoch == 0:
+        raise ValueError('BatchSize ' + str(BatchSize) + ' is larger than the dataset (' + str(NumSamples) + ' rows)')
+
+    DataNameStr = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_Epoch_' + str(Epoch) + \
+                  '_Hidden_' + str(numHiddenNeuron_1) + '_' + str(numHiddenNeuron_2)
+    ModelPath = ModelFolder + 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_'
+
+    os.makedirs(ModelFolder, exist_ok=True)
+
+    # MSE, MAE and SD of every step, read back from the device once per epoch
+    StepMetrics = torch.zeros(StepsPerEpoch, 3, device=Device)
+    Logger = MetricsLogger(LogPath=DataFolder + DataNameStr + '.csv',
+                           PlotPath=PlotFolder + DataNameStr + '.png' if PlotFolder is not None else None,
+                           MaxEpochs=Epoch, PlotPeriod=PlotPeriod)
+    GlobalStep = 0
+
+    Archive = None
+    if ArchivePath is not None:
+        Archive = CheckpointArchive(ArchivePath, 'a', Precision=ArchivePrecision, Compression=ArchiveCompression)
+
+    Start = time.time()
+
+    for CurrentEpoch in range(Epoch):
+        Permutation = torch.randperm(NumSamples, device=Device)
+
+        for Step in range(StepsPerEpoch):
+            Index = Permutation[Step * BatchSize:(Step + 1) * BatchSize]
+            data = TrainInputMatrix[Index]
+            target = TrainTargetMatrix[Index]
+
+            with span('Training.step'):
+                Optimizer.zero_grad()
+                output = Model(data)
+                loss = criterion(output, target)
+                loss.backward()
+                Optimizer.step()
+            GlobalStep += 1
+
+            with torch.no_grad():
+                Difference = (output - target).abs()
+                StepMetrics[Step, 0] = loss
+                StepMetrics[Step, 1] = Difference.mean()
+                StepMetrics[Step, 2] = Difference.std()
+
+        with span('Training.metrics'):
+            Values = StepMetrics.mean(dim=0).cpu().numpy()
+            Logger.logEpoch(CurrentEpoch, *Values)
+
+        with span('Training.checkpoint'):
+            if CurrentEpoch % CheckpointPeriod == 0 and Archive is not None:
+                Archive.write(CurrentEpoch, Model.state_dict(), hparams=hparams, GlobalStep=GlobalStep)
+            elif CurrentEpoch % CheckpointPeriod == 0:
+                Func_saveCheckpoint(ModelPath + 'epoch=' + str(CurrentEpoch) + '.ckpt', Model, Optimizer, hparams,
+                                    CurrentEpoch, GlobalStep)
+
+        if PrintPeriod > 0 and (CurrentEpoch % PrintPeriod == 0 or CurrentEpoch == Epoch - 1):
+            print('Train Epoch [{}/{}]: Loss (MSE): {:.9f} Loss (MAE): {:.9f} SD {:.8f} - {:.1f} Epochs/s'.
+                  format(CurrentEpoch, Epoch, Values[0], Values[1], Values[2],
+                         (CurrentEpoch + 1) / (time.time() - Start)))
+
+    Duration = time.time() - Start
+
+    # The last epoch is always written as a full checkpoint with the optimizer state and the fingerprints of the
+    # training rows, the start of a later fine-tuning (IncrementalTraining.py)
+    from A01_Functions.IncrementalTraining import Func_rowFingerprints
+
+    Func_saveCheckpoint(ModelPath + 'epoch=' + str(Epoch - 1) + '.ckpt', Model, Optimizer, hparams,
+                        Epoch - 1, GlobalStep, Extra={'row_fingerprints': Func_rowFingerprints(DataPath)})
+
+    if Archive is not None:
+        Archive.write(Epoch - 1, Model.state_dict(), hparams=hparams, GlobalStep=GlobalStep)
+        Archive.close()
+
+    Logger.close()
+
+    print('Fast training: ' + str(Epoch) + ' epochs in {:.2f} seconds ({:.1f} Epochs/s)'.format(
+        Duration, Epoch / Duration))
+
+    return Model, Epoch / Duration
@@ -0,0 +1,206 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Inference-only version of a trained FeedForward with the affine operations folded together:
+#   hidden_layer_2 (320 -> 80) and output_Layer (80 -> 17) have no activation in between and are replaced by
+#   one 320 -> 17 layer: W = W_out @ W_2, b = W_out @ b_2 + b_out
+# With Physical=True the unity-based normalisation of the inputs is folded into input_Layer and the
+# denormalisation of the outputs into the fused output layer, so the model maps absolute light metrics directly
+# to absolute model parameters. The folding is computed in float64. The physical model runs in float64 by
+# default, because the luminance range of the scalers (99.73 - 100.17 cd/m^2) would cancel digits in float32.
+# The compiled model can be traced to TorchScript (torch.jit.trace) and saved as a frozen graph.
+#
+# Run from the folder Python/ to compile and verify the published models:
+#   python -m A01_Functions.FusedInference [--Physical] [--Output A03_Models/TorchScript/]
+
+import os
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import DefaultEpochs, ConditionFolders, VariantFolders, Func_loadModel, \
+    Func_getDefaultEpoch
+
+
+class FusedFeedForward(nn.Module):
+
+    def __init__(self, Weights, Biases, Variant=None, Physical=False):
+        # Weights/Biases: numpy arrays of the three remaining layers (out x in, out)
+        super().__init__()
+        self.Variant = Variant
+        self.Physical = Physical
+        self.InputSize = Weights[0].shape[1]
+
+        Layers = []
+        for (Weight, Bias) in zip(Weights, Biases):
+            Layer = nn.Linear(Weight.shape[1], Weight.shape[0])
+            Layer.weight.data = torch.from_numpy(np.ascontiguousarray(Weight))
+            Layer.bias.data = torch.from_numpy(np.ascontiguousarray(Bias))
+            Layers.append(Layer)
+
+        [self.input_Layer, self.hidden_layer_1, self.fused_output_Layer] = Layers
+
+        for Parameter in self.parameters():
+            Parameter.requires_grad_(False)
+        self.eval()
+
+    def forward(self, x):
+        x = self.input_Layer(x)
+        x = self.hidden_layer_1(F.relu(x))
+        x = self.fused_output_Layer(F.relu(x))
+
+        return x
+
+
+def Func_foldModel(model, Physical=False):
+    # Folded weights and biases (float64) of a FeedForward, with scalers if Physical
+    State = {Name: Tensor.detach().cpu().double().numpy() for Name, Tensor in model.state_dict().items()}
+
+    Weights = [State['input_Layer.weight'], State['hidden_layer_1.weight'],
+               State['output_Layer.weight'] @ State['hidden_layer_2.weight']]
+    Biases = [State['input_Layer.bias'], State['hidden_layer_1.bias'],
+              State['output_Layer.weight'] @ State['hidden_layer_2.bias'] + State['output_Layer.bias']]
+
+    if Physical:
+        if getattr(model, 'InputScaler', None) is None or getattr(model, 'OutputScaler', None) is None:
+            raise ValueError('Physical=True needs a model with InputScaler/OutputScaler (Func_attachScalers)')
+
+        # Normalisation (x - min)/(max - min) = x * Scale + Shift in front of input_Layer
+        InputRange = model.InputScaler.max_x - model.InputScaler.min_x
+        Scale = 1 / InputRange
+        Shift = -model.InputScaler.min_x / InputRange
+        Biases[0] = Biases[0] + Weights[0] @ Shift
+        Weights[0] = Weights[0] * Scale[np.newaxis, :]
+
+        # Denormalisation Z*max - Z*min + min = Z * (max - min) + min behind the fused output layer
+        OutputRange = model.OutputScaler.max_x - model.OutputScaler.min_x
+        Weights[2] = Weights[2] * OutputRange[:, np.newaxis]
+        Biases[2] = Biases[2] * OutputRange + model.OutputScaler.min_x
+
+    return Weights, Biases
+
+
+def Func_compileModel(model, Physical=False, DType=None):
+    # Frozen FusedFeedForward of a trained FeedForward, DType: torch.float32 or torch.float64
+    if DType is None:
+        DType = torch.float64 if Physical else torch.float32
+
+    [Weights, Biases] = Func_foldModel(model, Physical)
+    NumpyType = np.float64 if DType == torch.float64 else np.float32
+
+    return FusedFeedForward([Weight.astype(NumpyType) for Weight in Weights],
+                            [Bias.astype(NumpyType) for Bias in Biases],
+                            Variant=getattr(model, 'Variant', None), Physical=Physical)
+
+
+def Func_traceModel(Compiled):
+    # TorchScript graph of a compiled model, frozen if the installed torch supports torch.jit.freeze
+    Example = torch.rand(8, Compiled.InputSize, dtype=Compiled.input_Layer.weight.dtype)
+
+    with torch.no_grad():
+        Traced = torch.jit.trace(Compiled, Example)
+
+    if hasattr(torch.jit, 'freeze'):
+        Traced = torch.jit.freeze(Traced.eval())
+
+    return Traced
+
+
+def Func_predictCompiled(Compiled, InputMatrix, ChunkSize=4096, DType=None):
+    # Forward pass in chunks, returns a numpy matrix in the dtype of the model (DType for traced models)
+    if DType is None:
+        DType = Compiled.input_Layer.weight.dtype if isinstance(Compiled, FusedFeedForward) else torch.float32
+    InputMatrix = torch.as_tensor(np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64))).to(DType)
+
+    Outputs = []
+    with torch.no_grad():
+        for Start in range(0, InputMatrix.shape[0], ChunkSize):
+            Outputs.append(Compiled(InputMatrix[Start:Start + ChunkSize]))
+
+    return torch.cat(Outputs).numpy()
+
+
+def Func_verifyCompiled(model, Compiled, Physical=None, DType=None, NumSamples=10000, Seed=0, Tolerance=None):
+    # Compares the compiled (or traced) model with the original FeedForward + scalers on random inputs covering
+    # the unity range of every input. Returns the maximum absolute and relative deviation per parameter.
+    # Physical/DType are taken from a FusedFeedForward, for a traced model they have to be given.
+    if isinstance(Compiled, FusedFeedForward):
+        Physical = Compiled.Physical if Physical is None else Physical
+        DType = Compiled.input_Layer.weight.dtype if DType is None else DType
+    Physical = bool(Physical)
+    if DType is None:
+        DType = torch.float64 if Physical else torch.float32
+
+    Generator = np.random.RandomState(Seed)
+    Normalised = Generator.rand(NumSamples, model.input_Layer.in_features)
+
+    with torch.no_grad():
+        Reference = model(torch.from_numpy(Normalised).float()).double().numpy()
+
+    if Physical:
+        Reference = model.OutputScaler.denormalise(Reference)
+        Inputs = model.InputScaler.denormalise(Normalised)
+    else:
+        Inputs = Normalised
+
+    with torch.no_grad():
+        Result = Compiled(torch.from_numpy(Inputs).to(DType)).double().numpy()
+
+    AbsoluteError = np.abs(Result - Reference).max(axis=0)
+    RelativeError = AbsoluteError / np.maximum(np.abs(Reference).max(axis=0), np.finfo(np.float64).tiny)
+
+    # The reference runs in float32, so also a float64 model deviates by the float32 rounding
+    if Tolerance is None:
+        Tolerance = 1e-5
+
+    return {'MaxAbsoluteError': AbsoluteError, 'MaxRelativeError': RelativeError,
+            'Passed': bool(RelativeError.max() <= Tolerance)}
+
+
+def Func_loadCompiledModel(Condition, Variant, Epoch=None, Physical=False, Traced=False):
+    # Compiled model of the registry, cached next to the original model
+    from A01_Functions.ModelRegistry import Cache, Func_getCheckpointPath
+
+    # The original model is loaded (and cached) first
+    model = Func_loadModel(Condition, Variant, Epoch)
+
+    def Func_loader():
+        Compiled = Func_compileModel(model, Physical)
+        return Func_traceModel(Compiled) if Traced else Compiled
+
+    return Cache.get(('Compiled', Func_getCheckpointPath(Condition, Variant, Epoch), Physical, Traced), Func_loader)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Physical', action='store_true')
+    parser.add_argument('--Output', type=str, default=None)
+    parser.add_argument('--NumSamples', type=int, default=10000)
+    args = parser.parse_args()
+
+    for (Condition, Variant) in DefaultEpochs.keys():
+        model = Func_loadModel(Condition, Variant)
+        Compiled = Func_compileModel(model, Physical=args.Physical)
+        Traced = Func_traceModel(Compiled)
+
+        for (Name, Candidate) in [('compiled', Compiled), ('traced', Traced)]:
+            Report = Func_verifyCompiled(model, Candidate, Physical=Compiled.Physical,
+                                         DType=Compiled.input_Layer.weight.dtype, NumSamples=args.NumSamples)
+            print('{} - Variant {} ({}): max abs error {:.3g}, max rel error {:.3g} - {}'.format(
+                Condition, Variant, Name, Report['MaxAbsoluteError'].max(), Report['MaxRelativeError'].max(),
+                'OK' if Report['Passed'] else 'FAILED'))
+
+        if args.Output is not None:
+            PATH = os.path.join(args.Output, ConditionFolders[Condition], VariantFolders[Variant],
+                                'FF_Variant_' + str(Variant) + '_BatchSize_7_epoch=' +
+                                str(Func_getDefaultEpoch(Condition, Variant)) +
+                                ('_Physical' if args.Physical else '') + '.pt')
+            os.makedirs(os.path.dirname(PATH), exist_ok=True)
+            torch.jit.save(Traced, PATH)
+            print('Saved ' + PATH)
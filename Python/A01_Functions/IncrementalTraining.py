@@ -0,0 +1,214 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Fine-tuning of a trained network when rows are appended to the training data, instead of 4000 epochs from
+# random weights.
+# Every row of the data is identified by a fingerprint: sha1 of its 25 values (ScalerLabels, float32), so the
+# fingerprint does not depend on the file format or on the row order. The fingerprints of the rows a network was
+# trained on are stored in its checkpoint ('row_fingerprints'); for the published checkpoints they are read from
+# A00_Data/TrainData_Fingerprints.json. Rows of the current data without a known fingerprint are new.
+# The training starts from the weights and the Adam moments of the checkpoint and runs for
+#   Epoch = ceil(FullSchedule * new rows / all rows)   (at least MinEpochs, at most FullSchedule)
+# epochs, so the cost follows the amount of new data. ReplayWeight scales the loss of the old rows (1: all rows
+# count the same, 0: only the new rows are trained). The result is written next to the start checkpoint as a new
+# version FF_Variant_<V>_BatchSize_<B>_v<k>_epoch=<N>.ckpt (N: epochs of the start checkpoint plus Epoch), which
+# again contains the fingerprints of all its rows, so the next fine-tuning only sees the rows added after it.
+#
+# Run from the folder Python/:
+#   python Main.py --Engine Incremental --Variant 1 --DataPath A00_Data/TrainData_Individual_Subject.csv
+#          [--Checkpoint A03_Models/FF/.../FF_Variant_1_BatchSize_7_epoch=3999.ckpt] [--ReplayWeight 0.5]
+
+import os
+import re
+import glob
+import json
+import math
+import time
+import hashlib
+from collections import Counter
+import numpy as np
+import torch
+import torch.optim as optim
+from argparse import Namespace
+from A01_Functions.Dataset import Func_readColumns
+from A01_Functions.ReadData import Func_readDataIn
+from A01_Functions.Normalisation import ScalerLabels
+from A01_Functions.MetricsLogger import MetricsLogger
+from A01_Functions.FastTraining import Func_saveCheckpoint
+from A01_Functions.ModelRegistry import Func_getModelFolder, Func_getWeightsPath, Func_updateManifest
+from A01_Functions.Profiling import span
+import A02_Networks.FeedForward as FF_Class
+
+FingerprintPath_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A00_Data',
+                                       'TrainData_Fingerprints.json')
+
+
+def Func_rowFingerprints(DataPath):
+    # sha1 (hex) of every row of a training data source
+    Columns = Func_readColumns(DataPath, ScalerLabels)
+    Rows = np.ascontiguousarray(np.stack([Columns[Label] for Label in ScalerLabels], axis=1), dtype=np.float32)
+
+    return [hashlib.sha1(Row.tobytes()).hexdigest() for Row in Rows]
+
+
+def Func_newRows(Fingerprints, KnownFingerprints):
+    # Boolean mask of the rows that are not in KnownFingerprints, a repeated row is new once it occurs more often
+    # than in the known data
+    Remaining = Counter(KnownFingerprints)
+    New = np.ones(len(Fingerprints), dtype=bool)
+    for Index, Fingerprint in enumerate(Fingerprints):
+        if Remaining[Fingerprint] > 0:
+            Remaining[Fingerprint] -= 1
+            New[Index] = False
+
+    return New
+
+
+def Func_knownFingerprints(Checkpoint, Condition=None, FingerprintPath=FingerprintPath_Default):
+    # Fingerprints of the rows a checkpoint was trained on: stored in the checkpoint or, for the published
+    # checkpoints, the training data of the Condition
+    if 'row_fingerprints' in Checkpoint:
+        return list(Checkpoint['row_fingerprints'])
+
+    if Condition is not None and os.path.isfile(FingerprintPath):
+        with open(FingerprintPath) as File:
+            Published = json.load(File)
+        if Condition in Published:
+            return Published[Condition]
+
+    raise ValueError('The checkpoint has no row fingerprints, give the Condition of a published checkpoint')
+
+
+def Func_versionPath(CheckpointPath, Variant, BatchSize, Epoch):
+    # Next free version in the folder of the start checkpoint
+    Folder = os.path.dirname(CheckpointPath)
+    Prefix = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_v'
+    Versions = [int(Match.group(1)) for Match in
+                [re.match(re.escape(Prefix) + r'(\d+)_epoch=\d+\.ckpt$', os.path.basename(PATH))
+                 for PATH in glob.glob(os.path.join(Folder, Prefix + '*.ckpt'))] if Match]
+    Version = max(Versions, default=0) + 1
+
+    return os.path.join(Folder, Prefix + str(Version) + '_epoch=' + str(Epoch) + '.ckpt'), Version
+
+
+def Func_runIncrementalTraining(CheckpointPath, DataPath, Condition=None, Epoch=None, ReplayWeight=1.0,
+                                FullSchedule=4000, MinEpochs=100, Seed=None, Device='cpu', PrintPeriod=100,
+                                DataFolder='A04_Results_Training/02_Data/', UpdateManifest=False):
+    # Fine-tunes the network of CheckpointPath (.ckpt with optimizer state) on DataPath.
+    # Epoch=None: budget from the share of new rows (see above). Returns the path of the new checkpoint,
+    # CheckpointPath if the data has no new rows
+    if Seed is not None:
+        torch.manual_seed(Seed)
+
+    Checkpoint = torch.load(CheckpointPath, map_location='cpu')
+    hparams = Namespace(**Checkpoint['hparams'])
+    hparams.DataPath = DataPath
+    Variant = hparams.Variant
+
+    # The manifest refers to files in the registry folder of the Condition/Variant
+    if UpdateManifest and (Condition is None or os.path.abspath(os.path.dirname(CheckpointPath)) !=
+                           os.path.abspath(Func_getModelFolder(Condition, Variant))):
+        raise ValueError('UpdateManifest needs the Condition and a checkpoint in ' +
+                         str(Condition and Func_getModelFolder(Condition, Variant)))
+
+    with span('Incremental.fingerprint'):
+        Fingerprints = Func_rowFingerprints(DataPath)
+        New = Func_newRows(Fingerprints, Func_knownFingerprints(Checkpoint, Condition))
+    NumNew = int(New.sum())
+
+    print('Incremental training: ' + str(NumNew) + ' new of ' + str(len(New)) + ' rows')
+    if NumNew == 0:
+        return CheckpointPath
+
+    if Epoch is None:
+        Epoch = min(max(int(math.ceil(FullSchedule * NumNew / len(New))), MinEpochs), FullSchedule)
+
+    Model = FF_Class.FeedForward(hparams)
+    Model.load_state_dict(Checkpoint['state_dict'])
+    Model = Model.to(Device)
+    Model.train()
+    Optimizer = optim.Adam(Model.parameters(), lr=hparams.learningRate)
+    Optimizer.load_state_dict(Checkpoint['optimizer_states'][0])
+
+    [TrainInputMatrix, TrainTargetMatrix] = Func_readDataIn(Variant, DataPath)
+    if TrainInputMatrix.shape[0] != len(New):
+        raise ValueError(DataPath + ': ' + str(len(New)) + ' fingerprints for ' + str(TrainInputMatrix.shape[0]) +
+                         ' rows')
+
+    # Old rows with weight 0 are not sampled at all
+    Rows = torch.arange(len(New)) if ReplayWeight > 0 else torch.from_numpy(np.where(New)[0])
+    RowWeights = torch.from_numpy(np.where(New, 1.0, ReplayWeight).astype(np.float32))
+    TrainInputMatrix = TrainInputMatrix.to(Device)
+    TrainTargetMatrix = TrainTargetMatrix.to(Device)
+    RowWeights = RowWeights.to(Device)
+    # Fixed normaliser: a batch of old rows keeps its weight (a per batch weight total would cancel ReplayWeight)
+    MeanWeight = RowWeights[Rows.to(Device)].mean()
+
+    NumSamples = len(Rows)
+    BatchSize = min(hparams.BatchSize, NumSamples)
+    StepsPerEpoch = NumSamples // BatchSize
+
+    StartEpoch = Checkpoint['epoch'] - 1
+    GlobalStep = Checkpoint['global_step']
+    [OutputPath, Version] = Func_versionPath(CheckpointPath, Variant, hparams.BatchSize, StartEpoch + Epoch)
+
+    StepMetrics = torch.zeros(StepsPerEpoch, 3, device=Device)
+    Logger = MetricsLogger(LogPath=DataFolder + os.path.basename(OutputPath)[:-len('.ckpt')] + '.csv',
+                           MaxEpochs=Epoch)
+    Start = time.time()
+
+    for CurrentEpoch in range(Epoch):
+        Permutation = Rows[torch.randperm(NumSamples)].to(Device)
+
+        for Step in range(StepsPerEpoch):
+            Index = Permutation[Step * BatchSize:(Step + 1) * BatchSize]
+            data = TrainInputMatrix[Index]
+            target = TrainTargetMatrix[Index]
+            Weights = RowWeights[Index]
+
+            with span('Incremental.step'):
+                Optimizer.zero_grad()
+                output = Model(data)
+                # Row MSEs weighted relative to the mean weight of the data, the plain MSE for ReplayWeight = 1
+                loss = (((output - target) ** 2).mean(dim=1) * Weights).sum() / (len(Index) * MeanWeight)
+                loss.backward()
+                Optimizer.step()
+            GlobalStep += 1
+
+            with torch.no_grad():
+                Difference = (output - target).abs()
+                StepMetrics[Step, 0] = loss
+                StepMetrics[Step, 1] = Difference.mean()
+                StepMetrics[Step, 2] = Difference.std()
+
+        Values = StepMetrics.mean(dim=0).cpu().numpy()
+        Logger.logEpoch(StartEpoch + 1 + CurrentEpoch, *Values)
+
+        if PrintPeriod > 0 and (CurrentEpoch % PrintPeriod == 0 or CurrentEpoch == Epoch - 1):
+            print('Fine-tuning Epoch [{}/{}]: Loss (MSE): {:.9f} Loss (MAE): {:.9f} SD {:.8f}'.
+                  format(CurrentEpoch, Epoch, Values[0], Values[1], Values[2]))
+
+    Logger.close()
+    Duration = time.time() - Start
+
+    Func_saveCheckpoint(OutputPath, Model, Optimizer, hparams, StartEpoch + Epoch, GlobalStep,
+                        Extra={'row_fingerprints': Fingerprints,
+                               'incremental': {'Base': os.path.basename(CheckpointPath), 'Version': Version,
+                                               'NewRows': NumNew, 'Epochs': Epoch, 'ReplayWeight': ReplayWeight}})
+
+    if UpdateManifest:
+        from A01_Functions.ExportWeights import Func_exportCheckpoint
+
+        Func_updateManifest(Condition, Variant, {'Epoch': StartEpoch + Epoch, 'File': os.path.basename(OutputPath),
+                                                 'Split': 'incremental', 'Version': Version, 'NewRows': NumNew})
+        Func_exportCheckpoint(OutputPath, Func_getWeightsPath(Condition, Variant), Condition)
+
+    print('Incremental training: ' + str(Epoch) + ' epochs in {:.2f} seconds, version {} written to {}'.format(
+        Duration, Version, OutputPath))
+
+    return OutputPath
@@ -0,0 +1,200 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# In-process micro-batching of concurrent prediction requests.
+# Requests from many threads (predict) or asyncio tasks (predict_async) are queued per (Condition, Variant),
+# coalesced into one batch when MaxBatchSize rows are waiting or the oldest request waited MaxLatency seconds,
+# computed with a single forward pass and the results are handed back to the waiting callers.
+#
+#   Scheduler = InferenceScheduler(MaxBatchSize=256, MaxLatency=0.002)
+#   Parameters = Scheduler.predict('Single', 1, [L, Fx, Fy])          # 17 values
+#   Parameters = await Scheduler.predict_async('Multi', 3, Matrix)    # N x 17
+#   Scheduler.close()
+
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from A01_Functions.ModelRegistry import Func_loadModel
+
+
+class SchedulerStatistics:
+
+    def __init__(self):
+        self.Lock = threading.Lock()
+        self.Requests = 0
+        self.Batches = 0
+        self.Rows = 0
+        self.MaxBatchRows = 0
+        self.QueueWait = 0.0
+        self.MaxQueueWait = 0.0
+
+    def add(self, NumRequests, NumRows, QueueWaits):
+        with self.Lock:
+            self.Requests += NumRequests
+            self.Batches += 1
+            self.Rows += NumRows
+            self.MaxBatchRows = max(self.MaxBatchRows, NumRows)
+            self.QueueWait += sum(QueueWaits)
+            self.MaxQueueWait = max([self.MaxQueueWait] + QueueWaits)
+
+    def summary(self):
+        with self.Lock:
+            return {'Requests': self.Requests,
+                    'Batches': self.Batches,
+                    'Rows': self.Rows,
+                    'MeanBatchRows': self.Rows / self.Batches if self.Batches > 0 else 0.0,
+                    'MaxBatchRows': self.MaxBatchRows,
+                    'MeanQueueWait': self.QueueWait / self.Requests if self.Requests > 0 else 0.0,
+                    'MaxQueueWait': self.MaxQueueWait}
+
+
+def Func_deliver(Pending, Result=None, Error=None):
+    # Result or exception of a request, a failed delivery must not stop the worker thread
+    try:
+        if Error is not None:
+            Pending.set_exception(Error)
+        else:
+            Pending.set_result(Result)
+    except Exception:
+        pass
+
+
+class InferenceScheduler:
+
+    def __init__(self, MaxBatchSize=256, MaxLatency=0.002, Threads=None, InteropThreads=None,
+                 Loader=Func_loadModel):
+        import torch
+
+        # Control of the torch intra-op (and inter-op) thread pools used by the forward pass
+        if Threads is not None:
+            torch.set_num_threads(Threads)
+        if InteropThreads is not None:
+            torch.set_num_interop_threads(InteropThreads)
+
+        self.torch = torch
+        self.MaxBatchSize = MaxBatchSize
+        self.MaxLatency = MaxLatency
+        self.Loader = Loader
+        self.Statistics = SchedulerStatistics()
+
+        self.Queues = {}
+        self.Condition = threading.Condition()
+        self.Running = True
+        self.Worker = threading.Thread(target=self.run, name='InferenceScheduler', daemon=True)
+        self.Worker.start()
+
+    def submit(self, Condition, Variant, InputMatrix):
+        # Queues a request and returns a concurrent.futures.Future with the N x 17 result
+        InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float32))
+        InputSize = 3 if Variant == 1 else 4
+
+        if InputMatrix.shape[1] != InputSize:
+            raise ValueError('Variant ' + str(Variant) + ' expects ' + str(InputSize) +
+                             ' input columns, got ' + str(InputMatrix.shape[1]))
+
+        Request = (InputMatrix, Future(), time.perf_counter())
+
+        with self.Condition:
+            if not self.Running:
+                raise RuntimeError('InferenceScheduler is closed')
+            self.Queues.setdefault((Condition, Variant), deque()).append(Request)
+            self.Condition.notify()
+
+        return Request[1]
+
+    def predict(self, Condition, Variant, InputMatrix, Timeout=None):
+        Result = self.submit(Condition, Variant, InputMatrix).result(Timeout)
+        return Result[0] if np.ndim(InputMatrix) == 1 else Result
+
+    async def predict_async(self, Condition, Variant, InputMatrix):
+        Result = await asyncio.wrap_future(self.submit(Condition, Variant, InputMatrix))
+        return Result[0] if np.ndim(InputMatrix) == 1 else Result
+
+    def nextBatch(self):
+        # Waits until one queue is full or its oldest request reached MaxLatency, returns None on close
+        with self.Condition:
+            while True:
+                Now = time.perf_counter()
+                Timeout = None
+
+                for Key, Queue in self.Queues.items():
+                    if len(Queue) == 0:
+                        continue
+
+                    Rows = sum(Request[0].shape[0] for Request in Queue)
+                    Deadline = Queue[0][2] + self.MaxLatency
+
+                    if Rows >= self.MaxBatchSize or Now >= Deadline or not self.Running:
+                        return Key, self.popBatch(Queue)
+
+                    Timeout = Deadline - Now if Timeout is None else min(Timeout, Deadline - Now)
+
+                if not self.Running:
+                    return None
+
+                self.Condition.wait(Timeout)
+
+    def popBatch(self, Queue):
+        Batch = [Queue.popleft()]
+        Rows = Batch[0][0].shape[0]
+
+        while len(Queue) > 0 and Rows + Queue[0][0].shape[0] <= self.MaxBatchSize:
+            Rows += Queue[0][0].shape[0]
+            Batch.append(Queue.popleft())
+
+        return Batch
+
+    def run(self):
+        while True:
+            Next = self.nextBatch()
+            if Next is None:
+                return
+
+            [(Condition, Variant), Batch] = Next
+            # Requests cancelled by the caller (e.g. asyncio.wait_for timeout) are dropped, the others can no
+            # longer be cancelled
+            Batch = [Request for Request in Batch if Request[1].set_running_or_notify_cancel()]
+            if len(Batch) == 0:
+                continue
+            Start = time.perf_counter()
+            QueueWaits = [Start - Request[2] for Request in Batch]
+
+            try:
+                model = self.Loader(Condition, Variant)
+                InputMatrix = np.concatenate([Request[0] for Request in Batch], axis=0)
+
+                with self.torch.no_grad():
+                    OutputMatrix = model(self.torch.from_numpy(InputMatrix)).numpy()
+
+            except Exception as Error:
+                for Request in Batch:
+                    Func_deliver(Request[1], Error=Error)
+                continue
+
+            Offset = 0
+            for Request in Batch:
+                Func_deliver(Request[1], Result=OutputMatrix[Offset:Offset + Request[0].shape[0]])
+                Offset += Request[0].shape[0]
+
+            self.Statistics.add(len(Batch), InputMatrix.shape[0], QueueWaits)
+
+    def close(self):
+        # Computes the remaining requests and stops the worker thread
+        with self.Condition:
+            self.Running = False
+            self.Condition.notify()
+        self.Worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,117 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Training metrics without blocking the training loop.
+# The per-step MSE, MAE and SD are stored in preallocated arrays and averaged per epoch. The epoch values are
+# handed to a background thread which appends them to a .csv or .jsonl log and renders the loss plot every
+# PlotPeriod epochs (and once at the end), instead of replotting the whole history in every epoch.
+
+import os
+import json
+import queue
+import threading
+import numpy as np
+
+MetricNames = ['MSE', 'MAE', 'SD']
+
+
+class MetricsLogger:
+
+    def __init__(self, LogPath, PlotPath=None, MaxEpochs=1000, PlotPeriod=100, StepCapacity=16):
+        self.LogPath = LogPath
+        self.PlotPath = PlotPath
+        self.PlotPeriod = PlotPeriod
+
+        # Per-step values of the current epoch and per-epoch history
+        self.StepValues = np.zeros((StepCapacity, len(MetricNames)))
+        self.NumSteps = 0
+        self.Epochs = np.zeros(MaxEpochs, dtype=np.int64)
+        self.History = np.zeros((MaxEpochs, len(MetricNames)))
+        self.NumEpochs = 0
+
+        for PATH in [LogPath, PlotPath]:
+            if PATH is not None and os.path.dirname(PATH) != '':
+                os.makedirs(os.path.dirname(PATH), exist_ok=True)
+
+        self.JsonLines = LogPath.endswith('.jsonl')
+        self.File = open(LogPath, 'w')
+        if not self.JsonLines:
+            self.File.write('Epoch,' + ','.join(MetricNames) + '\n')
+
+        self.Queue = queue.Queue()
+        self.Worker = threading.Thread(target=self.run, name='MetricsLogger', daemon=True)
+        self.Worker.start()
+
+    def logStep(self, MSE, MAE, SD):
+        if self.NumSteps == self.StepValues.shape[0]:
+            self.StepValues = np.concatenate([self.StepValues, np.zeros_like(self.StepValues)])
+
+        self.StepValues[self.NumSteps] = [float(MSE), float(MAE), float(SD)]
+        self.NumSteps += 1
+
+    def endEpoch(self, Epoch):
+        # Averages the steps of the epoch and returns the epoch values (None for an epoch without steps)
+        if self.NumSteps == 0:
+            return None
+
+        Values = self.StepValues[:self.NumSteps].mean(axis=0)
+        self.NumSteps = 0
+        self.logEpoch(Epoch, *Values)
+
+        return Values
+
+    def logEpoch(self, Epoch, MSE, MAE, SD):
+        if self.NumEpochs == self.Epochs.shape[0]:
+            self.Epochs = np.concatenate([self.Epochs, np.zeros_like(self.Epochs)])
+            self.History = np.concatenate([self.History, np.zeros_like(self.History)])
+
+        self.Epochs[self.NumEpochs] = Epoch
+        self.History[self.NumEpochs] = [MSE, MAE, SD]
+        self.NumEpochs += 1
+
+        self.Queue.put(('log', (int(Epoch), float(MSE), float(MAE), float(SD))))
+
+        if self.PlotPath is not None and self.PlotPeriod > 0 and self.NumEpochs % self.PlotPeriod == 0:
+            self.Queue.put(('plot', (self.Epochs[:self.NumEpochs].copy(), self.History[:self.NumEpochs].copy())))
+
+    def run(self):
+        while True:
+            [Task, Content] = self.Queue.get()
+
+            if Task == 'log':
+                if self.JsonLines:
+                    self.File.write(json.dumps(dict(zip(['Epoch'] + MetricNames, Content))) + '\n')
+                else:
+                    self.File.write(','.join(repr(Value) for Value in Content) + '\n')
+            elif Task == 'plot':
+                self.File.flush()
+                Func_plotHistory(self.PlotPath, *Content)
+            elif Task == 'close':
+                self.File.close()
+                return
+
+    def close(self):
+        if self.PlotPath is not None and self.NumEpochs > 0:
+            self.Queue.put(('plot', (self.Epochs[:self.NumEpochs].copy(), self.History[:self.NumEpochs].copy())))
+        self.Queue.put(('close', None))
+        self.Worker.join()
+
+
+def Func_plotHistory(PlotPath, Epochs, History):
+    # Uses the object-oriented matplotlib API, which does not touch the pyplot state of the main thread
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.plot(Epochs, History[:, 1], 'b', label='Mean absolute error')
+    ax.plot(Epochs, History[:, 0], 'k', label='Mean squared error')
+    ax.set_yscale('log')
+    ax.legend(loc='upper center')
+    fig.savefig(PlotPath)
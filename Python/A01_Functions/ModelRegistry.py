@@ -0,0 +1,262 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Registry of the trained networks in A03_Models/FF.
+# Maps (Condition, Variant, optional Epoch) to a checkpoint, loads the model the first time it is
+# used and keeps the loaded models in a size-bounded LRU cache shared by all inference paths.
+
+import os
+import re
+import glob
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from A01_Functions.Profiling import span
+
+ModelRoot = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A03_Models', 'FF')
+
+# Checkpoint archives (A01_Functions/CheckpointArchive.py), one .ckpa file per checkpoint folder
+ArchiveRoot = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A03_Models', 'Archive')
+
+# Exported .npz weight bundles for the torch-free inference (A01_Functions/NumpyInference.py)
+WeightsRoot = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A03_Models', 'NPZ')
+
+ConditionFolders = {'Single': 'Intrapersonal_SingleSubject',
+                    'Multi': 'Interpersonal_ManySubject'}
+
+VariantFolders = {1: 'Variant_1_Lxy',
+                  2: 'Variant_2_LMSMEL',
+                  3: 'Variant_3_LxyMel'}
+
+# Selected checkpoint of every Condition/Variant, written by the validation training (ValidationTraining.py):
+# {"Single": {"1": {"Epoch": 3999, "File": "FF_Variant_1_BatchSize_7_epoch=3999.ckpt", ...}, ...}, ...}
+ManifestPath = os.path.join(ModelRoot, 'BestEpochs.json')
+Manifest = {'MTime': None, 'Entries': {}}
+ManifestLock = threading.Lock()
+
+# Epochs of the published models, used for Condition/Variant pairs without an entry in the manifest
+DefaultEpochs = {('Single', 1): 3999,
+                 ('Single', 2): 2900,
+                 ('Single', 3): 3999,
+                 ('Multi', 1): 800,
+                 ('Multi', 2): 3800,
+                 ('Multi', 3): 3800}
+
+
+def Func_getModelFolder(Condition, Variant):
+    if Condition not in ConditionFolders:
+        raise ValueError('Unknown Condition ' + str(Condition) + ', use one of ' + str(list(ConditionFolders)))
+    if Variant not in VariantFolders:
+        raise ValueError('Unknown Variant ' + str(Variant) + ', use one of ' + str(list(VariantFolders)))
+
+    return os.path.join(ModelRoot, ConditionFolders[Condition], VariantFolders[Variant])
+
+
+def Func_readManifest():
+    # Entries of the manifest as {(Condition, Variant): Entry}, read again when the file changed
+    MTime = os.path.getmtime(ManifestPath) if os.path.isfile(ManifestPath) else None
+
+    with ManifestLock:
+        if MTime != Manifest['MTime']:
+            Entries = {}
+            if MTime is not None:
+                with open(ManifestPath) as File:
+                    for Condition, Variants in json.load(File).items():
+                        for Variant, Entry in Variants.items():
+                            Entries[(Condition, int(Variant))] = Entry
+            Manifest['MTime'] = MTime
+            Manifest['Entries'] = Entries
+
+        return dict(Manifest['Entries'])
+
+
+def Func_updateManifest(Condition, Variant, Entry):
+    # Sets the selected checkpoint of a Condition/Variant, Entry needs 'Epoch' and 'File' (name in the model folder)
+    Content = {}
+    if os.path.isfile(ManifestPath):
+        with open(ManifestPath) as File:
+            Content = json.load(File)
+    Content.setdefault(Condition, {})[str(Variant)] = Entry
+
+    TemporaryPath = ManifestPath + '.' + str(os.getpid()) + '.tmp'
+    with open(TemporaryPath, 'w') as File:
+        json.dump(Content, File, indent=2, sort_keys=True)
+    os.replace(TemporaryPath, ManifestPath)
+
+
+def Func_getDefaultEpoch(Condition, Variant):
+    Entry = Func_readManifest().get((Condition, Variant))
+    return Entry['Epoch'] if Entry is not None else DefaultEpochs[(Condition, Variant)]
+
+
+def Func_checkpointName(Variant, Epoch):
+    # File name of the checkpoints of the original training runs (the epochs of the checkpoint archive)
+    return 'FF_Variant_' + str(Variant) + '_BatchSize_7_epoch=' + str(Epoch) + '.ckpt'
+
+
+def Func_getCheckpointPath(Condition, Variant, Epoch=None):
+    # Epoch=None: checkpoint of the manifest, otherwise of DefaultEpochs
+    Folder = Func_getModelFolder(Condition, Variant)
+    if Epoch is None:
+        Entry = Func_readManifest().get((Condition, Variant))
+        if Entry is not None:
+            return os.path.join(Folder, Entry['File'])
+        Epoch = DefaultEpochs[(Condition, Variant)]
+
+    return os.path.join(Folder, Func_checkpointName(Variant, Epoch))
+
+
+def Func_getWeightsPath(Condition, Variant, Epoch=None):
+    # Same folder structure and file name as the checkpoint, below A03_Models/NPZ
+    PATH = Func_getCheckpointPath(Condition, Variant, Epoch)
+    return os.path.join(WeightsRoot, os.path.relpath(PATH, ModelRoot))[:-len('.ckpt')] + '.npz'
+
+
+def Func_getArchivePath(Condition, Variant):
+    Folder = os.path.relpath(Func_getModelFolder(Condition, Variant), ModelRoot)
+    return os.path.join(ArchiveRoot, Folder, 'FF_Variant_' + str(Variant) + '_BatchSize_7.ckpa')
+
+
+def Func_listEpochs(Condition, Variant):
+    # Epochs of the .ckpt files and of the checkpoint archive
+    Epochs = set()
+    for Path in glob.glob(os.path.join(Func_getModelFolder(Condition, Variant), '*.ckpt')):
+        # Only the names of Func_getCheckpointPath(), not the validated or fine-tuned versions
+        Match = re.search(r'_BatchSize_7_epoch=(\d+)\.ckpt$', Path)
+        if Match:
+            Epochs.add(int(Match.group(1)))
+
+    if os.path.isfile(Func_getArchivePath(Condition, Variant)):
+        from A01_Functions.CheckpointArchive import CheckpointArchive
+
+        with CheckpointArchive(Func_getArchivePath(Condition, Variant)) as Archive:
+            Epochs.update(Archive.epochs())
+
+    return sorted(Epochs)
+
+
+class ModelCache:
+
+    def __init__(self, MaxSize=6):
+        self.MaxSize = MaxSize
+        self.Models = OrderedDict()
+        self.Lock = threading.Lock()
+        self.Loading = {}
+        self.Hits = 0
+        self.Loads = 0
+
+    def get(self, Key, Loader):
+        # Loader() runs outside of the lock, so a cold load does not block the hits of other threads.
+        # Threads asking for a key which is being loaded wait for the same load (Future per key)
+        with self.Lock:
+            if Key in self.Models:
+                self.Models.move_to_end(Key)
+                self.Hits += 1
+                return self.Models[Key]
+
+            Pending = self.Loading.get(Key)
+            Owner = Pending is None
+            if Owner:
+                Pending = Future()
+                self.Loading[Key] = Pending
+
+        if not Owner:
+            return Pending.result()
+
+        try:
+            Model = Loader()
+        except BaseException as Error:
+            with self.Lock:
+                del self.Loading[Key]
+            Pending.set_exception(Error)
+            raise
+
+        with self.Lock:
+            del self.Loading[Key]
+            self.Loads += 1
+            self.Models[Key] = Model
+
+            while len(self.Models) > self.MaxSize:
+                self.Models.popitem(last=False)
+
+        Pending.set_result(Model)
+        return Model
+
+    def resize(self, MaxSize):
+        with self.Lock:
+            self.MaxSize = MaxSize
+            while len(self.Models) > self.MaxSize:
+                self.Models.popitem(last=False)
+
+    def clear(self):
+        with self.Lock:
+            self.Models.clear()
+
+    def keys(self):
+        with self.Lock:
+            return list(self.Models.keys())
+
+
+Cache = ModelCache(MaxSize=12)
+
+
+def Func_loadCheckpoint(PATH):
+    with span('Registry.import'):
+        import A02_Networks.FeedForward as FF_Class
+
+    if not os.path.isfile(PATH):
+        raise FileNotFoundError('Checkpoint not found: ' + PATH)
+
+    with span('Registry.load_from_checkpoint'):
+        model = FF_Class.FeedForward.load_from_checkpoint(PATH)
+    model.eval()
+    return model
+
+
+def Func_attachScalers(model, Condition, Variant):
+    # Input/output normalisation of the Condition, stored with the model (see Normalisation.py)
+    from A01_Functions.Normalisation import Func_getScalers
+
+    if getattr(model, 'InputScaler', None) is None or getattr(model, 'OutputScaler', None) is None:
+        [model.InputScaler, model.OutputScaler] = Func_getScalers(Condition, Variant)
+    return model
+
+
+def Func_loadModel(Condition, Variant, Epoch=None):
+    # Single cached entry point for all inference paths.
+    # Without the .ckpt file the epoch is loaded from the checkpoint archive of the folder. The archive only holds
+    # the epochs of the original run, a missing validated or fine-tuned checkpoint of the manifest is an error.
+    PATH = Func_getCheckpointPath(Condition, Variant, Epoch)
+
+    if not os.path.isfile(PATH) and os.path.isfile(Func_getArchivePath(Condition, Variant)):
+        from A01_Functions.CheckpointArchive import Func_loadArchiveModel
+
+        if Epoch is None:
+            Epoch = Func_getDefaultEpoch(Condition, Variant)
+        ArchivePath = Func_getArchivePath(Condition, Variant)
+        if os.path.basename(PATH) != Func_checkpointName(Variant, Epoch):
+            raise FileNotFoundError('Checkpoint not found: ' + PATH + ', it is not part of the archive ' +
+                                    ArchivePath)
+
+        return Cache.get((ArchivePath, Epoch), lambda: Func_attachScalers(Func_loadArchiveModel(ArchivePath, Epoch),
+                                                                          Condition, Variant))
+
+    return Cache.get(PATH, lambda: Func_attachScalers(Func_loadCheckpoint(PATH), Condition, Variant))
+
+
+def Func_loadNumpyModel(Condition, Variant, Epoch=None):
+    # Torch-free model from an exported .npz weight bundle, cached like the checkpoints
+    from A01_Functions.NumpyInference import NumpyFeedForward
+
+    PATH = Func_getWeightsPath(Condition, Variant, Epoch)
+    return Cache.get(PATH, lambda: Func_attachScalers(NumpyFeedForward(PATH), Condition, Variant))
+
+
+def Func_setCacheSize(MaxSize):
+    Cache.resize(MaxSize)
@@ -0,0 +1,83 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Unity-based normalisation of the inputs and outputs of the neural networks.
+# The constants are the same as min_xV/max_xV in Functions/NNCombinedModel.m and differ between Single and Multi.
+
+import numpy as np
+
+# Luminance, CIEx, CIEy, Rod_Signal, S_Signal, M_Signal, L_Signal, Melanopsin_Signal
+# f_p, f_s, P_0, tp, ts, Delta_tp, Delta_ts, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10
+ScalerLabels = ['Leuchtdichte', 'Farbort_x', 'Farbort_y', 'Rod_Signal', 'S_Signal', 'M_Signal', 'L_Signal',
+                'Melanopsin_Signal',
+                'f_p', 'f_s', 'P_0', 'tp', 'ts', 'Delta_tp', 'Delta_ts',
+                'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p8', 'p9', 'p10']
+
+max_xV = {'Single': [100.170000000000, 0.717010000000000, 0.739280000000000, 1.48613000000000, 3.24582000000000,
+                     0.483380000000000, 0.291300000000000, 1.81725000000000, 20, 6.19300000000000, -0.824000000000000,
+                     0.487800000000000, 1.85000000000000, 0.134200000000000, 0.869600000000000, 2.38685423130276e-19,
+                     -2.38905680294312e-17, 2.02060208899617e-13, -5.55926435436703e-12, 1.30671705091018e-08,
+                     -1.52842006068615e-07, 0.000113658588265994, -0.000612094739840875, 0.110806416713225,
+                     2.70547744398636],
+          'Multi': [100.170000000000, 0.717010000000000, 0.739280000000000, 1.48613000000000, 3.24582000000000,
+                    0.483380000000000, 0.291300000000000, 1.81725000000000, 19.2070000000000, 6.19300000000000,
+                    -0.824000000000000, 0.519700000000000, 1.99250000000000, 0.134200000000000, 0.869600000000000,
+                    1.97550116389431e-19, 5.80847574168151e-16, 1.69958207976320e-13, 7.87244804975760e-11,
+                    1.13565736212557e-08, 8.37511104767027e-07, 0.000104951287925765, -0.000538199220672352,
+                    0.0968826645369810, 2.53009809335703]}
+
+min_xV = {'Single': [99.7300000000000, 0.158110000000000, 0.0200600000000000, 0.00232000000000000,
+                     9.00000000000000e-05, 0.0236300000000000, 0.140910000000000, 0.000750000000000000,
+                     -0.649200000000000, -1.19000000000000, -0.880000000000000, 0.100000000000000, 0.430600000000000,
+                     0.0604000000000000, 0.0878000000000000, 1.51215164972616e-20, -3.37931381239379e-16,
+                     1.56563570647668e-14, -6.63968897519939e-11, 1.17384511647451e-09, -1.57360392626362e-06,
+                     1.23830930427218e-05, -0.00464651170544400, 0.0123988673156660, 1.92268530982973],
+          'Multi': [99.7300000000000, 0.158110000000000, 0.0200600000000000, 0.00232000000000000,
+                    9.00000000000000e-05, 0.0236300000000000, 0.140910000000000, 0.000750000000000000,
+                    -0.649200000000000, -1.19000000000000, -0.880000000000000, 0.100000000000000, 0.733500000000000,
+                    0.0604000000000000, 0, -4.61470419153883e-19, -2.81476800948458e-16, -2.97014221879705e-13,
+                    -5.66256848966639e-11, -1.13638105654085e-08, -1.40317255861149e-06, -2.15433976320967e-05,
+                    -0.00447454985355800, 0.0152416115613120, 1.74976367312382]}
+
+# Input order of the networks, same as shapeTrainData() in ReadData.py
+VariantInputLabels = {1: ['Leuchtdichte', 'Farbort_x', 'Farbort_y'],
+                      2: ['S_Signal', 'M_Signal', 'L_Signal', 'Melanopsin_Signal'],
+                      3: ['Leuchtdichte', 'Farbort_x', 'Farbort_y', 'Melanopsin_Signal']}
+
+OutputLabels = ScalerLabels[8:]
+
+
+class UnityScaler:
+    # Vectorised affine transform of the columns of a N x M matrix, computed in float64
+
+    def __init__(self, min_x, max_x):
+        self.min_x = np.asarray(min_x, dtype=np.float64)
+        self.max_x = np.asarray(max_x, dtype=np.float64)
+
+    def normalise(self, x):
+        # Func_Normalisation = @(x, min_x, max_x) (x - min_x)/(max_x - min_x);
+        return (np.asarray(x, dtype=np.float64) - self.min_x) / (self.max_x - self.min_x)
+
+    def denormalise(self, Z):
+        # Func_NormalisationToValues = @(Z, min_x, max_x) Z.*max_x-Z.*min_x+min_x;
+        Z = np.asarray(Z, dtype=np.float64)
+        return Z * self.max_x - Z * self.min_x + self.min_x
+
+
+def Func_getScalers(Condition, Variant):
+    # Returns the (InputScaler, OutputScaler) of a Condition and Variant
+    if Condition not in max_xV:
+        raise ValueError('Unknown Condition ' + str(Condition) + ', use one of ' + str(list(max_xV)))
+    if Variant not in VariantInputLabels:
+        raise ValueError('Unknown Variant ' + str(Variant) + ', use one of ' + str(list(VariantInputLabels)))
+
+    InputIndex = [ScalerLabels.index(Label) for Label in VariantInputLabels[Variant]]
+    max_x = np.asarray(max_xV[Condition])
+    min_x = np.asarray(min_xV[Condition])
+
+    return UnityScaler(min_x[InputIndex], max_x[InputIndex]), UnityScaler(min_x[8:], max_x[8:])
@@ -0,0 +1,77 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Torch-free forward pass of the FeedForward networks with .npz weight bundles from ExportWeights.py.
+# Only numpy is imported, so short-lived processes start without PyTorch, Lightning or pandas.
+
+import numpy as np
+from A01_Functions.Normalisation import UnityScaler
+
+LayerNames = ['input_Layer', 'hidden_layer_1', 'hidden_layer_2', 'output_Layer']
+
+
+class NumpyFeedForward:
+
+    def __init__(self, PATH):
+        with np.load(PATH) as Bundle:
+            self.Weights = [np.ascontiguousarray(Bundle[Name + '.weight'].T, dtype=np.float32) for Name in LayerNames]
+            self.Biases = [np.asarray(Bundle[Name + '.bias'], dtype=np.float32) for Name in LayerNames]
+            self.Variant = int(Bundle['Variant'])
+            self.Epoch = int(Bundle['Epoch'])
+
+            # Normalisation constants, if stored in the bundle
+            self.InputScaler = None
+            self.OutputScaler = None
+            if 'InputMin' in Bundle.files:
+                self.InputScaler = UnityScaler(Bundle['InputMin'], Bundle['InputMax'])
+                self.OutputScaler = UnityScaler(Bundle['OutputMin'], Bundle['OutputMax'])
+
+        self.PATH = PATH
+        self.InputSize = self.Weights[0].shape[0]
+
+    def forward(self, x):
+        # Same layer sequence as FeedForward.forward(): no activation between hidden_layer_2 and output_Layer
+        x = np.asarray(x, dtype=np.float32)
+        x = x @ self.Weights[0] + self.Biases[0]
+        x = np.maximum(x, 0) @ self.Weights[1] + self.Biases[1]
+        x = np.maximum(x, 0) @ self.Weights[2] + self.Biases[2]
+        x = x @ self.Weights[3] + self.Biases[3]
+
+        return x
+
+    def __call__(self, x):
+        return self.forward(x)
+
+
+def Func_forwardBatchNumpy(model, InputMatrix, ChunkSize=4096):
+    # Chunked forward pass, same interface as Func_forwardBatch() in CalcParam.py
+    InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float32))
+    OutputMatrix = np.empty((InputMatrix.shape[0], 17), dtype=np.float32)
+
+    for Start in range(0, InputMatrix.shape[0], ChunkSize):
+        OutputMatrix[Start:Start + ChunkSize] = model(InputMatrix[Start:Start + ChunkSize])
+
+    return OutputMatrix
+
+
+def Func_predictNumpy(Condition, Variant, InputMatrix, Epoch=None, ChunkSize=4096, Physical=False):
+    # Physical: inputs and outputs in absolute units instead of the unity-based normalisation
+    from A01_Functions.ModelRegistry import Func_loadNumpyModel
+
+    model = Func_loadNumpyModel(Condition, Variant, Epoch)
+    InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64))
+
+    if InputMatrix.shape[1] != model.InputSize:
+        raise ValueError('Variant ' + str(Variant) + ' expects ' + str(model.InputSize) +
+                         ' input columns, got ' + str(InputMatrix.shape[1]))
+
+    if Physical:
+        return model.OutputScaler.denormalise(
+            Func_forwardBatchNumpy(model, model.InputScaler.normalise(InputMatrix), ChunkSize))
+
+    return Func_forwardBatchNumpy(model, InputMatrix, ChunkSize)
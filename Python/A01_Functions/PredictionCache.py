@@ -0,0 +1,302 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Memoization of the 17 predicted parameters for repeated stimuli (Matlab optimisation loops, GUI sessions).
+# Key: (Condition, Variant, Engine, Mode, sha1 of the model file, input vector quantized to Resolution)
+#   Engine      'numpy' (exported .npz weights, default) or 'torch' (.ckpt checkpoint or archive)
+#   Mode        how the parameters were computed, e.g. 'float32', 'fused', 'int8', with '-physical' for
+#               absolute inputs and outputs
+#   Resolution  inputs closer than Resolution share one entry, the prediction is computed for the quantized
+#               input, so an entry does not depend on which request filled it
+# Two tiers:
+#   memory  LRU dictionary with MaxMemoryEntries entries per process
+#   disk    SQLite database (WAL mode, many concurrent readers), the least recently used entries are deleted
+#           when the file grows above MaxDiskBytes. Disk hits are read-only transactions, their access times are
+#           kept in memory and written in one transaction per AccessFlushSize hits or AccessFlushPeriod seconds,
+#           before an eviction and on close()
+# The sha1 of a checkpoint is recomputed when its size or modification time changes. Entries of an older
+# version of the file are deleted from the database on the first request for the new version.
+#
+#   Cache = PredictionCache()
+#   Parameters = Cache.predict('Single', 1, InputMatrix)     # N x 17
+#   Cache.statistics()                                      # hits, misses and hit rate per tier
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from A01_Functions.ModelRegistry import Func_getDefaultEpoch, Func_getCheckpointPath, Func_getArchivePath, \
+    Func_getWeightsPath, Func_checkpointName
+
+CachePath_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A05_Cache',
+                                 'Predictions.sqlite')
+
+# (Path, Size, MTime) -> sha1 of the file
+FileHashes = {}
+FileHashesLock = threading.Lock()
+
+
+def Func_fileHash(PATH):
+    Status = os.stat(PATH)
+    FileKey = (os.path.abspath(PATH), Status.st_size, Status.st_mtime_ns)
+
+    with FileHashesLock:
+        if FileKey not in FileHashes:
+            Hash = hashlib.sha1()
+            with open(PATH, 'rb') as File:
+                for Block in iter(lambda: File.read(2 ** 20), b''):
+                    Hash.update(Block)
+            FileHashes[FileKey] = Hash.hexdigest()
+
+        return FileHashes[FileKey]
+
+
+def Func_modelSource(Condition, Variant, Epoch=None, Engine='numpy'):
+    # File the model of Func_loadNumpyModel()/Func_loadModel() is read from and its sha1,
+    # the archive hash includes the epoch
+    if Engine == 'numpy':
+        PATH = Func_getWeightsPath(Condition, Variant, Epoch)
+        return PATH, Func_fileHash(PATH)
+
+    PATH = Func_getCheckpointPath(Condition, Variant, Epoch)
+    if os.path.isfile(PATH):
+        return PATH, Func_fileHash(PATH)
+
+    # Same archive fallback as Func_loadModel(): only for the epochs of the original run
+    ArchivePath = Func_getArchivePath(Condition, Variant)
+    Epoch = Func_getDefaultEpoch(Condition, Variant) if Epoch is None else Epoch
+    if os.path.isfile(ArchivePath) and os.path.basename(PATH) == Func_checkpointName(Variant, Epoch):
+        return ArchivePath + ':' + str(Epoch), Func_fileHash(ArchivePath) + ':' + str(Epoch)
+
+    raise FileNotFoundError('No checkpoint for ' + str(Condition) + ' - Variant ' + str(Variant) +
+                            ' epoch ' + str(Epoch) + ': ' + PATH)
+
+
+class PredictionCache:
+
+    def __init__(self, PATH=CachePath_Default, MaxMemoryEntries=100000, MaxDiskBytes=256 * 2 ** 20,
+                 Resolution=1e-6, AccessFlushSize=10000, AccessFlushPeriod=60):
+        self.PATH = PATH
+        self.MaxMemoryEntries = MaxMemoryEntries
+        self.MaxDiskBytes = MaxDiskBytes
+        self.Resolution = Resolution
+        self.AccessFlushSize = AccessFlushSize
+        self.AccessFlushPeriod = AccessFlushPeriod
+
+        # Key -> time of the last disk hit, not yet written
+        self.Accessed = {}
+        self.LastFlush = time.time()
+
+        self.Memory = OrderedDict()
+        self.Lock = threading.Lock()
+        self.Local = threading.local()
+        self.CheckedSources = {}
+        self.Counts = {'MemoryHits': 0, 'DiskHits': 0, 'Misses': 0, 'Evictions': 0}
+
+        if PATH is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(PATH)), exist_ok=True)
+            Connection = self.connection()
+            with Connection:
+                Connection.execute('CREATE TABLE IF NOT EXISTS Predictions (Key BLOB PRIMARY KEY, Source TEXT, '
+                                   'Value BLOB, Accessed REAL)')
+                Connection.execute('CREATE INDEX IF NOT EXISTS PredictionsAccessed ON Predictions (Accessed)')
+                Connection.execute('CREATE TABLE IF NOT EXISTS Sources (Source TEXT PRIMARY KEY, Hash TEXT)')
+
+    def connection(self):
+        # One SQLite connection per thread
+        Connection = getattr(self.Local, 'Connection', None)
+        if Connection is None:
+            Connection = sqlite3.connect(self.PATH, timeout=30)
+            Connection.execute('PRAGMA journal_mode=WAL')
+            Connection.execute('PRAGMA synchronous=NORMAL')
+            self.Local.Connection = Connection
+        return Connection
+
+    def quantize(self, InputMatrix):
+        return np.round(np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64)) / self.Resolution).astype(np.int64)
+
+    def keys(self, Condition, Variant, Engine, Mode, Hash, Quantized):
+        Prefix = '|'.join([str(Condition), str(Variant), str(Engine), str(Mode), Hash,
+                           repr(self.Resolution)]).encode('utf-8')
+        return [hashlib.sha1(Prefix + Row.tobytes()).digest() for Row in Quantized]
+
+    def checkSource(self, Source, Hash):
+        # Deletes the entries of an older version of the checkpoint, once per process and version
+        if self.PATH is None or self.CheckedSources.get(Source) == Hash:
+            return
+
+        Connection = self.connection()
+        with Connection:
+            Row = Connection.execute('SELECT Hash FROM Sources WHERE Source = ?', (Source,)).fetchone()
+            if Row is None or Row[0] != Hash:
+                Connection.execute('DELETE FROM Predictions WHERE Source = ?', (Source,))
+                Connection.execute('INSERT OR REPLACE INTO Sources VALUES (?, ?)', (Source, Hash))
+        self.CheckedSources[Source] = Hash
+
+    def lookupDisk(self, Keys):
+        Found = {}
+        if self.PATH is None or len(Keys) == 0:
+            return Found
+
+        Connection = self.connection()
+        for Start in range(0, len(Keys), 500):
+            Part = Keys[Start:Start + 500]
+            Rows = Connection.execute('SELECT Key, Value FROM Predictions WHERE Key IN (' +
+                                      ','.join('?' * len(Part)) + ')', Part).fetchall()
+            Found.update({bytes(Key): np.frombuffer(Value, dtype=np.float64) for Key, Value in Rows})
+
+        if len(Found) > 0:
+            Now = time.time()
+            with self.Lock:
+                self.Accessed.update(dict.fromkeys(Found, Now))
+                Flush = len(self.Accessed) >= self.AccessFlushSize or Now - self.LastFlush >= self.AccessFlushPeriod
+            if Flush:
+                self.flushAccessed()
+        return Found
+
+    def flushAccessed(self):
+        # Writes the access times of the disk hits since the last flush
+        with self.Lock:
+            [Accessed, self.Accessed] = [self.Accessed, {}]
+            self.LastFlush = time.time()
+        if self.PATH is None or len(Accessed) == 0:
+            return
+
+        Connection = self.connection()
+        with Connection:
+            Connection.executemany('UPDATE Predictions SET Accessed = ? WHERE Key = ?',
+                                   [(Now, Key) for Key, Now in Accessed.items()])
+
+    def storeDisk(self, Source, Entries):
+        if self.PATH is None or len(Entries) == 0:
+            return
+
+        Connection = self.connection()
+        Now = time.time()
+        with Connection:
+            Connection.executemany('INSERT OR REPLACE INTO Predictions VALUES (?, ?, ?, ?)',
+                                   [(Key, Source, Value.tobytes(), Now) for Key, Value in Entries])
+        self.evict()
+
+    def diskSize(self):
+        Connection = self.connection()
+        PageCount = Connection.execute('PRAGMA page_count').fetchone()[0]
+        FreePages = Connection.execute('PRAGMA freelist_count').fetchone()[0]
+        PageSize = Connection.execute('PRAGMA page_size').fetchone()[0]
+        return (PageCount - FreePages) * PageSize
+
+    def evict(self):
+        # Deletes the least recently used tenth of the entries until the database is below MaxDiskBytes,
+        # the free pages are reused by SQLite, so the file does not grow further
+        Connection = self.connection()
+        if self.diskSize() > self.MaxDiskBytes:
+            self.flushAccessed()
+        while self.diskSize() > self.MaxDiskBytes:
+            Count = Connection.execute('SELECT COUNT(*) FROM Predictions').fetchone()[0]
+            if Count == 0:
+                break
+            with Connection:
+                Deleted = Connection.execute('DELETE FROM Predictions WHERE Key IN (SELECT Key FROM Predictions '
+                                             'ORDER BY Accessed LIMIT ?)', (max(Count // 10, 1),)).rowcount
+            with self.Lock:
+                self.Counts['Evictions'] += Deleted
+
+    def predict(self, Condition, Variant, InputMatrix, Epoch=None, Physical=False, Engine='numpy', Mode='float32',
+                Predictor=None):
+        # N x 17 parameters (float64), Predictor: function InputMatrix -> N x 17 for the missing rows,
+        # default: StreamingInference.Func_getPredictor() of the Engine
+        [Source, Hash] = Func_modelSource(Condition, Variant, Epoch, Engine)
+        self.checkSource(Source, Hash)
+
+        Quantized = self.quantize(InputMatrix)
+        Keys = self.keys(Condition, Variant, Engine, Mode + ('-physical' if Physical else ''), Hash, Quantized)
+        OutputMatrix = np.empty((len(Keys), 17), dtype=np.float64)
+
+        Missing = []
+        with self.Lock:
+            for Index, Key in enumerate(Keys):
+                Value = self.Memory.get(Key)
+                if Value is None:
+                    Missing.append(Index)
+                else:
+                    self.Memory.move_to_end(Key)
+                    OutputMatrix[Index] = Value
+            self.Counts['MemoryHits'] += len(Keys) - len(Missing)
+
+        Found = self.lookupDisk(list({Keys[Index] for Index in Missing}))
+        Computed = []
+        for Index in Missing:
+            if Keys[Index] in Found:
+                OutputMatrix[Index] = Found[Keys[Index]]
+            else:
+                Computed.append(Index)
+
+        if len(Computed) > 0:
+            # Every distinct missing input is predicted once
+            Rows = {}
+            for Index in Computed:
+                Rows.setdefault(Keys[Index], Index)
+
+            if Predictor is None:
+                from A01_Functions.StreamingInference import Func_getPredictor
+                Predictor = Func_getPredictor(Condition, Variant, Epoch, Engine=Engine, Physical=Physical)
+            Values = np.asarray(Predictor(Quantized[list(Rows.values())] * self.Resolution), dtype=np.float64)
+
+            New = dict(zip(Rows.keys(), Values))
+            for Index in Computed:
+                OutputMatrix[Index] = New[Keys[Index]]
+            self.storeDisk(Source, list(New.items()))
+            Found.update(New)
+
+        with self.Lock:
+            self.Counts['DiskHits'] += len(Missing) - len(Computed)
+            self.Counts['Misses'] += len(Computed)
+            for Key, Value in Found.items():
+                self.Memory[Key] = Value
+                self.Memory.move_to_end(Key)
+            while len(self.Memory) > self.MaxMemoryEntries:
+                self.Memory.popitem(last=False)
+
+        return OutputMatrix
+
+    def statistics(self):
+        with self.Lock:
+            Summary = dict(self.Counts)
+            Summary['MemoryEntries'] = len(self.Memory)
+
+        Requests = Summary['MemoryHits'] + Summary['DiskHits'] + Summary['Misses']
+        Summary['Requests'] = Requests
+        Summary['HitRate'] = (Summary['MemoryHits'] + Summary['DiskHits']) / Requests if Requests > 0 else 0.0
+        Summary['MemoryHitRate'] = Summary['MemoryHits'] / Requests if Requests > 0 else 0.0
+        Summary['DiskHitRate'] = Summary['DiskHits'] / Requests if Requests > 0 else 0.0
+        if self.PATH is not None:
+            Summary['DiskEntries'] = self.connection().execute('SELECT COUNT(*) FROM Predictions').fetchone()[0]
+            Summary['DiskBytes'] = self.diskSize()
+
+        return Summary
+
+    def clear(self):
+        with self.Lock:
+            self.Memory.clear()
+            self.Accessed.clear()
+        if self.PATH is not None:
+            Connection = self.connection()
+            with Connection:
+                Connection.execute('DELETE FROM Predictions')
+                Connection.execute('DELETE FROM Sources')
+        self.CheckedSources = {}
+
+    def close(self):
+        self.flushAccessed()
+        Connection = getattr(self.Local, 'Connection', None)
+        if Connection is not None:
+            Connection.close()
+            self.Local.Connection = None
@@ -0,0 +1,183 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Named timers around the stages of the inference and training paths.
+#   with span('CalcParam.forward'):
+#       ...
+# Switched on with the environment variable PUPILMODEL_PROFILE=1 (or Func_enable(), CalcParam.py --Profile).
+# When it is off, span() returns one shared context manager which does nothing, so the instrumented code
+# only pays for a function call.
+# When it is on, the count, total, mean, min and max seconds of every name are collected and printed at the
+# end of the process. Optional outputs of a single run:
+#   PUPILMODEL_PROFILE_TRACE=trace.json   every span as event of a Chrome trace file (chrome://tracing, Perfetto)
+#   PUPILMODEL_PROFILE_STATS=stats.json   the aggregated values as .json
+#   PUPILMODEL_CPROFILE=run.prof          cProfile of the whole run (python -m pstats run.prof)
+# This module only imports the standard library, so it can time the import of torch and pandas.
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+Enabled = os.environ.get('PUPILMODEL_PROFILE', '0').lower() not in ['', '0', 'false', 'no']
+
+TracePath = os.environ.get('PUPILMODEL_PROFILE_TRACE') or None
+StatsPath = os.environ.get('PUPILMODEL_PROFILE_STATS') or None
+CProfilePath = os.environ.get('PUPILMODEL_CPROFILE') or None
+
+# Name -> [Count, Total, Min, Max] in seconds
+Statistics = {}
+TraceEvents = []
+Lock = threading.Lock()
+Profiler = None
+Registered = False
+
+
+class _NoSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Arguments):
+        return False
+
+
+NoSpan = _NoSpan()
+
+
+class _Span:
+
+    def __init__(self, Name):
+        self.Name = Name
+
+    def __enter__(self):
+        self.Start = time.perf_counter()
+        return self
+
+    def __exit__(self, *Arguments):
+        Func_record(self.Name, self.Start, time.perf_counter())
+        return False
+
+
+def span(Name):
+    if not Enabled:
+        return NoSpan
+
+    return _Span(Name)
+
+
+def timed(Name):
+    # Decorator version of span()
+    def Func_decorator(Function):
+        def Func_wrapper(*Arguments, **KeywordArguments):
+            if not Enabled:
+                return Function(*Arguments, **KeywordArguments)
+            with _Span(Name):
+                return Function(*Arguments, **KeywordArguments)
+
+        Func_wrapper.__name__ = Function.__name__
+        Func_wrapper.__doc__ = Function.__doc__
+        return Func_wrapper
+
+    return Func_decorator
+
+
+def Func_record(Name, Start, End):
+    Duration = End - Start
+
+    with Lock:
+        Entry = Statistics.get(Name)
+        if Entry is None:
+            Statistics[Name] = [1, Duration, Duration, Duration]
+        else:
+            Entry[0] += 1
+            Entry[1] += Duration
+            Entry[2] = min(Entry[2], Duration)
+            Entry[3] = max(Entry[3], Duration)
+
+        if TracePath is not None:
+            TraceEvents.append({'name': Name, 'ph': 'X', 'ts': Start * 1e6, 'dur': Duration * 1e6,
+                                'pid': os.getpid(), 'tid': threading.get_ident()})
+
+
+def Func_enable(Trace=None, Stats=None, CProfile=None):
+    # Switches the timers on for the rest of the process and registers the report at the exit
+    global Enabled, TracePath, StatsPath, CProfilePath, Registered
+
+    Enabled = True
+    TracePath = Trace if Trace is not None else TracePath
+    StatsPath = Stats if Stats is not None else StatsPath
+    CProfilePath = CProfile if CProfile is not None else CProfilePath
+
+    if CProfilePath is not None and Profiler is None:
+        Func_startCProfile()
+
+    if not Registered:
+        atexit.register(Func_finish)
+        Registered = True
+
+
+def Func_startCProfile():
+    global Profiler
+    import cProfile
+
+    Profiler = cProfile.Profile()
+    Profiler.enable()
+
+
+def Func_summary():
+    # Aggregated values per name, sorted by the total time
+    with Lock:
+        Rows = [{'Name': Name, 'Count': Count, 'Total': Total, 'Mean': Total / Count, 'Min': Minimum, 'Max': Maximum}
+                for Name, (Count, Total, Minimum, Maximum) in Statistics.items()]
+
+    return sorted(Rows, key=lambda Row: -Row['Total'])
+
+
+def Func_report(File=None):
+    File = sys.stderr if File is None else File
+    Rows = Func_summary()
+    if len(Rows) == 0:
+        return
+
+    File.write('{:40s} {:>8s} {:>12s} {:>12s} {:>12s} {:>12s}\n'.format(
+        'Span', 'Count', 'Total [ms]', 'Mean [ms]', 'Min [ms]', 'Max [ms]'))
+    for Row in Rows:
+        File.write('{:40s} {:8d} {:12.3f} {:12.3f} {:12.3f} {:12.3f}\n'.format(
+            Row['Name'], Row['Count'], Row['Total'] * 1e3, Row['Mean'] * 1e3, Row['Min'] * 1e3, Row['Max'] * 1e3))
+
+
+def Func_reset():
+    with Lock:
+        Statistics.clear()
+        del TraceEvents[:]
+
+
+def Func_finish():
+    # Report, stats, trace file and cProfile output of the run
+    if Profiler is not None:
+        Profiler.disable()
+        Profiler.dump_stats(CProfilePath)
+
+    Func_report()
+
+    if StatsPath is not None:
+        with open(StatsPath, 'w') as File:
+            json.dump(Func_summary(), File, indent=2)
+
+    if TracePath is not None:
+        with Lock:
+            Events = list(TraceEvents)
+        with open(TracePath, 'w') as File:
+            json.dump({'traceEvents': Events, 'displayTimeUnit': 'ms'}, File)
+
+
+if Enabled:
+    Func_enable()
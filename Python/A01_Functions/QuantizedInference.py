@@ -0,0 +1,152 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Reduced precision versions of the FeedForward networks for CPU inference:
+#   'float32'  the original model
+#   'float16'  weights stored as float16 (half the memory), computed in float32, because the CPU kernels of
+#              PyTorch are not faster in float16
+#   'int8'     dynamic int8 quantization of the nn.Linear layers (torch.quantization.quantize_dynamic):
+#              int8 weights, the activations are quantized per batch
+# The report compares the 17 predicted parameters of every mode with float32 on the training data of the
+# Condition and lists the model size and the throughput, so a mode can be chosen per Condition/Variant.
+#
+# Run from the folder Python/:
+#   python -m A01_Functions.QuantizedInference --Output A04_Results_Training/Precision_Report.csv
+
+import io
+import copy
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import DefaultEpochs, Cache, Func_loadModel, Func_getCheckpointPath
+from A01_Functions.ReadData import Func_readDataIn, ConditionDataPaths, shapeTrainData
+
+PrecisionModes = ['float32', 'float16', 'int8']
+
+
+class HalfStorageLinear(nn.Module):
+    # nn.Linear with the weights kept in float16, the matrix multiplication runs in float32
+
+    def __init__(self, Linear):
+        super().__init__()
+        self.register_buffer('weight', Linear.weight.detach().half())
+        self.register_buffer('bias', Linear.bias.detach().half())
+
+    def forward(self, x):
+        return F.linear(x, self.weight.float(), self.bias.float())
+
+
+def Func_quantizeModel(model, Mode='int8'):
+    # Copy of a loaded FeedForward in the precision Mode, the scalers of the model are kept
+    if Mode not in PrecisionModes:
+        raise ValueError('Unknown precision ' + str(Mode) + ', use one of ' + str(PrecisionModes))
+
+    if Mode == 'float32':
+        return model
+
+    if Mode == 'int8':
+        Quantized = torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    else:
+        Quantized = copy.deepcopy(model)
+        for Name, Module in list(Quantized.named_children()):
+            if isinstance(Module, nn.Linear):
+                setattr(Quantized, Name, HalfStorageLinear(Module))
+
+    Quantized.eval()
+    return Quantized
+
+
+def Func_loadQuantizedModel(Condition, Variant, Epoch=None, Mode='int8'):
+    # Quantized model of the registry, cached next to the original model
+    model = Func_loadModel(Condition, Variant, Epoch)
+    if Mode == 'float32':
+        return model
+
+    return Cache.get((Mode, Func_getCheckpointPath(Condition, Variant, Epoch)),
+                     lambda: Func_quantizeModel(model, Mode))
+
+
+def Func_modelSize(model):
+    # Bytes of the serialised state_dict
+    Buffer = io.BytesIO()
+    torch.save(model.state_dict(), Buffer)
+    return Buffer.tell()
+
+
+def Func_predict(model, InputMatrix, ChunkSize=4096):
+    InputMatrix = torch.as_tensor(np.asarray(InputMatrix, dtype=np.float32))
+    with torch.no_grad():
+        return torch.cat([model(InputMatrix[Start:Start + ChunkSize])
+                          for Start in range(0, InputMatrix.shape[0], ChunkSize)]).numpy()
+
+
+def Func_throughput(model, InputSize, BatchSize=16384, Repeats=5):
+    InputMatrix = torch.rand(BatchSize, InputSize)
+    Durations = []
+    with torch.no_grad():
+        model(InputMatrix)
+        for _ in range(Repeats):
+            Start = time.perf_counter()
+            model(InputMatrix)
+            Durations.append(time.perf_counter() - Start)
+
+    return BatchSize / np.median(Durations)
+
+
+def Func_precisionReport(Conditions=('Single', 'Multi'), Variants=(1, 2, 3), Modes=PrecisionModes):
+    # One row per Condition/Variant/Mode and one column per parameter with the maximum absolute deviation
+    # from float32 (normalised units) on the training data of the Condition, plus mean deviation, MSE against
+    # the training targets, model size and throughput
+    [InputtLabels, TargetLabels] = shapeTrainData(1)
+    Rows = []
+
+    for Condition in Conditions:
+        for Variant in Variants:
+            if (Condition, Variant) not in DefaultEpochs:
+                continue
+
+            model = Func_loadModel(Condition, Variant)
+            [TrainInputMatrix, TrainTargetMatrix] = Func_readDataIn(Variant, ConditionDataPaths[Condition])
+            Reference = Func_predict(model, TrainInputMatrix)
+
+            for Mode in Modes:
+                Quantized = Func_loadQuantizedModel(Condition, Variant, Mode=Mode)
+                Prediction = Func_predict(Quantized, TrainInputMatrix)
+                Deviation = np.abs(Prediction - Reference)
+
+                Row = {'Condition': Condition, 'Variant': Variant, 'Mode': Mode,
+                       'MaxDeviation': float(Deviation.max()), 'MeanDeviation': float(Deviation.mean()),
+                       'MSE': float(((Prediction - TrainTargetMatrix.numpy()) ** 2).mean()),
+                       'SizeBytes': Func_modelSize(Quantized),
+                       'RowsPerSecond': float(Func_throughput(Quantized, TrainInputMatrix.shape[1]))}
+                Row.update({'MaxDeviation_' + Label: float(Value)
+                            for Label, Value in zip(TargetLabels, Deviation.max(axis=0))})
+                Rows.append(Row)
+
+    return pd.DataFrame(Rows)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Conditions', type=str, nargs='+', default=['Single', 'Multi'])
+    parser.add_argument('--Variants', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--Modes', type=str, nargs='+', default=PrecisionModes, choices=PrecisionModes)
+    parser.add_argument('--Output', type=str, default=None)
+    args = parser.parse_args()
+
+    Report = Func_precisionReport(args.Conditions, args.Variants, args.Modes)
+    print(Report[['Condition', 'Variant', 'Mode', 'MaxDeviation', 'MeanDeviation', 'MSE', 'SizeBytes',
+                  'RowsPerSecond']].to_string(index=False))
+
+    if args.Output is not None:
+        Report.to_csv(args.Output, index=False)
+        print('Report written to ' + args.Output)
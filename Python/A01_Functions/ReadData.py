@@ -10,6 +10,7 @@ import numpy as np
 import pandas as pd
 import sys
 import torch
+from A01_Functions.Dataset import Func_loadTensors, TensorCache_Default
 
 pd.set_option('display.width', 1000)
 pd.set_option('display.max_columns', 600)
@@ -17,23 +18,23 @@ np.set_printoptions(linewidth=200, edgeitems=4)
 torch.set_printoptions(linewidth=200, edgeitems=4)
 
 
-def Func_readDataIn(Variant):
-    DataDataFrame = pd.read_csv('A00_Data/TrainData_Many_Subject.csv')
-    print('Data loaded from csv')
+DataPath_Default = 'A00_Data/TrainData_Many_Subject.csv'
 
-    [InputtLabels, TargetLabels] = shapeTrainData(Variant)
+# Training data of the published models of every Condition
+ConditionDataPaths = {'Single': 'A00_Data/TrainData_Individual_Subject.csv',
+                      'Multi': 'A00_Data/TrainData_Many_Subject.csv'}
 
-    print('Features: ' + str(InputtLabels))
-    print('Target: ' + str(TargetLabels))
 
-    InputValues = DataDataFrame[InputtLabels]
-    TargetValues = DataDataFrame[TargetLabels]
+def Func_readDataIn(Variant, DataPath=DataPath_Default, CacheFolder=TensorCache_Default):
+    # DataPath: .csv, .npy, .npz, .parquet or column store (.cols), see Dataset.py.
+    # The tensors are cached per source and Variant, CacheFolder=None reads the source every time.
+    [InputtLabels, TargetLabels] = shapeTrainData(Variant)
 
-    InputValues = InputValues.values
-    TargetValues = TargetValues.values
+    [InputValues, TargetValues] = Func_loadTensors(Variant, DataPath, CacheFolder)
+    print('Data loaded from ' + DataPath)
 
-    InputValues = torch.from_numpy(InputValues).float()
-    TargetValues = torch.from_numpy(TargetValues).float()
+    print('Features: ' + str(InputtLabels))
+    print('Target: ' + str(TargetLabels))
 
     return [InputValues, TargetValues]
 
@@ -0,0 +1,175 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Input features of the networks from measured spectra.
+# Spectra: N x M matrix of spectral radiances in W/(m^2 sr nm) at the M wavelengths (nm) of the measurement.
+# All features are computed with one matrix multiplication Spectra @ Weights (M x 8), the columns of Weights are
+# the weighting functions resampled to the wavelength grid and multiplied with the integration step:
+#   X, Y, Z                          CIE 1931 2 degree colour matching functions
+#   Rod, S, M, L, Melanopsin         alpha-opic action spectra of CIE S 026 (rhodopic, S-, M-, L-cone, melanopic)
+# Leuchtdichte = 683.002 lm/W * Y, Farbort_x/y = X/(X+Y+Z), Y/(X+Y+Z) and the alpha-opic radiances in W/(m^2 sr)
+# are the columns of the training data (see ScalerLabels in Normalisation.py).
+# The weights of a wavelength grid are cached, so repeated calls with the same spectrometer grid only pay for
+# the matrix multiplication.
+#
+# TablePath: .csv file with the columns Wavelength (nm) and WeightingLabels. The default A00_Data/
+# WeightingFunctions_CIE.csv holds the CIE 1931 2 degree colour matching functions (CIE 018:2019) and the action
+# spectra of the CIE S 026/E:2018 toolbox (v1.049), 360 - 830 nm in steps of 1 nm. The input normalisation of the
+# networks is very narrow (e.g. 99.73 - 100.17 cd/m^2), features outside of the training range of the model raise
+# a ValueError in Func_predictFromSpectra().
+#
+# Run from the folder Python/ (rows of the .csv file: spectra, header: wavelengths in nm):
+#   python -m A01_Functions.SpectralFeatures --InputFile spectra.csv --Condition Single --Variant 3
+#          --OutputFile parameters.csv
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from A01_Functions.Normalisation import VariantInputLabels, OutputLabels
+
+TablePath_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A00_Data',
+                                 'WeightingFunctions_CIE.csv')
+
+WeightingLabels = ['X', 'Y', 'Z', 'Rod', 'S', 'M', 'L', 'Melanopsin']
+FeatureLabels = ['Leuchtdichte', 'Farbort_x', 'Farbort_y', 'Rod_Signal', 'S_Signal', 'M_Signal', 'L_Signal',
+                 'Melanopsin_Signal']
+
+# Maximum photometric efficacy in lm/W
+K_m = 683.002
+
+# Wavelength grid -> weights, filled by Func_getWeights()
+WeightsCache = {}
+WeightsLock = threading.Lock()
+Tables = {}
+
+
+def Func_readTable(TablePath=TablePath_Default):
+    # Weighting table (Wavelength + WeightingLabels), read once per file
+    if TablePath is None or not os.path.isfile(str(TablePath)):
+        raise FileNotFoundError('Weighting table not found: ' + str(TablePath) + ', give a .csv file with the CIE '
+                                'colour matching functions and the CIE S 026 action spectra (columns: Wavelength, ' +
+                                ', '.join(WeightingLabels) + ')')
+    if TablePath not in Tables:
+        Table = pd.read_csv(TablePath)
+        Missing = [Label for Label in ['Wavelength'] + WeightingLabels if Label not in Table.columns]
+        if len(Missing) > 0:
+            raise ValueError('Weighting table ' + TablePath + ' has no columns ' + str(Missing))
+        Tables[TablePath] = Table.sort_values('Wavelength')
+
+    return Tables[TablePath]
+
+
+def Func_integrationSteps(Wavelengths):
+    # Trapezoidal rule on a (possibly non-uniform) grid: weight of every sample in nm
+    Steps = np.diff(Wavelengths)
+    Weights = np.zeros(len(Wavelengths))
+    Weights[:-1] += Steps / 2
+    Weights[1:] += Steps / 2
+
+    return Weights
+
+
+def Func_getWeights(Wavelengths, TablePath=TablePath_Default):
+    # M x 8 weight matrix of a wavelength grid, resampled by linear interpolation (0 outside of the table)
+    Wavelengths = np.ascontiguousarray(Wavelengths, dtype=np.float64)
+    if Wavelengths.ndim != 1 or len(Wavelengths) < 2 or np.any(np.diff(Wavelengths) <= 0):
+        raise ValueError('Wavelengths must be a strictly increasing vector with at least 2 values')
+
+    Key = (TablePath, Wavelengths.tobytes())
+    with WeightsLock:
+        Weights = WeightsCache.get(Key)
+        if Weights is None:
+            Table = Func_readTable(TablePath)
+            Weights = np.stack([np.interp(Wavelengths, Table['Wavelength'].values, Table[Label].values,
+                                          left=0, right=0) for Label in WeightingLabels], axis=1)
+            Weights = Weights * Func_integrationSteps(Wavelengths)[:, np.newaxis]
+            Weights.setflags(write=False)
+            WeightsCache[Key] = Weights
+
+    return Weights
+
+
+def Func_spectraToFeatures(Spectra, Wavelengths, TablePath=TablePath_Default):
+    # N x 8 matrix of the FeatureLabels for N spectral radiances in W/(m^2 sr nm)
+    Spectra = np.atleast_2d(np.asarray(Spectra, dtype=np.float64))
+    Weights = Func_getWeights(Wavelengths, TablePath)
+    if Spectra.shape[1] != Weights.shape[0]:
+        raise ValueError('Spectra have ' + str(Spectra.shape[1]) + ' columns, the wavelength grid has ' +
+                         str(Weights.shape[0]) + ' values')
+
+    Integrals = Spectra @ Weights
+    Tristimulus = Integrals[:, 0:3]
+    Sum = Tristimulus.sum(axis=1)
+    # Chromaticity of a black spectrum is undefined
+    Sum[Sum == 0] = np.nan
+
+    Features = np.empty((Spectra.shape[0], len(FeatureLabels)))
+    Features[:, 0] = K_m * Tristimulus[:, 1]
+    Features[:, 1] = Tristimulus[:, 0] / Sum
+    Features[:, 2] = Tristimulus[:, 1] / Sum
+    Features[:, 3:] = Integrals[:, 3:]
+
+    return Features
+
+
+def Func_variantInputs(Features, Variant):
+    # Columns of the feature matrix in the input order of the Variant
+    return Features[:, [FeatureLabels.index(Label) for Label in VariantInputLabels[Variant]]]
+
+
+def Func_predictFromSpectra(Condition, Variant, Spectra, Wavelengths, TablePath=TablePath_Default, Epoch=None,
+                            Engine='numpy', ChunkSize=4096, Tolerance=0.05):
+    # Features (N x 8) and the absolute model parameters (N x 17) of N spectra.
+    # Tolerance: inputs may exceed the normalised training range [0, 1] by this amount, otherwise ValueError
+    from A01_Functions.Normalisation import Func_getScalers
+    from A01_Functions.StreamingInference import Func_getPredictor
+
+    Features = Func_spectraToFeatures(Spectra, Wavelengths, TablePath)
+    Inputs = Func_variantInputs(Features, Variant)
+
+    Normalised = Func_getScalers(Condition, Variant)[0].normalise(Inputs)
+    Outside = ~np.all((Normalised >= -Tolerance) & (Normalised <= 1 + Tolerance), axis=1)
+    if np.any(Outside):
+        raise ValueError(str(int(Outside.sum())) + ' of ' + str(len(Outside)) + ' spectra are outside of the '
+                         'training range of ' + Condition + ' - Variant ' + str(Variant) + ' (first: row ' +
+                         str(int(np.argmax(Outside))) + ', normalised inputs ' +
+                         str(np.round(Normalised[np.argmax(Outside)], 3).tolist()) + ')')
+
+    Predict = Func_getPredictor(Condition, Variant, Epoch, Engine, Physical=True, ChunkSize=ChunkSize)
+
+    return Features, Predict(Inputs)
+
+
+def Func_readSpectra(InputFile):
+    # .csv file with one spectrum per row and the wavelengths as header, returns (Spectra, Wavelengths)
+    Data = pd.read_csv(InputFile)
+    return Data.values.astype(np.float64), Data.columns.astype(np.float64).values
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--InputFile', type=str, default=None)
+    parser.add_argument('--OutputFile', type=str, default='output_spectra.csv')
+    parser.add_argument('--Condition', type=str, default='Single')
+    parser.add_argument('--Variant', type=int, default=3)
+    parser.add_argument('--Epoch', type=int, default=None)
+    parser.add_argument('--Engine', type=str, default='numpy', choices=['numpy', 'torch'])
+    parser.add_argument('--Table', type=str, default=TablePath_Default, help='.csv file with the weighting functions')
+    args = parser.parse_args()
+
+    if args.InputFile is not None:
+        [Spectra, Wavelengths] = Func_readSpectra(args.InputFile)
+        [Features, Parameters] = Func_predictFromSpectra(args.Condition, args.Variant, Spectra, Wavelengths,
+                                                         args.Table, args.Epoch, args.Engine)
+
+        Output = pd.concat([pd.DataFrame(Features, columns=FeatureLabels),
+                            pd.DataFrame(Parameters, columns=OutputLabels)], axis=1)
+        Output.to_csv(args.OutputFile, index=False)
+        print(str(len(Output)) + ' spectra written to ' + args.OutputFile)
@@ -0,0 +1,151 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Sensitivities of the 17 model parameters and search of stimuli for given parameters.
+# Func_jacobian(): N x 17 x D Jacobians of the outputs with respect to the normalised inputs for N stimuli,
+#   computed with 17 backward passes over the whole batch (the rows of a batch are independent, so the gradient
+#   of the column sum is the gradient of every row). Only torch.autograd.grad is used, which PyTorch 1.4 has.
+# Func_inverseSearch(): stimuli in the input box [0, 1]^D of a Variant whose predicted parameters match a target.
+#   NumStarts random starting points are optimised together as one batch with Adam steps on the weighted MSE,
+#   after every step the inputs are projected back into the box (projected gradient). The box is the range of
+#   the training data, so the networks are not evaluated beyond it.
+#
+# Run from the folder Python/ (target: first row of a .csv file in the format of output.csv):
+#   python -m A01_Functions.StimulusSearch --Condition Single --Variant 1 --Target output.csv
+#          [--Parameters f_p tp ts] [--Starts 64] [--Physical]
+
+import numpy as np
+import pandas as pd
+import torch
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import Func_loadModel
+from A01_Functions.Normalisation import VariantInputLabels, OutputLabels
+
+
+def Func_jacobian(model, InputMatrix, ChunkSize=4096, Physical=False):
+    # N x 17 x D Jacobians d(output)/d(input) of a loaded FeedForward.
+    # Physical: inputs and outputs in absolute units (chain rule with the scalers of the model)
+    InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64))
+    if Physical:
+        InputMatrix = model.InputScaler.normalise(InputMatrix)
+
+    Jacobians = []
+    for Start in range(0, InputMatrix.shape[0], ChunkSize):
+        Inputs = torch.tensor(InputMatrix[Start:Start + ChunkSize], dtype=torch.float32, requires_grad=True)
+        Outputs = model(Inputs)
+
+        Rows = []
+        for Index in range(Outputs.shape[1]):
+            [Gradient] = torch.autograd.grad(Outputs[:, Index].sum(), Inputs,
+                                             retain_graph=Index < Outputs.shape[1] - 1)
+            Rows.append(Gradient)
+        Jacobians.append(torch.stack(Rows, dim=1).detach().numpy())
+
+    Jacobian = np.concatenate(Jacobians).astype(np.float64)
+
+    if Physical:
+        OutputRange = model.OutputScaler.max_x - model.OutputScaler.min_x
+        InputRange = model.InputScaler.max_x - model.InputScaler.min_x
+        Jacobian = Jacobian * OutputRange[np.newaxis, :, np.newaxis] / InputRange[np.newaxis, np.newaxis, :]
+
+    return Jacobian
+
+
+def Func_loadJacobian(Condition, Variant, InputMatrix, Epoch=None, ChunkSize=4096, Physical=False):
+    return Func_jacobian(Func_loadModel(Condition, Variant, Epoch), InputMatrix, ChunkSize, Physical)
+
+
+def Func_inverseSearch(Condition, Variant, Target, Weights=None, Epoch=None, NumStarts=64, Steps=1000,
+                       learningRate=0.02, Tolerance=1e-10, Seed=0, Starts=None, Physical=False):
+    # Searches stimuli whose predicted parameters match Target (17 values).
+    # Weights: 17 weights of the squared errors (0 excludes a parameter), default: all 1
+    # Starts: optional K x D starting points (normalised), completed with random points up to NumStarts
+    # Physical: Target in absolute units, the returned stimuli contain the absolute inputs as well
+    # Returns a DataFrame sorted by the loss with the normalised inputs, the absolute inputs, the loss and the
+    # predicted parameters (normalised) of every start
+    model = Func_loadModel(Condition, Variant, Epoch)
+    InputSize = model.input_Layer.in_features
+
+    Target = np.asarray(Target, dtype=np.float64).reshape(-1)
+    if Physical:
+        Target = model.OutputScaler.normalise(Target)
+    Weights = np.ones(len(OutputLabels)) if Weights is None else np.asarray(Weights, dtype=np.float64)
+    if len(Target) != len(OutputLabels) or len(Weights) != len(OutputLabels):
+        raise ValueError('Target and Weights need ' + str(len(OutputLabels)) + ' values')
+    if np.any(Weights < 0) or Weights.sum() <= 0:
+        raise ValueError('Weights must be non-negative with at least one positive weight')
+
+    Generator = np.random.RandomState(Seed)
+    StartMatrix = np.zeros((0, InputSize)) if Starts is None else np.clip(np.atleast_2d(Starts), 0, 1)
+    StartMatrix = np.concatenate([StartMatrix, Generator.rand(max(NumStarts - len(StartMatrix), 0), InputSize)])
+
+    Inputs = torch.tensor(StartMatrix, dtype=torch.float32, requires_grad=True)
+    TargetTensor = torch.tensor(Target, dtype=torch.float32)
+    WeightTensor = torch.tensor(Weights / Weights.sum(), dtype=torch.float32)
+    optimizer = torch.optim.Adam([Inputs], lr=learningRate)
+
+    LastLoss = None
+    for Step in range(Steps):
+        Losses = (((model(Inputs) - TargetTensor) ** 2) * WeightTensor).sum(dim=1)
+        # The starts are independent, the gradient of the sum is the gradient of every start.
+        # autograd.grad leaves the .grad of the (shared, cached) model untouched
+        [Inputs.grad] = torch.autograd.grad(Losses.sum(), Inputs)
+        optimizer.step()
+
+        with torch.no_grad():
+            Inputs.clamp_(0, 1)
+
+        Loss = float(Losses.detach().min())
+        if LastLoss is not None and abs(LastLoss - Loss) < Tolerance:
+            break
+        LastLoss = Loss
+
+    with torch.no_grad():
+        Outputs = model(Inputs)
+        Losses = (((Outputs - TargetTensor) ** 2) * WeightTensor).sum(dim=1).numpy()
+
+    Normalised = Inputs.detach().numpy().astype(np.float64)
+    Labels = VariantInputLabels[Variant]
+    Result = pd.DataFrame(Normalised, columns=Labels)
+    Absolute = model.InputScaler.denormalise(Normalised)
+    for Index, Label in enumerate(Labels):
+        Result[Label + '_Absolute'] = Absolute[:, Index]
+    Result['Loss'] = Losses
+    Result = pd.concat([Result, pd.DataFrame(Outputs.numpy(), columns=OutputLabels)], axis=1)
+
+    return Result.sort_values('Loss').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Condition', type=str, default='Single')
+    parser.add_argument('--Variant', type=int, default=1)
+    parser.add_argument('--Epoch', type=int, default=None)
+    parser.add_argument('--Target', type=str, required=True, help='.csv file with the 17 parameters (first row)')
+    parser.add_argument('--Parameters', type=str, nargs='+', default=None, help='Matched parameters, default: all')
+    parser.add_argument('--Starts', type=int, default=64)
+    parser.add_argument('--Steps', type=int, default=1000)
+    parser.add_argument('--Physical', action='store_true')
+    parser.add_argument('--Output', type=str, default=None)
+    args = parser.parse_args()
+
+    Target = pd.read_csv(args.Target)[OutputLabels].values[0]
+    Weights = None
+    if args.Parameters is not None:
+        Unknown = [Label for Label in args.Parameters if Label not in OutputLabels]
+        if Unknown:
+            parser.error('Unknown parameters ' + str(Unknown) + ', use ' + str(OutputLabels))
+        Weights = [1.0 if Label in args.Parameters else 0.0 for Label in OutputLabels]
+
+    Result = Func_inverseSearch(args.Condition, args.Variant, Target, Weights, args.Epoch, NumStarts=args.Starts,
+                                Steps=args.Steps, Physical=args.Physical)
+    print(Result.head(5).to_string())
+
+    if args.Output is not None:
+        Result.to_csv(args.Output, index=False)
+        print('Stimuli written to ' + args.Output)
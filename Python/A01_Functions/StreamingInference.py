@@ -0,0 +1,244 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Prediction of the 17 model parameters for stimulus logs of any length with constant memory.
+# The input csv file is read in blocks of BlockSize bytes which end at a line break (generator), every block
+# is parsed, normalised and predicted as one batch and the parameters are appended to the output csv file
+# (one output row per input row). After every block the position in the input file, the number of rows and
+# the size of the output file are stored in <OutputFile>.progress.json, so an interrupted run continues with
+# --Resume. A run can also start at a row (--StartRow) or byte offset of a line start (--StartByte).
+# The columns are selected by the names of shapeTrainData() if the file has a header with these names,
+# otherwise the first 3 (Variant 1) or 4 (Variant 2, 3) columns are used in the input order of the networks.
+#
+# Run from the folder Python/:
+#   python -m A01_Functions.StreamingInference --Condition Multi --Variant 3 --InputFile log.csv
+#          --OutputFile parameters.csv --Physical [--Resume]
+
+import os
+import io
+import sys
+import json
+import time
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from A01_Functions.Normalisation import VariantInputLabels, OutputLabels
+from A01_Functions.Profiling import span
+
+
+def Func_readHeader(InputFile, Variant):
+    # Column indices of the network inputs and byte offset of the first data line
+    with open(InputFile, 'rb') as File:
+        FirstLine = File.readline()
+
+    Columns = [Column.strip() for Column in FirstLine.decode('utf-8').strip().split(',')]
+    InputLabels = VariantInputLabels[Variant]
+
+    if set(InputLabels).issubset(Columns):
+        return [Columns.index(Label) for Label in InputLabels], len(FirstLine)
+
+    try:
+        [float(Column) for Column in Columns]
+        DataStart = 0
+    except ValueError:
+        DataStart = len(FirstLine)
+
+    return list(range(len(InputLabels))), DataStart
+
+
+def Func_skipRows(File, NumRows, BlockSize):
+    # Moves the file position NumRows rows forward, returns the number of skipped rows. Blank lines are not rows,
+    # the parser drops them as well
+    Skipped = 0
+    while Skipped < NumRows:
+        Position = File.tell()
+        # Whole lines only
+        Block = File.read(BlockSize)
+        if not Block:
+            break
+        Block += File.readline()
+
+        Lines = Block.split(b'\n')
+        if Block.endswith(b'\n'):
+            Lines.pop()
+        for Line in Lines:
+            Position += len(Line) + 1
+            if Line.strip():
+                Skipped += 1
+                if Skipped == NumRows:
+                    File.seek(Position)
+                    break
+
+    return Skipped
+
+
+def Func_readBlocks(InputFile, Variant, BlockSize=8 * 2 ** 20, StartRow=0, StartByte=None):
+    # Generator of (RowOffset, EndByte, InputMatrix): the rows of one block, the row number of its first row
+    # and the byte offset behind its last line (start of the next block)
+    [Indices, DataStart] = Func_readHeader(InputFile, Variant)
+
+    with open(InputFile, 'rb') as File:
+        if StartByte is not None:
+            File.seek(max(StartByte, DataStart))
+        else:
+            File.seek(DataStart)
+            StartRow = Func_skipRows(File, StartRow, BlockSize)
+
+        RowOffset = StartRow
+        Remainder = b''
+
+        while True:
+            Block = File.read(BlockSize)
+            if not Block and not Remainder:
+                return
+
+            if Block:
+                Block = Remainder + Block
+                End = Block.rfind(b'\n') + 1
+                if End == 0:
+                    # No complete line yet, read on
+                    Remainder = Block
+                    continue
+                [Block, Remainder] = [Block[:End], Block[End:]]
+            else:
+                # Last line without line break
+                [Block, Remainder] = [Remainder, b'']
+
+            EndByte = File.tell() - len(Remainder)
+            if not Block.strip():
+                continue
+            with span('Streaming.parse'):
+                InputMatrix = pd.read_csv(io.BytesIO(Block), header=None, usecols=Indices, dtype=np.float64,
+                                          skip_blank_lines=True).values
+            # usecols keeps the order of the file, restore the input order of the network
+            InputMatrix = InputMatrix[:, np.argsort(np.argsort(Indices))]
+
+            yield RowOffset, EndByte, InputMatrix
+            RowOffset += InputMatrix.shape[0]
+
+
+def Func_getPredictor(Condition, Variant, Epoch=None, Engine='numpy', Physical=False, ChunkSize=4096):
+    # Function InputMatrix (N x 3/4) -> N x 17 parameters of one loaded model, forward pass in ChunkSize rows
+    if Engine == 'numpy':
+        from A01_Functions.ModelRegistry import Func_loadNumpyModel
+        from A01_Functions.NumpyInference import Func_forwardBatchNumpy
+        model = Func_loadNumpyModel(Condition, Variant, Epoch)
+
+        def Func_forward(InputMatrix):
+            return Func_forwardBatchNumpy(model, InputMatrix, ChunkSize)
+    else:
+        import torch
+        from A01_Functions.ModelRegistry import Func_loadModel
+        model = Func_loadModel(Condition, Variant, Epoch)
+
+        def Func_forward(InputMatrix):
+            InputMatrix = torch.from_numpy(InputMatrix.astype(np.float32))
+            with torch.no_grad():
+                return torch.cat([model(InputMatrix[Start:Start + ChunkSize])
+                                  for Start in range(0, InputMatrix.shape[0], ChunkSize)]).numpy()
+
+    def Func_predict(InputMatrix):
+        if InputMatrix.shape[0] == 0:
+            return np.empty((0, len(OutputLabels)))
+        if Physical:
+            with span('Streaming.normalise'):
+                InputMatrix = model.InputScaler.normalise(InputMatrix)
+        with span('Streaming.forward'):
+            OutputMatrix = Func_forward(InputMatrix)
+        if Physical:
+            with span('Streaming.denormalise'):
+                OutputMatrix = model.OutputScaler.denormalise(OutputMatrix)
+        return OutputMatrix
+
+    return Func_predict
+
+
+def Func_progressPath(OutputFile):
+    return OutputFile + '.progress.json'
+
+
+def Func_streamPredict(Condition, Variant, InputFile, OutputFile, Epoch=None, Engine='numpy', Physical=False,
+                       BlockSize=8 * 2 ** 20, ChunkSize=4096, StartRow=0, StartByte=None, Resume=False,
+                       ProgressPeriod=5, Log=sys.stdout):
+    # Streams InputFile through the network into OutputFile, returns the number of predicted rows of this run
+    Predict = Func_getPredictor(Condition, Variant, Epoch, Engine, Physical, ChunkSize)
+    ProgressPath = Func_progressPath(OutputFile)
+
+    Mode = 'wb'
+    if Resume and os.path.isfile(ProgressPath) and os.path.isfile(OutputFile):
+        with open(ProgressPath) as File:
+            Progress = json.load(File)
+        if Progress['InputFile'] != os.path.abspath(InputFile):
+            raise ValueError('Progress file ' + ProgressPath + ' belongs to ' + Progress['InputFile'])
+
+        # Rows written after the last stored progress are dropped and predicted again
+        with open(OutputFile, 'r+b') as File:
+            File.truncate(Progress['OutputByte'])
+        [StartRow, StartByte, Mode] = [Progress['Rows'], Progress['InputByte'], 'ab']
+        Log.write('Resume at row ' + str(StartRow) + ' (byte ' + str(StartByte) + ')\n')
+
+    TotalBytes = os.path.getsize(InputFile)
+    Rows = 0
+    Start = time.time()
+    LastReport = Start
+
+    with open(OutputFile, Mode) as Output:
+        if Mode == 'wb':
+            Output.write((','.join(OutputLabels) + '\n').encode('utf-8'))
+
+        for (RowOffset, EndByte, InputMatrix) in Func_readBlocks(InputFile, Variant, BlockSize, StartRow, StartByte):
+            OutputMatrix = Predict(InputMatrix)
+
+            with span('Streaming.write'):
+                Buffer = io.StringIO()
+                np.savetxt(Buffer, OutputMatrix, delimiter=',', fmt='%.9g')
+                Output.write(Buffer.getvalue().encode('utf-8'))
+                Output.flush()
+
+            Rows += InputMatrix.shape[0]
+            # Replaced in one step, an interrupt leaves the previous progress
+            TemporaryPath = ProgressPath + '.' + str(os.getpid()) + '.tmp'
+            with open(TemporaryPath, 'w') as File:
+                json.dump({'InputFile': os.path.abspath(InputFile), 'InputByte': EndByte,
+                           'Rows': RowOffset + InputMatrix.shape[0], 'OutputByte': Output.tell()}, File)
+            os.replace(TemporaryPath, ProgressPath)
+
+            Now = time.time()
+            if ProgressPeriod is not None and Now - LastReport >= ProgressPeriod:
+                Log.write('{} rows ({:.1f} %) - {:.0f} rows/s, {:.1f} MB/s\n'.format(
+                    RowOffset + InputMatrix.shape[0], 100 * EndByte / max(TotalBytes, 1), Rows / (Now - Start),
+                    (EndByte - (StartByte or 0)) / 1e6 / (Now - Start)))
+                LastReport = Now
+
+    Duration = max(time.time() - Start, 1e-9)
+    Log.write('{} rows predicted in {:.2f} seconds ({:.0f} rows/s)\n'.format(Rows, Duration, Rows / Duration))
+
+    return Rows
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Condition', type=str, default='Single')
+    parser.add_argument('--Variant', type=int, default=1)
+    parser.add_argument('--Epoch', type=int, default=None)
+    parser.add_argument('--InputFile', type=str, required=True)
+    parser.add_argument('--OutputFile', type=str, default='output.csv')
+    parser.add_argument('--Engine', type=str, default='numpy', choices=['numpy', 'torch'])
+    parser.add_argument('--Physical', action='store_true')
+    parser.add_argument('--BlockSize', type=float, default=8, help='MB per block')
+    parser.add_argument('--ChunkSize', type=int, default=4096)
+    parser.add_argument('--StartRow', type=int, default=0)
+    parser.add_argument('--StartByte', type=int, default=None)
+    parser.add_argument('--Resume', action='store_true')
+    parser.add_argument('--ProgressPeriod', type=float, default=5)
+    args = parser.parse_args()
+
+    Func_streamPredict(args.Condition, args.Variant, args.InputFile, args.OutputFile, Epoch=args.Epoch,
+                       Engine=args.Engine, Physical=args.Physical, BlockSize=int(args.BlockSize * 2 ** 20),
+                       ChunkSize=args.ChunkSize, StartRow=args.StartRow, StartByte=args.StartByte,
+                       Resume=args.Resume, ProgressPeriod=args.ProgressPeriod)
@@ -0,0 +1,366 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Interpolation tables of the networks over the normalised input box [0, 1]^D (D = 3 for Variant 1, 4 otherwise).
+# Func_buildSurrogate() evaluates a model once on a rectilinear grid and writes the 17 outputs of every node as
+# float32 table A05_Cache/Surrogates/<Condition>_Variant_<V>.npy (shape: points per axis + (17,)), the axes, the
+# scalers and the errors go to the .json file next to it. Surrogate maps the table read-only (np.memmap) and
+# interpolates a batch of inputs with a few fancy-indexed reads per sample, without torch and without the model:
+#   'linear'   multilinear, 2^D table rows per sample
+#   'cubic'    Catmull-Rom (cubic Hermite with central differences, also on non-uniform axes), 4^D rows per sample
+# Inputs outside of the box are clipped to [0, 1], the box is the range of the training data.
+# Adaptive=True moves the Points nodes of every axis towards the regions where the multilinear interpolation
+# error on random samples is largest (Func_adaptiveAxes()), the grid stays rectilinear.
+# The maximum and the rms error of both methods against the network (normalised outputs, random samples in the
+# box and the midpoints of the grid cells) are measured during the build and stored in the .json file. The maximum
+# is a sampled estimate, it is multiplied with ErrorMargin before it is compared with a tolerance. With MaxError the
+# build is repeated with more points per axis (estimated from the error order of the method) until the estimated
+# maximum error of Method is below MaxError or the grid would exceed MaxNodes. Surrogate warns when the estimated
+# error of the method used for a prediction exceeds its MaxError (default: the target of the build, otherwise
+# MaxError_Default). predict() uses the Method of the build unless another method is given.
+# The .json file is replaced before the table and Surrogate checks that both have the same shape.
+#
+#   Table = Surrogate('A05_Cache/Surrogates/Single_Variant_1.npy')
+#   Parameters = Table.predict(InputMatrix, Physical=True)     # N x 17, Method of the build
+#
+# Run from the folder Python/:
+#   python -m A01_Functions.Surrogate --Condition Single --Variant 1 [--Points 65] [--Adaptive]
+#          [--MaxError 0.01 --Method cubic]
+#   python -m A01_Functions.Surrogate --All
+
+import os
+import json
+import time
+import itertools
+import warnings
+import numpy as np
+from argparse import ArgumentParser
+from A01_Functions.Normalisation import UnityScaler
+
+SurrogateFolder_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A05_Cache',
+                                       'Surrogates')
+
+# Points per axis: 65^3 and 25^4 nodes are about 19 MB and 27 MB
+Points_Default = {3: 65, 4: 25}
+
+# Largest grid of the refinement: 2^22 nodes are about 285 MB
+MaxNodes_Default = 2 ** 22
+
+# Tolerated maximum error (normalised outputs) of a table built without a target
+MaxError_Default = 0.01
+
+# Cell midpoints added to the random samples of the error estimate
+MaxMidpoints_Default = 2 ** 18
+
+# The sampled maximum error times ErrorMargin is compared with MaxError
+ErrorMargin = 1.25
+
+Methods = ['linear', 'cubic']
+
+# Order of the interpolation error in the node spacing h
+ErrorOrders = {'linear': 2, 'cubic': 3}
+
+
+def Func_axisWeights(Axis, x, Method='linear'):
+    # Table indices and weights (N x 2 or N x 4) of the coordinates x on one axis
+    n = len(Axis)
+    i = np.clip(np.searchsorted(Axis, x, side='right') - 1, 0, n - 2)
+    h = Axis[i + 1] - Axis[i]
+    t = (x - Axis[i]) / h
+
+    if Method == 'linear':
+        return np.stack([i, i + 1], axis=1), np.stack([1 - t, t], axis=1)
+
+    if Method != 'cubic':
+        raise ValueError('Unknown method ' + str(Method) + ', use one of ' + str(Methods))
+
+    # Hermite basis on [x_i, x_i+1], tangents from the neighbours (one-sided at the border)
+    Before = np.maximum(i - 1, 0)
+    After = np.minimum(i + 2, n - 1)
+    h00 = 2 * t ** 3 - 3 * t ** 2 + 1
+    h10 = t ** 3 - 2 * t ** 2 + t
+    h01 = -2 * t ** 3 + 3 * t ** 2
+    h11 = t ** 3 - t ** 2
+    a = h / (Axis[i + 1] - Axis[Before])
+    b = h / (Axis[After] - Axis[i])
+
+    return (np.stack([Before, i, i + 1, After], axis=1),
+            np.stack([-h10 * a, h00 - h11 * b, h01 + h10 * a, h11 * b], axis=1))
+
+
+def Func_interpolate(Axes, Table, InputMatrix, Method='linear'):
+    # N x 17 values of a table (nodes x 17, C order of the axes) at normalised inputs
+    InputMatrix = np.clip(np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64)), 0, 1)
+    Strides = np.cumprod([1] + [len(Axis) for Axis in Axes[:0:-1]])[::-1]
+
+    Indices = []
+    Weights = []
+    for Dimension, Axis in enumerate(Axes):
+        [Index, Weight] = Func_axisWeights(Axis, InputMatrix[:, Dimension], Method)
+        Indices.append(Index * Strides[Dimension])
+        Weights.append(Weight)
+
+    OutputMatrix = np.zeros((InputMatrix.shape[0], Table.shape[1]))
+    for Corner in itertools.product(range(Indices[0].shape[1]), repeat=len(Axes)):
+        Row = Indices[0][:, Corner[0]].copy()
+        Weight = Weights[0][:, Corner[0]].copy()
+        for Dimension in range(1, len(Axes)):
+            Row += Indices[Dimension][:, Corner[Dimension]]
+            Weight *= Weights[Dimension][:, Corner[Dimension]]
+        OutputMatrix += Weight[:, np.newaxis] * Table[Row]
+
+    return OutputMatrix.astype(np.float32)
+
+
+def Func_gridTable(model, Axes, Table=None, ChunkSize=65536):
+    # Model outputs of all nodes of the grid (nodes x 17), written into Table if given
+    Shape = tuple(len(Axis) for Axis in Axes)
+    NumNodes = int(np.prod(Shape))
+    Table = np.empty((NumNodes, 17), dtype=np.float32) if Table is None else Table
+
+    for Start in range(0, NumNodes, ChunkSize):
+        Coordinates = np.unravel_index(np.arange(Start, min(Start + ChunkSize, NumNodes)), Shape)
+        Nodes = np.stack([Axis[Index] for Axis, Index in zip(Axes, Coordinates)], axis=1)
+        Table[Start:Start + len(Nodes)] = model(Nodes.astype(np.float32))
+
+    return Table
+
+
+def Func_adaptiveAxes(model, InputSize, Points, Iterations=4, Samples=20000, Seed=0, Uniform=0.3):
+    # Axes with Points nodes each, denser where the network bends. The error of the multilinear interpolation is
+    # about h^2 * curvature, so the nodes of an axis are placed with a density proportional to the square root of
+    # the curvature (estimated in 2 * Points bins from the error on random samples, mixed with the share Uniform of
+    # a uniform density). Returns the axes with the lowest maximum error of all iterations, the uniform grid included
+    Generator = np.random.RandomState(Seed)
+    InputMatrix = Generator.rand(Samples, InputSize)
+    Reference = model(InputMatrix.astype(np.float32))
+    Bins = 2 * Points
+    Centers = (np.arange(Bins) + 0.5) / Bins
+
+    Axes = [np.linspace(0, 1, Points) for _ in range(InputSize)]
+    Best = None
+    for Iteration in range(Iterations + 1):
+        Error = np.abs(Func_interpolate(Axes, Func_gridTable(model, Axes), InputMatrix) - Reference).max(axis=1)
+        if Best is None or Error.max() < Best[0]:
+            Best = (Error.max(), Axes)
+        if Iteration == Iterations:
+            break
+
+        NewAxes = []
+        for Dimension, Axis in enumerate(Axes):
+            Bin = np.minimum((InputMatrix[:, Dimension] * Bins).astype(int), Bins - 1)
+            MeanSquaredError = np.bincount(Bin, Error ** 2, minlength=Bins) / \
+                np.maximum(np.bincount(Bin, minlength=Bins), 1)
+            Spacing = np.interp(Centers, (Axis[1:] + Axis[:-1]) / 2, np.diff(Axis))
+            Density = (np.sqrt(MeanSquaredError) / Spacing ** 2) ** 0.5
+            Density = Uniform + (1 - Uniform) * Density / max(Density.mean(), 1e-12)
+            Distribution = np.concatenate([[0], np.cumsum(Density)]) / Density.sum()
+            NewAxes.append(np.interp(np.linspace(0, 1, Points), Distribution, np.linspace(0, 1, Bins + 1)))
+        Axes = NewAxes
+
+    return Best[1]
+
+
+def Func_cellMidpoints(Axes, MaxCells=MaxMidpoints_Default, Seed=1):
+    # Midpoints of all grid cells (of MaxCells random cells for larger grids), the multilinear error of a cell is
+    # largest near its midpoint
+    Cells = tuple(len(Axis) - 1 for Axis in Axes)
+    NumCells = int(np.prod(Cells))
+    Index = np.arange(NumCells) if NumCells <= MaxCells else \
+        np.random.RandomState(Seed).choice(NumCells, MaxCells, replace=False)
+
+    return np.stack([(Axis[Cell] + Axis[Cell + 1]) / 2 for Axis, Cell in zip(Axes, np.unravel_index(Index, Cells))],
+                    axis=1)
+
+
+def Func_surrogateError(Axes, Table, model, InputSize, Samples=100000, Seed=1, ChunkSize=65536):
+    # Maximum and rms error of both methods against the model on random inputs and the cell midpoints (normalised
+    # outputs). The maximum is a sampled estimate, i.e. a lower bound of the true maximum
+    InputMatrix = np.concatenate([np.random.RandomState(Seed).rand(Samples, InputSize),
+                                  Func_cellMidpoints(Axes, Seed=Seed)])
+    Errors = {}
+
+    for Method in Methods:
+        MaxError = np.zeros(17)
+        SquaredError = 0.0
+        for Start in range(0, len(InputMatrix), ChunkSize):
+            Chunk = InputMatrix[Start:Start + ChunkSize]
+            Difference = Func_interpolate(Axes, Table, Chunk, Method) - model(Chunk.astype(np.float32))
+            MaxError = np.maximum(MaxError, np.abs(Difference).max(axis=0))
+            SquaredError += float((Difference.astype(np.float64) ** 2).sum())
+
+        Errors[Method] = {'MaxError': float(MaxError.max()),
+                          'RMSError': (SquaredError / (len(InputMatrix) * 17)) ** 0.5,
+                          'MaxErrorPerOutput': MaxError.tolist()}
+
+    return Errors
+
+
+def Func_surrogatePath(Condition, Variant, Folder=SurrogateFolder_Default):
+    return os.path.join(Folder, Condition + '_Variant_' + str(Variant) + '.npy')
+
+
+def Func_nextPoints(Points, Error, MaxError, Order, InputSize, MaxNodes=MaxNodes_Default):
+    # Points per axis for the next refinement, the intervals grow with the error order (at least by a quarter),
+    # limited to MaxNodes nodes
+    Factor = max((Error / MaxError) ** (1 / Order), 1.25)
+    Points = min(int(np.ceil((Points - 1) * Factor)) + 1, int(np.floor(MaxNodes ** (1 / InputSize) + 1e-9)))
+
+    return Points
+
+
+def Func_buildSurrogate(Condition, Variant, Points=None, Adaptive=False, Epoch=None, Folder=SurrogateFolder_Default,
+                        Samples=100000, Seed=0, MaxError=None, Method='cubic', MaxNodes=MaxNodes_Default):
+    # Writes the table of a Condition/Variant (model: exported .npz weights), returns the path of the table.
+    # MaxError: target maximum error of Method, Points is the start of the refinement
+    from A01_Functions.ModelRegistry import Func_loadNumpyModel
+
+    if Method not in Methods:
+        raise ValueError('Unknown method ' + str(Method) + ', use one of ' + str(Methods))
+
+    model = Func_loadNumpyModel(Condition, Variant, Epoch)
+    InputSize = model.InputSize
+    Points = Points_Default[InputSize] if Points is None else Points
+
+    PATH = Func_surrogatePath(Condition, Variant, Folder)
+    os.makedirs(Folder, exist_ok=True)
+    # Written under a temporary name, a running Surrogate keeps the old table until it is opened again
+    TemporaryPath = PATH[:-len('.npy')] + '.' + str(os.getpid()) + '.tmp.npy'
+
+    Start = time.time()
+    Previous = None
+    while True:
+        if Adaptive:
+            Axes = Func_adaptiveAxes(model, InputSize, Points, Seed=Seed)
+        else:
+            Axes = [np.linspace(0, 1, Points) for _ in range(InputSize)]
+        Shape = tuple(len(Axis) for Axis in Axes)
+
+        Table = np.lib.format.open_memmap(TemporaryPath, mode='w+', dtype=np.float32, shape=Shape + (17,))
+        Func_gridTable(model, Axes, Table.reshape(-1, 17))
+        Table.flush()
+        Errors = Func_surrogateError(Axes, Table.reshape(-1, 17), model, InputSize, Samples, Seed + 1)
+        del Table
+
+        Error = ErrorMargin * Errors[Method]['MaxError']
+        if MaxError is None or Error <= MaxError:
+            break
+        # Order of the method, once two grids are measured the observed order (the network is not smooth everywhere)
+        Order = ErrorOrders[Method]
+        if Previous is not None and Error < Previous[1]:
+            Order = min(max(np.log(Previous[1] / Error) / np.log((Points - 1) / (Previous[0] - 1)), 1), Order)
+        Previous = (Points, Error)
+        NextPoints = Func_nextPoints(Points, Error, MaxError, Order, InputSize, MaxNodes)
+        if NextPoints <= Points:
+            warnings.warn('Surrogate ' + Condition + ' - Variant ' + str(Variant) + ': estimated max. error ' + Method +
+                          ' {:.2e} above the target {:.2e} with the largest grid of {} nodes'.format(
+                              Error, MaxError, MaxNodes))
+            break
+        print('Surrogate ' + Condition + ' - Variant ' + str(Variant) + ': ' + str(Points) + ' points per axis, '
+              'estimated max. error ' + Method + ' {:.2e} above {:.2e}, next {} points'.format(Error, MaxError,
+                                                                                                 NextPoints))
+        Points = NextPoints
+
+    Index = {'Condition': Condition, 'Variant': Variant, 'Epoch': model.Epoch, 'Adaptive': Adaptive,
+             'Axes': [Axis.tolist() for Axis in Axes], 'Errors': Errors, 'Samples': Samples,
+             'MaxError': MaxError, 'Method': Method, 'ErrorMargin': ErrorMargin,
+             'InputMin': model.InputScaler.min_x.tolist(), 'InputMax': model.InputScaler.max_x.tolist(),
+             'OutputMin': model.OutputScaler.min_x.tolist(), 'OutputMax': model.OutputScaler.max_x.tolist()}
+    IndexPath = PATH[:-len('.npy')] + '.json'
+    with open(IndexPath + '.' + str(os.getpid()) + '.tmp', 'w') as File:
+        json.dump(Index, File, indent=2)
+    os.replace(IndexPath + '.' + str(os.getpid()) + '.tmp', IndexPath)
+    os.replace(TemporaryPath, PATH)
+
+    print('Surrogate ' + Condition + ' - Variant ' + str(Variant) + ': ' + 'x'.join(str(n) for n in Shape) +
+          ' nodes in {:.1f} seconds, sampled max. error linear {:.2e}, cubic {:.2e}'.format(
+              time.time() - Start, Errors['linear']['MaxError'], Errors['cubic']['MaxError']))
+
+    return PATH
+
+
+class Surrogate:
+
+    def __init__(self, PATH, MaxError=None):
+        # MaxError: tolerated maximum error, default: the target of the build or MaxError_Default
+        with open(PATH[:-len('.npy')] + '.json') as File:
+            self.Index = json.load(File)
+
+        self.Table = np.load(PATH, mmap_mode='r')
+        self.Axes = [np.asarray(Axis) for Axis in self.Index['Axes']]
+        if self.Table.shape[:-1] != tuple(len(Axis) for Axis in self.Axes):
+            raise ValueError(PATH + ': the table does not match the axes of the .json file, open it again after the '
+                             'build')
+        self.Rows = self.Table.reshape(-1, self.Table.shape[-1])
+        self.InputSize = len(self.Axes)
+        self.Errors = self.Index['Errors']
+        if MaxError is None:
+            MaxError = self.Index.get('MaxError') or MaxError_Default
+        self.MaxError = MaxError
+        self.Method = self.Index.get('Method', 'cubic')
+        self.Warned = set()
+        self.InputScaler = UnityScaler(self.Index['InputMin'], self.Index['InputMax'])
+        self.OutputScaler = UnityScaler(self.Index['OutputMin'], self.Index['OutputMax'])
+
+    def predict(self, InputMatrix, Method=None, Physical=False, ChunkSize=65536):
+        # N x 17 interpolated outputs, Method=None: method of the build (default cubic).
+        # Physical: inputs and outputs in absolute units
+        Method = self.Method if Method is None else Method
+        InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64))
+        if InputMatrix.shape[1] != self.InputSize:
+            raise ValueError('The surrogate expects ' + str(self.InputSize) + ' input columns, got ' +
+                             str(InputMatrix.shape[1]))
+        Error = ErrorMargin * self.Errors[Method]['MaxError'] if Method in self.Errors else 0
+        if Error > self.MaxError and Method not in self.Warned:
+            self.Warned.add(Method)
+            warnings.warn('Surrogate ' + self.Index['Condition'] + ' - Variant ' + str(self.Index['Variant']) +
+                          ': estimated max. error ' + Method + ' {:.2e} exceeds {:.2e}, rebuild with MaxError'.format(
+                              Error, self.MaxError))
+        if Physical:
+            InputMatrix = self.InputScaler.normalise(InputMatrix)
+
+        OutputMatrix = np.empty((InputMatrix.shape[0], 17), dtype=np.float32)
+        for Start in range(0, InputMatrix.shape[0], ChunkSize):
+            OutputMatrix[Start:Start + ChunkSize] = Func_interpolate(self.Axes, self.Rows,
+                                                                     InputMatrix[Start:Start + ChunkSize], Method)
+
+        return self.OutputScaler.denormalise(OutputMatrix) if Physical else OutputMatrix
+
+    def __call__(self, InputMatrix):
+        return self.predict(InputMatrix)
+
+
+def Func_loadSurrogate(Condition, Variant, Folder=SurrogateFolder_Default, MaxError=None):
+    return Surrogate(Func_surrogatePath(Condition, Variant, Folder), MaxError)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Condition', type=str, default='Single')
+    parser.add_argument('--Variant', type=int, default=1)
+    parser.add_argument('--All', action='store_true', help='Tables of all published Conditions/Variants')
+    parser.add_argument('--Points', type=int, default=None, help='Points per axis, default: 65 (3 inputs), '
+                                                                 '25 (4 inputs)')
+    parser.add_argument('--Adaptive', action='store_true')
+    parser.add_argument('--MaxError', type=float, default=None, help='Target max. error (normalised outputs), '
+                                                                      'the points per axis are raised until it is met')
+    parser.add_argument('--Method', type=str, default='cubic', choices=Methods, help='Method of --MaxError')
+    parser.add_argument('--MaxNodes', type=int, default=MaxNodes_Default)
+    parser.add_argument('--Samples', type=int, default=100000, help='Random inputs of the error estimate')
+    parser.add_argument('--Folder', type=str, default=SurrogateFolder_Default)
+    args = parser.parse_args()
+
+    if args.All:
+        from A01_Functions.ModelRegistry import DefaultEpochs
+        Models = list(DefaultEpochs.keys())
+    else:
+        Models = [(args.Condition, args.Variant)]
+
+    for (Condition, Variant) in Models:
+        Func_buildSurrogate(Condition, Variant, args.Points, args.Adaptive, Folder=args.Folder, Samples=args.Samples,
+                            MaxError=args.MaxError, Method=args.Method, MaxNodes=args.MaxNodes)
@@ -0,0 +1,231 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Training with a validation split and early stopping, the selected epoch goes into the model manifest.
+# The stimuli of the TrainData_*.csv files (column Spektrum, one row per stimulus otherwise) are split into
+#   'holdout'   HoldoutFraction of the stimuli for validation, the rest for training
+#   'loo'       leave one stimulus out: one fold per stimulus, every stimulus is validated once
+# Every fold is trained until the validation MSE did not improve by MinDelta for Patience epochs. The training
+# and validation metrics of every epoch are written to A04_Results_Training/02_Data/<Name>_Validation.csv.
+# Selected epoch: best validation epoch of the holdout split, median of the best epochs of the LOO folds.
+# With the seven stimuli of the training data every row counts, so the final model is trained again on all
+# stimuli for the selected number of epochs (same seed). Its checkpoint (..._Validated_epoch=N.ckpt, the
+# published checkpoints are not overwritten) and .npz bundle are written into the registry folders and the
+# epoch is recorded in A03_Models/FF/BestEpochs.json, which Func_loadModel(), Func_loadNumpyModel(), the
+# prediction cache and the fused inference read when no epoch is given.
+#
+# Run from the folder Python/:
+#   python Main.py --Engine Validation --Variant 1 --DataPath A00_Data/TrainData_Individual_Subject.csv
+#          [--Split loo] [--Patience 200]
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from argparse import Namespace
+from A01_Functions.ReadData import Func_readDataIn, ConditionDataPaths
+from A01_Functions.FastTraining import Func_saveCheckpoint
+from A01_Functions.ModelRegistry import Func_getModelFolder, Func_getWeightsPath, Func_updateManifest, \
+    ManifestPath
+from A01_Functions.Profiling import span
+import A02_Networks.FeedForward as FF_Class
+
+StimulusColumn = 'Spektrum'
+ValidationMetrics = ['Fold', 'Epoch', 'TrainMSE', 'ValidationMSE', 'ValidationMAE']
+
+
+def Func_conditionFromDataPath(DataPath):
+    # Condition of a training data file of ConditionDataPaths
+    for Condition, PATH in ConditionDataPaths.items():
+        if os.path.abspath(PATH) == os.path.abspath(DataPath):
+            return Condition
+
+    raise ValueError('No Condition for ' + DataPath + ', use one of ' + str(list(ConditionDataPaths.values())) +
+                     ' or give the Condition')
+
+
+def Func_stimulusGroups(DataPath, NumRows):
+    # Stimulus of every row: column Spektrum of .csv files, otherwise every row is its own stimulus
+    if DataPath.lower().endswith('.csv'):
+        Header = pd.read_csv(DataPath, nrows=0).columns
+        if StimulusColumn in Header:
+            return pd.read_csv(DataPath, usecols=[StimulusColumn])[StimulusColumn].astype(str).values
+
+    return np.arange(NumRows).astype(str)
+
+
+def Func_splitData(Groups, Split='holdout', HoldoutFraction=0.2, Seed=0):
+    # List of folds (Name, TrainIndex, ValidationIndex), rows of one stimulus are never split
+    Stimuli = list(dict.fromkeys(Groups))
+    if len(Stimuli) < 2:
+        raise ValueError('A validation split needs at least 2 stimuli, the data has ' + str(len(Stimuli)))
+
+    if Split == 'loo':
+        ValidationSets = [[Stimulus] for Stimulus in Stimuli]
+    elif Split == 'holdout':
+        Order = np.random.RandomState(Seed).permutation(len(Stimuli))
+        NumValidation = min(max(int(round(HoldoutFraction * len(Stimuli))), 1), len(Stimuli) - 1)
+        ValidationSets = [[Stimuli[Index] for Index in Order[:NumValidation]]]
+    else:
+        raise ValueError('Unknown split ' + str(Split) + ', use holdout or loo')
+
+    Folds = []
+    for ValidationSet in ValidationSets:
+        Validation = np.isin(Groups, ValidationSet)
+        Folds.append(('+'.join(ValidationSet), np.where(~Validation)[0], np.where(Validation)[0]))
+
+    return Folds
+
+
+class EarlyStopping:
+
+    def __init__(self, Patience=200, MinDelta=0.0):
+        self.Patience = Patience
+        self.MinDelta = MinDelta
+        self.BestEpoch = None
+        self.BestLoss = np.inf
+
+    def update(self, Epoch, Loss):
+        # Returns True when the loss did not improve for Patience epochs
+        if Loss < self.BestLoss - self.MinDelta:
+            self.BestEpoch = Epoch
+            self.BestLoss = Loss
+
+        return Epoch - self.BestEpoch >= self.Patience
+
+
+def Func_trainFold(hparams, InputMatrix, TargetMatrix, TrainIndex, ValidationIndex=None, Epoch=4000, Patience=200,
+                   MinDelta=0.0, Seed=0, FoldName='', Writer=None):
+    # Trains one FeedForward on the TrainIndex rows for at most Epoch epochs, same loop as Func_runFastTraining().
+    # With ValidationIndex the training stops early, the metrics of every epoch are written with Writer.
+    # Returns the model, its optimizer, the global step and the EarlyStopping state
+    torch.manual_seed(Seed)
+
+    Model = FF_Class.FeedForward(hparams)
+    Model.train()
+    Optimizer = optim.Adam(Model.parameters(), lr=hparams.learningRate)
+    criterion = nn.MSELoss()
+
+    TrainInput = InputMatrix[TrainIndex]
+    TrainTarget = TargetMatrix[TrainIndex]
+    NumSamples = TrainInput.shape[0]
+    # The split can leave fewer rows than a batch
+    BatchSize = min(hparams.BatchSize, NumSamples)
+    StepsPerEpoch = NumSamples // BatchSize
+
+    Stopping = EarlyStopping(Patience, MinDelta)
+    GlobalStep = 0
+
+    for CurrentEpoch in range(Epoch):
+        Permutation = torch.randperm(NumSamples)
+        TrainLoss = 0.0
+
+        for Step in range(StepsPerEpoch):
+            Index = Permutation[Step * BatchSize:(Step + 1) * BatchSize]
+
+            with span('Validation.step'):
+                Optimizer.zero_grad()
+                loss = criterion(Model(TrainInput[Index]), TrainTarget[Index])
+                loss.backward()
+                Optimizer.step()
+            GlobalStep += 1
+            TrainLoss += loss.item() / StepsPerEpoch
+
+        if ValidationIndex is None:
+            continue
+
+        with span('Validation.evaluate'), torch.no_grad():
+            Difference = Model(InputMatrix[ValidationIndex]) - TargetMatrix[ValidationIndex]
+            ValidationMSE = float((Difference ** 2).mean())
+            ValidationMAE = float(Difference.abs().mean())
+
+        if Writer is not None:
+            Writer.write('{},{},{:.9g},{:.9g},{:.9g}\n'.format(FoldName, CurrentEpoch, TrainLoss, ValidationMSE,
+                                                               ValidationMAE))
+
+        if Stopping.update(CurrentEpoch, ValidationMSE):
+            break
+
+    return Model, Optimizer, GlobalStep, Stopping
+
+
+def Func_runValidationTraining(Condition, Variant, Epoch=4000, numHiddenNeuron_1=40, numHiddenNeuron_2=80,
+                               BatchSize=7, learningRate=0.001, DataPath=None, Split='holdout', HoldoutFraction=0.2,
+                               Patience=200, MinDelta=0.0, Seed=0, DataFolder='A04_Results_Training/02_Data/',
+                               UpdateManifest=True):
+    # Epoch: maximum number of epochs of every fold. Returns the manifest entry of the selected checkpoint
+    from A01_Functions.ExportWeights import Func_exportCheckpoint
+
+    DataPath = ConditionDataPaths[Condition] if DataPath is None else DataPath
+
+    hparams = Namespace(layer_1_dim=numHiddenNeuron_1,
+                        layer_2_dim=numHiddenNeuron_2,
+                        Variant=Variant,
+                        BatchSize=BatchSize,
+                        learningRate=learningRate,
+                        InputSize=3 if Variant == 1 else 4,
+                        DataPath=DataPath)
+
+    [InputMatrix, TargetMatrix] = Func_readDataIn(Variant, DataPath)
+    Groups = Func_stimulusGroups(DataPath, InputMatrix.shape[0])
+    if len(Groups) != InputMatrix.shape[0]:
+        raise ValueError(DataPath + ': ' + str(len(Groups)) + ' stimulus labels for ' + str(InputMatrix.shape[0]) +
+                         ' rows')
+    Folds = Func_splitData(Groups, Split, HoldoutFraction, Seed)
+
+    NameStr = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_Hidden_' + \
+              str(numHiddenNeuron_1) + '_' + str(numHiddenNeuron_2) + '_' + Condition + '_' + Split
+    os.makedirs(DataFolder, exist_ok=True)
+
+    Start = time.time()
+    Results = []
+    with open(os.path.join(DataFolder, NameStr + '_Validation.csv'), 'w') as Writer:
+        Writer.write(','.join(ValidationMetrics) + '\n')
+        for (FoldName, TrainIndex, ValidationIndex) in Folds:
+            Stopping = Func_trainFold(hparams, InputMatrix, TargetMatrix, TrainIndex, ValidationIndex, Epoch,
+                                      Patience, MinDelta, Seed, FoldName, Writer)[3]
+            Results.append((Stopping.BestEpoch, Stopping.BestLoss))
+            print('Validation fold ' + FoldName + ': best epoch ' + str(Stopping.BestEpoch) +
+                  ', validation MSE {:.9f}'.format(Stopping.BestLoss))
+
+    BestEpoch = int(np.median([Result[0] for Result in Results]))
+    ValidationLoss = float(np.mean([Result[1] for Result in Results]))
+
+    # Final model on all stimuli, trained for the selected epochs (0-based epoch -> BestEpoch + 1 epochs)
+    [Model, Optimizer, GlobalStep, _] = Func_trainFold(hparams, InputMatrix, TargetMatrix,
+                                                       np.arange(InputMatrix.shape[0]), Epoch=BestEpoch + 1,
+                                                       Seed=Seed)
+
+    FileName = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_Validated_epoch=' + \
+               str(BestEpoch) + '.ckpt'
+    CheckpointPath = os.path.join(Func_getModelFolder(Condition, Variant), FileName)
+    os.makedirs(os.path.dirname(CheckpointPath), exist_ok=True)
+    Func_saveCheckpoint(CheckpointPath, Model, Optimizer, hparams, BestEpoch, GlobalStep)
+
+    Entry = {'Epoch': BestEpoch,
+             'File': FileName,
+             'ValidationLoss': ValidationLoss,
+             'Split': Split,
+             'Folds': len(Folds),
+             'Patience': Patience,
+             'Seed': Seed,
+             'DataPath': DataPath}
+
+    if UpdateManifest:
+        Func_updateManifest(Condition, Variant, Entry)
+        Func_exportCheckpoint(CheckpointPath, Func_getWeightsPath(Condition, Variant), Condition)
+        print('Manifest ' + ManifestPath + ': ' + Condition + ' - Variant ' + str(Variant) + ' -> epoch ' +
+              str(BestEpoch))
+
+    print('Validation training: ' + str(len(Folds)) + ' folds in {:.2f} seconds, selected epoch {}, '
+          'validation MSE {:.9f}'.format(time.time() - Start, BestEpoch, ValidationLoss))
+
+    return Entry
@@ -0,0 +1,256 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Pool of worker processes for predictions on many cores with one copy of the weights.
+# The parent process writes the weights of all published Condition/Variant models once into a single file
+# (SharedWeights.bin + SharedWeights.json, float32, 64 byte aligned). Every worker maps this file read-only
+# (np.memmap) and computes the forward pass with numpy (NumpyInference.py), so the workers neither import
+# torch/Lightning nor load checkpoints, and the pages of the weights are shared by all processes through the
+# page cache instead of being copied per worker. (multiprocessing.shared_memory needs Python 3.8, the file
+# mapping also works with Python 3.7.)
+# A batch is split into chunks of ChunkSize rows, which are distributed over the workers.
+#
+#   with WorkerPool(NumWorkers=4) as Pool:
+#       Parameters = Pool.predict('Multi', 3, InputMatrix, Physical=True)     # N x 17
+#
+# Run from the folder Python/ to measure the throughput and the memory of the workers:
+#   python -m A01_Functions.WorkerPool --Workers 1 2 4 --Rows 1000000
+
+import os
+import json
+import time
+import multiprocessing
+import numpy as np
+from argparse import ArgumentParser
+from A01_Functions.Normalisation import UnityScaler
+
+WeightPath_Default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A05_Cache',
+                                  'SharedWeights.bin')
+
+# Offsets of the arrays in the weight file are multiples of Alignment bytes
+Alignment = 64
+
+# Models of the worker process, filled by Func_attachWorker()
+WorkerModels = {}
+
+
+def Func_writeWeightFile(PATH=WeightPath_Default, Models=None):
+    # Writes the weights of the (Condition, Variant) pairs (default: all published models) from their .npz
+    # bundles into one file, the index with offsets, shapes and scalers goes to <PATH without .bin>.json
+    from A01_Functions.ModelRegistry import DefaultEpochs, Func_loadNumpyModel, Func_getWeightsPath
+
+    Models = list(DefaultEpochs.keys()) if Models is None else Models
+    Index = {}
+    Arrays = []
+    Offset = 0
+
+    for (Condition, Variant) in Models:
+        model = Func_loadNumpyModel(Condition, Variant)
+        Entry = {'Condition': Condition, 'Variant': Variant, 'Epoch': model.Epoch,
+                 'Source': os.path.abspath(Func_getWeightsPath(Condition, Variant)), 'Layers': [],
+                 'InputMin': model.InputScaler.min_x.tolist(), 'InputMax': model.InputScaler.max_x.tolist(),
+                 'OutputMin': model.OutputScaler.min_x.tolist(), 'OutputMax': model.OutputScaler.max_x.tolist()}
+
+        for (Weight, Bias) in zip(model.Weights, model.Biases):
+            Layer = []
+            for Array in [Weight, Bias]:
+                Array = np.ascontiguousarray(Array, dtype=np.float32)
+                Layer.append({'Offset': Offset, 'Shape': list(Array.shape)})
+                Arrays.append((Offset, Array))
+                Offset += -(-Array.nbytes // Alignment) * Alignment
+            Entry['Layers'].append(Layer)
+
+        Index[Condition + '_' + str(Variant)] = Entry
+
+    os.makedirs(os.path.dirname(os.path.abspath(PATH)), exist_ok=True)
+    TemporaryPath = PATH + '.' + str(os.getpid()) + '.tmp'
+    Memmap = np.memmap(TemporaryPath, dtype=np.uint8, mode='w+', shape=(max(Offset, 1),))
+    for (Start, Array) in Arrays:
+        Memmap[Start:Start + Array.nbytes] = np.frombuffer(Array.tobytes(), dtype=np.uint8)
+    Memmap.flush()
+    del Memmap
+    os.replace(TemporaryPath, PATH)
+
+    IndexPath = os.path.splitext(PATH)[0] + '.json'
+    TemporaryPath = IndexPath + '.' + str(os.getpid()) + '.tmp'
+    with open(TemporaryPath, 'w') as File:
+        json.dump({'Size': Offset, 'Models': Index}, File, indent=2)
+    os.replace(TemporaryPath, IndexPath)
+
+    return PATH
+
+
+class MappedFeedForward:
+    # NumpyFeedForward with the weights as read-only views into the mapped weight file
+
+    def __init__(self, Memmap, Entry):
+        self.Weights = []
+        self.Biases = []
+        for (Weight, Bias) in Entry['Layers']:
+            self.Weights.append(Func_mappedArray(Memmap, Weight))
+            self.Biases.append(Func_mappedArray(Memmap, Bias))
+
+        self.Variant = Entry['Variant']
+        self.Epoch = Entry['Epoch']
+        self.InputSize = self.Weights[0].shape[0]
+        self.InputScaler = UnityScaler(Entry['InputMin'], Entry['InputMax'])
+        self.OutputScaler = UnityScaler(Entry['OutputMin'], Entry['OutputMax'])
+
+    def forward(self, x):
+        # Same layer sequence as FeedForward.forward(): no activation between hidden_layer_2 and output_Layer
+        x = np.asarray(x, dtype=np.float32)
+        x = x @ self.Weights[0] + self.Biases[0]
+        x = np.maximum(x, 0) @ self.Weights[1] + self.Biases[1]
+        x = np.maximum(x, 0) @ self.Weights[2] + self.Biases[2]
+        x = x @ self.Weights[3] + self.Biases[3]
+
+        return x
+
+    def __call__(self, x):
+        return self.forward(x)
+
+
+def Func_mappedArray(Memmap, Description):
+    Size = int(np.prod(Description['Shape'])) * 4
+    return np.frombuffer(Memmap, dtype=np.float32, count=Size // 4,
+                         offset=Description['Offset']).reshape(Description['Shape'])
+
+
+def Func_attachWorker(PATH):
+    # Initializer of the worker processes: maps the weight file, no copy of the weights
+    with open(os.path.splitext(PATH)[0] + '.json') as File:
+        Index = json.load(File)
+    Memmap = np.memmap(PATH, dtype=np.uint8, mode='r', shape=(Index['Size'],))
+
+    WorkerModels.clear()
+    for Entry in Index['Models'].values():
+        WorkerModels[(Entry['Condition'], Entry['Variant'])] = MappedFeedForward(Memmap, Entry)
+
+
+def Func_predictChunk(Task):
+    (Condition, Variant, InputMatrix, Physical) = Task
+    model = WorkerModels[(Condition, Variant)]
+
+    if Physical:
+        return model.OutputScaler.denormalise(model(model.InputScaler.normalise(InputMatrix)))
+    return model(InputMatrix)
+
+
+def Func_processMemory(Pid):
+    # Resident, shared and private memory (bytes) of a process from /proc (Linux), None elsewhere
+    try:
+        with open('/proc/' + str(Pid) + '/smaps_rollup') as File:
+            Values = {Line.split(':')[0]: int(Line.split()[1]) * 1024 for Line in File if Line.endswith('kB\n')}
+    except OSError:
+        return None
+
+    return {'RSS': Values.get('Rss', 0), 'PSS': Values.get('Pss', 0),
+            'Shared': Values.get('Shared_Clean', 0) + Values.get('Shared_Dirty', 0),
+            'Private': Values.get('Private_Clean', 0) + Values.get('Private_Dirty', 0)}
+
+
+class WorkerPool:
+
+    def __init__(self, NumWorkers=None, WeightPath=WeightPath_Default, ChunkSize=4096, Rebuild=False):
+        # The weight file is written when it is missing or older than the .npz bundles (Rebuild=True: always)
+        self.NumWorkers = os.cpu_count() if NumWorkers is None else NumWorkers
+        self.WeightPath = WeightPath
+        self.ChunkSize = ChunkSize
+
+        if Rebuild or Func_weightFileOutdated(WeightPath):
+            Func_writeWeightFile(WeightPath)
+
+        # One BLAS thread per worker, the parallelism comes from the processes
+        Environment = {Name: os.environ.get(Name) for Name in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                                                               'MKL_NUM_THREADS']}
+        os.environ.update({Name: '1' for Name in Environment})
+        try:
+            self.Pool = multiprocessing.get_context('spawn').Pool(self.NumWorkers, initializer=Func_attachWorker,
+                                                                  initargs=(WeightPath,))
+        finally:
+            for Name, Value in Environment.items():
+                if Value is None:
+                    del os.environ[Name]
+                else:
+                    os.environ[Name] = Value
+
+    def predict(self, Condition, Variant, InputMatrix, Physical=False):
+        InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64 if Physical else np.float32))
+        Tasks = [(Condition, Variant, InputMatrix[Start:Start + self.ChunkSize], Physical)
+                 for Start in range(0, InputMatrix.shape[0], self.ChunkSize)]
+        if len(Tasks) == 0:
+            return np.empty((0, 17), dtype=np.float32)
+
+        return np.concatenate(self.Pool.map(Func_predictChunk, Tasks, chunksize=1))
+
+    def memory(self):
+        # Memory of every worker process (Func_processMemory)
+        return [Func_processMemory(Process.pid) for Process in self.Pool._pool]
+
+    def close(self):
+        self.Pool.close()
+        self.Pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *Arguments):
+        self.close()
+        return False
+
+
+def Func_weightFileOutdated(PATH):
+    # True when a model is missing, its .npz bundle or epoch differs from the manifest (BestEpochs.json) or the
+    # bundle is newer than the weight file
+    from A01_Functions.ModelRegistry import DefaultEpochs, Func_getWeightsPath, Func_getDefaultEpoch
+
+    IndexPath = os.path.splitext(PATH)[0] + '.json'
+    if not os.path.isfile(PATH) or not os.path.isfile(IndexPath):
+        return True
+
+    with open(IndexPath) as File:
+        Models = json.load(File)['Models']
+    Written = min(os.path.getmtime(PATH), os.path.getmtime(IndexPath))
+
+    for (Condition, Variant) in DefaultEpochs.keys():
+        Entry = Models.get(Condition + '_' + str(Variant))
+        Source = os.path.abspath(Func_getWeightsPath(Condition, Variant))
+        if Entry is None or Entry.get('Source') != Source or Entry['Epoch'] != Func_getDefaultEpoch(Condition, Variant):
+            return True
+        if os.path.getmtime(Source) > Written:
+            return True
+
+    return False
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--Rows', type=int, default=1000000)
+    parser.add_argument('--ChunkSize', type=int, default=4096)
+    parser.add_argument('--Condition', type=str, default='Multi')
+    parser.add_argument('--Variant', type=int, default=3)
+    args = parser.parse_args()
+
+    InputMatrix = np.random.RandomState(0).rand(args.Rows, 3 if args.Variant == 1 else 4).astype(np.float32)
+
+    for NumWorkers in args.Workers:
+        with WorkerPool(NumWorkers, ChunkSize=args.ChunkSize) as Pool:
+            Pool.predict(args.Condition, args.Variant, InputMatrix[:args.ChunkSize * NumWorkers])
+            Start = time.perf_counter()
+            Pool.predict(args.Condition, args.Variant, InputMatrix)
+            Duration = time.perf_counter() - Start
+
+            Memory = [Values for Values in Pool.memory() if Values is not None]
+            Text = '{} workers: {:.0f} rows/s'.format(NumWorkers, args.Rows / Duration)
+            if len(Memory) > 0:
+                Text += ', per worker RSS {:.1f} MB (private {:.1f} MB, shared {:.1f} MB)'.format(
+                    np.mean([Values['RSS'] for Values in Memory]) / 2 ** 20,
+                    np.mean([Values['Private'] for Values in Memory]) / 2 ** 20,
+                    np.mean([Values['Shared'] for Values in Memory]) / 2 ** 20)
+            print(Text)
@@ -19,6 +19,9 @@ import torch.utils.data
 import time
 import pytorch_lightning as pl
 from A01_Functions.ReadData import *
+from A01_Functions.Dataset import Func_loadDataset, Func_dataLoader
+from A01_Functions.MetricsLogger import MetricsLogger
+from A01_Functions.Profiling import span
 from argparse import Namespace
 
 pd.set_option('display.width', 1000)
@@ -49,13 +52,17 @@ class FeedForward(pl.LightningModule):
         return x
 
     def prepare_data(self):
-        [self.TrainInputMatrix, self.TrainTargetMatrix] = Func_readDataIn(self.Variant)
-        self.trainData = torch.utils.data.TensorDataset(self.TrainInputMatrix, self.TrainTargetMatrix)
+        # In-memory tensors (cached per source) or memory-mapped column store, see A01_Functions/Dataset.py
+        DataPath = getattr(self.hparams, 'DataPath', DataPath_Default)
+        self.trainData = Func_loadDataset(self.Variant, DataPath, MemoryMap=getattr(self.hparams, 'MemoryMap', None))
+        print('Data loaded from ' + DataPath + ' (' + str(len(self.trainData)) + ' rows)')
+
+        if isinstance(self.trainData, torch.utils.data.TensorDataset):
+            [self.TrainInputMatrix, self.TrainTargetMatrix] = self.trainData.tensors
 
     def train_dataloader(self):
 
-        return torch.utils.data.DataLoader(dataset=self.trainData, batch_size=self.BatchSize,
-                                           shuffle=True, drop_last=True, num_workers=4)
+        return Func_dataLoader(self.trainData, self.BatchSize, Shuffle=True, DropLast=True, NumWorkers=4)
 
     def configure_optimizers(self):
         optimizer = optim.Adam(self.parameters(), lr=self.learningRate)
@@ -64,13 +71,14 @@ class FeedForward(pl.LightningModule):
 
     def training_step(self, batch, batch_idx):
         data, target = batch
-        output = self.forward(data)
-        criterion = nn.MSELoss()
-        criterion_2 = nn.L1Loss()
-        loss = criterion(output, target)
-        #MAE = abs(output - target).mean()
-        MAE = criterion_2(output, target).mean()
-        SD = abs(output - target).std()
+        with span('Training.forward'):
+            output = self.forward(data)
+            criterion = nn.MSELoss()
+            criterion_2 = nn.L1Loss()
+            loss = criterion(output, target)
+            #MAE = abs(output - target).mean()
+            MAE = criterion_2(output, target).mean()
+            SD = abs(output - target).std()
         # add logging
         # logs = {'loss': loss}
         # return {'loss': loss, 'log': logs}
@@ -78,19 +86,20 @@ class FeedForward(pl.LightningModule):
 
 
 class MyCallback(pl.Callback):
-    # TODO:
-    # Werte in einer CSV speichern zum späteren zugreifen
-    # Wshrscheinlich kann man im training step auf das Objekt zugreifen
-    def __init__(self, PlotName, DataName, ModelPath):
+    # The metrics are stored by a MetricsLogger: per-step values in preallocated arrays, the epoch values are
+    # appended to the csv file and the plot is rendered every PlotPeriod epochs in a background thread
+    def __init__(self, PlotName, DataName, ModelPath, PlotPeriod=100, ResultFolder='A04_Results_Training/'):
         self.PlotName = PlotName
         self.DataName = DataName
         self.ModelPath = ModelPath
+        self.PlotPeriod = PlotPeriod
+        self.ResultFolder = ResultFolder
+        self.Logger = None
 
-    def on_init_start(self, trainer):
-        self.hold_epoch = []
-        self.hold_MAE_Train = []
-        self.hold_MSE_Train = []
-        self.hold_SD_Train = []
+    def on_train_start(self, trainer, pl_module):
+        self.Logger = MetricsLogger(LogPath=self.ResultFolder + '02_Data/' + self.DataName + '.csv',
+                                    PlotPath=self.ResultFolder + '01_Plots/' + self.PlotName + '.png',
+                                    MaxEpochs=trainer.max_epochs, PlotPeriod=self.PlotPeriod)
 
     def on_batch_start(self, trainer, pl_module):
         pass
@@ -98,49 +107,46 @@ class MyCallback(pl.Callback):
     def on_batch_end(self, trainer, pl_module):
         # Wenn in dicct was drin ist
         if bool(trainer.callback_metrics) == True:
-            self.Mean_hold_MSE.append(trainer.callback_metrics.get("loss"))
-            self.Mean_hold_MAE.append(trainer.callback_metrics.get("MAE"))
-            self.Mean_hold_SD.append(trainer.callback_metrics.get("SD"))
+            self.Logger.logStep(trainer.callback_metrics.get("loss"),
+                                trainer.callback_metrics.get("MAE"),
+                                trainer.callback_metrics.get("SD"))
 
     def on_epoch_start(self, trainer, pl_module):
         self.start = time.time()
-        self.Mean_hold_MSE = []
-        self.Mean_hold_MAE = []
-        self.Mean_hold_SD = []
-        pass
 
     def on_epoch_end(self, trainer, pl_module):
         end = time.time()
-        if len(self.Mean_hold_MSE) > 0:
+        Values = self.Logger.endEpoch(trainer.current_epoch)
+
+        if Values is not None:
             print('Train Epoch [{}/{}]: Loss (MSE): {:.9f} Loss (MAE): {:.9f} SD {:.8f} - Time:{:.3f} Seconds'.
                   format(trainer.current_epoch,
                          trainer.max_epochs,
-                         np.mean(self.Mean_hold_MSE),
-                         np.mean(self.Mean_hold_MAE),
-                         np.mean(self.Mean_hold_SD),
+                         Values[0],
+                         Values[1],
+                         Values[2],
                          end - self.start))
 
-            self.hold_epoch.append(trainer.current_epoch)
-            self.hold_MSE_Train.append(np.mean(self.Mean_hold_MSE))
-            self.hold_MAE_Train.append(np.mean(self.Mean_hold_MAE))
-            self.hold_SD_Train.append(np.mean(self.Mean_hold_SD))
-
-            fig, ax = plt.subplots()
-            plt_MAE_Mean = ax.plot(self.hold_epoch, self.hold_MAE_Train, 'b', label='Mean absolute error')
-            plt_MSE = ax.plot(self.hold_epoch, self.hold_MSE_Train, 'k', label='Mean squared error')
-            # plt_SD = ax.fill_between(self.hold_epoch,
-            #                         np.array(self.hold_MAE_Train) + np.array(self.hold_SD_Train),
-            #                         np.array(self.hold_MAE_Train) - np.array(self.hold_SD_Train),
-            #                         color='yellow', alpha=0.5, label='Standard deviation')
-            plt.yscale('log', nonposy='clip')
-            plt.legend(loc='upper center')
-            fig.savefig('A04_Results_Training/01_Plots/' + self.PlotName + '.png')
-            plt.close()
-            start = time.time()
-
     def on_train_end(self, trainer, pl_module):
         trainer.save_checkpoint(self.ModelPath + 'epoch=' + str(trainer.current_epoch) + '.ckpt')
-        dataset = pd.DataFrame({'Epoch': self.hold_epoch, 'MSE': self.hold_MSE_Train,
-                                'MAE': self.hold_MAE_Train, 'SD': self.hold_SD_Train})
+        self.Logger.close()
+
 
-        dataset.to_csv('A04_Results_Training/02_Data/' + self.DataName + '.csv', index=False)
+class ArchiveCallback(pl.Callback):
+    # Replaces ModelCheckpoint(save_top_k=-1, period=...): the weights of every Period-th epoch are appended
+    # to one checkpoint archive (A01_Functions/CheckpointArchive.py) instead of a full .ckpt file each
+    def __init__(self, ArchivePath, Period=100, Precision='float32', Compression=False):
+        from A01_Functions.CheckpointArchive import CheckpointArchive
+
+        self.Archive = CheckpointArchive(ArchivePath, 'a', Precision=Precision, Compression=Compression)
+        self.Period = Period
+
+    def on_epoch_end(self, trainer, pl_module):
+        if trainer.current_epoch % self.Period == 0:
+            self.Archive.write(trainer.current_epoch, pl_module.state_dict(), hparams=pl_module.hparams,
+                               GlobalStep=trainer.global_step)
+
+    def on_train_end(self, trainer, pl_module):
+        self.Archive.write(trainer.current_epoch, pl_module.state_dict(), hparams=pl_module.hparams,
+                           GlobalStep=trainer.global_step)
+        self.Archive.close()
@@ -0,0 +1,215 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Benchmarks of the inference and training paths for every Condition/Variant:
+#   ColdStart           seconds from the process start of CalcParam.py until output.csv is written (median)
+#   LoadCheckpoint      seconds of Func_loadCheckpoint() without the model cache (median)
+#   LatencyMedian/P95   seconds of one FeedForward.forward() with a single sample on a loaded model
+#   Throughput_<N>      rows per second of Func_forwardBatch() with N rows
+#   Training<Engine>    epochs per second of the training configuration of Main.py (short run)
+# The results are written to a .json file. With --Baseline the results are compared with an earlier .json file
+# and every metric which is worse than the baseline by more than --Tolerance is reported as a regression
+# (exit code 1).
+#
+# Run from the folder Python/:
+#   python Benchmark.py --Output benchmark.json
+#   python Benchmark.py --Output benchmark_new.json --Baseline benchmark.json --Tolerance 0.2
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import torch
+from argparse import ArgumentParser
+from A01_Functions.ModelRegistry import DefaultEpochs, Func_getCheckpointPath, Func_loadCheckpoint
+from A01_Functions.ReadData import ConditionDataPaths
+
+ScriptFolder = os.path.dirname(os.path.abspath(__file__))
+
+# Command line values of a single sample for CalcParam.py
+CalcParamArguments = {1: ['--L', '0.5', '--Fx', '0.5', '--Fy', '0.5'],
+                      2: ['--Lcone', '0.5', '--Mcone', '0.5', '--Scone', '0.5', '--Mel', '0.5'],
+                      3: ['--L', '0.5', '--Fx', '0.5', '--Fy', '0.5', '--Mel', '0.5']}
+
+# Metrics for which a larger value is better, all other metrics are times
+HigherIsBetter = ('Throughput', 'Training')
+
+
+def Func_timeRepeated(Function, Repeats):
+    Durations = []
+    for _ in range(Repeats):
+        Start = time.perf_counter()
+        Function()
+        Durations.append(time.perf_counter() - Start)
+
+    return np.array(Durations)
+
+
+def Func_benchColdStart(Condition, Variant, Repeats):
+    Folder = tempfile.mkdtemp(prefix='Benchmark_')
+    Command = [sys.executable, os.path.join(ScriptFolder, 'CalcParam.py'), '--Condition', Condition,
+               '--Variant', str(Variant)] + CalcParamArguments[Variant]
+
+    def Func_run():
+        subprocess.run(Command, cwd=Folder, check=True, stdout=subprocess.DEVNULL)
+        if not os.path.isfile(os.path.join(Folder, 'output.csv')):
+            raise RuntimeError('CalcParam.py did not write output.csv')
+        os.remove(os.path.join(Folder, 'output.csv'))
+
+    try:
+        return float(np.median(Func_timeRepeated(Func_run, Repeats)))
+    finally:
+        shutil.rmtree(Folder, ignore_errors=True)
+
+
+def Func_benchInference(Condition, Variant, Repeats, BatchSizes):
+    from CalcParam import Func_forwardBatch
+
+    PATH = Func_getCheckpointPath(Condition, Variant)
+
+    # The first load also imports FeedForward and pytorch_lightning, which belongs to the cold start
+    model = Func_loadCheckpoint(PATH)
+    Results = {'LoadCheckpoint': float(np.median(Func_timeRepeated(lambda: Func_loadCheckpoint(PATH), Repeats)))}
+
+    InputSize = 3 if Variant == 1 else 4
+    Sample = torch.rand(1, InputSize)
+
+    with torch.no_grad():
+        for _ in range(10):
+            model(Sample)
+        Durations = Func_timeRepeated(lambda: model(Sample), max(Repeats * 100, 100))
+
+    Results['LatencyMedian'] = float(np.median(Durations))
+    Results['LatencyP95'] = float(np.percentile(Durations, 95))
+
+    for BatchSize in BatchSizes:
+        InputMatrix = np.random.rand(BatchSize, InputSize).astype(np.float32)
+        Func_forwardBatch(model, InputMatrix)
+        Durations = Func_timeRepeated(lambda: Func_forwardBatch(model, InputMatrix), Repeats)
+        Results['Throughput_' + str(BatchSize)] = float(BatchSize / np.median(Durations))
+
+    return Results
+
+
+def Func_benchTraining(Condition, Variant, Engine, Epoch):
+    # Configuration of Main.py with fewer epochs, all outputs into a temporary folder
+    Folder = tempfile.mkdtemp(prefix='Benchmark_') + '/'
+    Parameters = dict(Epoch=Epoch, numHiddenNeuron_1=40, numHiddenNeuron_2=80, Variant=Variant, BatchSize=7,
+                      learningRate=0.001, DataPath=ConditionDataPaths[Condition], Seed=0)
+
+    try:
+        if Engine == 'Fast':
+            from A01_Functions.FastTraining import Func_runFastTraining
+            [_, EpochsPerSecond] = Func_runFastTraining(ModelFolder=Folder + 'A03_Models/FF/',
+                                                        DataFolder=Folder + 'A04_Results_Training/02_Data/',
+                                                        PrintPeriod=0, **Parameters)
+        else:
+            from Main import Func_runTraining
+            [_, EpochsPerSecond] = Func_runTraining(OutputFolder=Folder, **Parameters)
+    finally:
+        shutil.rmtree(Folder, ignore_errors=True)
+
+    return float(EpochsPerSecond)
+
+
+def Func_runBenchmark(Conditions, Variants, Repeats=5, BatchSizes=(1, 64, 1024, 16384), Engines=('Lightning', 'Fast'),
+                      TrainEpochs=100, ColdStart=True):
+    Results = {}
+
+    for Condition in Conditions:
+        for Variant in Variants:
+            if (Condition, Variant) not in DefaultEpochs:
+                continue
+
+            Key = Condition + '/' + str(Variant)
+            Results[Key] = {}
+            print('Benchmark ' + Key, flush=True)
+
+            if ColdStart:
+                Results[Key]['ColdStart'] = Func_benchColdStart(Condition, Variant, Repeats)
+
+            Results[Key].update(Func_benchInference(Condition, Variant, Repeats, BatchSizes))
+
+            for Engine in Engines:
+                try:
+                    Results[Key]['Training' + Engine] = Func_benchTraining(Condition, Variant, Engine, TrainEpochs)
+                except Exception as Error:
+                    print('Training benchmark ' + Engine + ' failed: ' + repr(Error))
+
+    Environment = {'Python': platform.python_version(), 'Platform': platform.platform(),
+                   'Processor': platform.processor(), 'CPUs': os.cpu_count(), 'Torch': torch.__version__,
+                   'TorchThreads': torch.get_num_threads(), 'Numpy': np.__version__,
+                   'Date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    return {'Environment': Environment, 'Results': Results}
+
+
+def Func_compareBaseline(Report, Baseline, Tolerance=0.2):
+    # Relative change of every metric against the baseline, positive values are improvements.
+    # Returns the comparison table and the list of regressions (worse than the baseline by more than Tolerance)
+    Comparison = []
+    Regressions = []
+
+    for Key, Metrics in Report['Results'].items():
+        for Metric, Value in Metrics.items():
+            if Metric not in Baseline['Results'].get(Key, {}):
+                continue
+
+            Reference = Baseline['Results'][Key][Metric]
+            if Metric.startswith(HigherIsBetter):
+                Change = Value / Reference - 1
+            else:
+                Change = Reference / Value - 1
+
+            Row = {'Key': Key, 'Metric': Metric, 'Baseline': Reference, 'Value': Value, 'Change': Change}
+            Comparison.append(Row)
+            if Change < -Tolerance:
+                Regressions.append(Row)
+
+    return Comparison, Regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Conditions', type=str, nargs='+', default=['Single', 'Multi'])
+    parser.add_argument('--Variants', type=int, nargs='+', default=[1, 2, 3])
+    parser.add_argument('--Repeats', type=int, default=5)
+    parser.add_argument('--BatchSizes', type=int, nargs='+', default=[1, 64, 1024, 16384])
+    parser.add_argument('--Engines', type=str, nargs='*', default=['Lightning', 'Fast'], choices=['Fast', 'Lightning'])
+    parser.add_argument('--TrainEpochs', type=int, default=100)
+    parser.add_argument('--NoColdStart', action='store_true')
+    parser.add_argument('--Output', type=str, default='benchmark.json')
+    parser.add_argument('--Baseline', type=str, default=None)
+    parser.add_argument('--Tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    Report = Func_runBenchmark(args.Conditions, args.Variants, Repeats=args.Repeats, BatchSizes=args.BatchSizes,
+                               Engines=args.Engines, TrainEpochs=args.TrainEpochs, ColdStart=not args.NoColdStart)
+
+    with open(args.Output, 'w') as File:
+        json.dump(Report, File, indent=2)
+    print('Benchmark results written to ' + args.Output)
+
+    if args.Baseline is not None:
+        with open(args.Baseline) as File:
+            Baseline = json.load(File)
+
+        [Comparison, Regressions] = Func_compareBaseline(Report, Baseline, args.Tolerance)
+        for Row in Comparison:
+            print('{:8s} {:18s} {:14.6g} -> {:14.6g} {:+7.1%}{}'.format(
+                Row['Key'], Row['Metric'], Row['Baseline'], Row['Value'], Row['Change'],
+                '  REGRESSION' if Row in Regressions else ''))
+
+        if Regressions:
+            print(str(len(Regressions)) + ' regressions against ' + args.Baseline)
+            sys.exit(1)
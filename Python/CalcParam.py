@@ -6,303 +6,172 @@
 # Link: www.nature.com/articles/s41598-020-79908-5
 # GitHub Link: https://github.com/BZandi/DL-PupilModel
 
+import time
+ImportStart = time.perf_counter()
+
 import numpy as np
 import pandas as pd
 import torch
-import torch.utils.data as data_utils
-import A02_Networks.FeedForward as FF_Class
-import pytorch_lightning as pl
-from argparse import Namespace
-from pytorch_lightning.callbacks import ModelCheckpoint
 from argparse import ArgumentParser
+from A01_Functions.ReadData import shapeTrainData
+from A01_Functions.ModelRegistry import Func_loadModel
+from A01_Functions import Profiling
+from A01_Functions.Profiling import span
+
+ImportEnd = time.perf_counter()
+
+
+def Func_readInputMatrix(InputFile, Variant):
+    # Reads a N x 3 (Variant 1) or N x 4 (Variant 2, 3) matrix of normalised light metrics from a .npy or .csv file.
+    # If the csv file has a header with the column names of the training data (e.g. Leuchtdichte, Farbort_x, ...),
+    # the columns are selected by name. Otherwise the columns must follow the input order of shapeTrainData():
+    # Variant 1: Leuchtdichte, Farbort_x, Farbort_y
+    # Variant 2: S_Signal, M_Signal, L_Signal, Melanopsin_Signal
+    # Variant 3: Leuchtdichte, Farbort_x, Farbort_y, Melanopsin_Signal
+    if InputFile.endswith('.npy'):
+        with span('CalcParam.readInput'):
+            return np.load(InputFile)
+
+    [InputtLabels, TargetLabels] = shapeTrainData(Variant)
+
+    # A first line with only numeric fields is a stimulus, not a header (checked on the raw line, pandas renames
+    # repeated header values)
+    with open(InputFile) as File:
+        FirstLine = File.readline().strip()
+    try:
+        [float(Field) for Field in FirstLine.split(',')]
+        Header = None
+    except ValueError:
+        Header = 'infer'
+
+    with span('CalcParam.readInput'):
+        DataDataFrame = pd.read_csv(InputFile, header=Header)
+
+    if Header is not None and set(InputtLabels).issubset(DataDataFrame.columns):
+        return DataDataFrame[InputtLabels].values
+
+    return DataDataFrame.values
+
+
+def Func_writeOutputMatrix(OutputFile, OutputMatrix):
+    # Writes the N x 17 predicted model parameters with one bulk write (.npy or .csv in the format of output.csv)
+    if OutputFile.endswith('.npy'):
+        with span('CalcParam.writeOutput'):
+            np.save(OutputFile, OutputMatrix)
+    else:
+        [InputtLabels, TargetLabels] = shapeTrainData(1)
+        with span('CalcParam.DataFrame'):
+            OutputDataFrame = pd.DataFrame(OutputMatrix, columns=TargetLabels)
+        with span('CalcParam.to_csv'):
+            OutputDataFrame.to_csv(OutputFile, index=False)
+
+
+def calcParam_from_NN_Batch(Condition, Variant, InputMatrix, ChunkSize=4096, Epoch=None, Physical=False, Fused=False,
+                            Precision='float32', Cache=None):
+    # Predicts the 17 normalised model parameters for many stimuli with one loaded model.
+    # InputMatrix: N x 3 (Variant 1) or N x 4 (Variant 2, 3) array of normalised light metrics in the input
+    # order of shapeTrainData(). The forward pass runs vectorised over chunks of ChunkSize rows to bound the memory.
+    # Physical: inputs and outputs in absolute units, the unity-based normalisation is done here (Normalisation.py)
+    # Fused: compiled model with folded layers and scalers (FusedInference.py), same outputs up to rounding
+    # Precision: 'float32', 'float16' or 'int8' weights (QuantizedInference.py)
+    # Cache: PredictionCache, only the stimuli without a stored result are predicted (PredictionCache.py)
+    InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float64))
+    InputSize = 3 if Variant == 1 else 4
+
+    if InputMatrix.shape[1] != InputSize:
+        raise ValueError('Variant ' + str(Variant) + ' expects ' + str(InputSize) +
+                         ' input columns, got ' + str(InputMatrix.shape[1]))
+
+    # The fused graph is float32 only, the quantized models are not fused
+    if Fused and Precision != 'float32':
+        raise ValueError('Fused inference runs in float32, use either Fused or Precision ' + str(Precision))
+
+    if Cache is not None:
+        with span('CalcParam.cache'):
+            return Cache.predict(Condition, Variant, InputMatrix, Epoch, Physical, Engine='torch',
+                                 Mode='fused' if Fused else Precision,
+                                 Predictor=lambda Matrix: calcParam_from_NN_Batch(Condition, Variant, Matrix, ChunkSize,
+                                                                                  Epoch, Physical, Fused, Precision))
+
+    if Fused:
+        from A01_Functions.FusedInference import Func_loadCompiledModel, Func_predictCompiled
+
+        with span('CalcParam.loadModel'):
+            Compiled = Func_loadCompiledModel(Condition, Variant, Epoch, Physical=Physical)
+        with span('CalcParam.forward'):
+            return Func_predictCompiled(Compiled, InputMatrix, ChunkSize)
+
+    with span('CalcParam.loadModel'):
+        if Precision != 'float32':
+            from A01_Functions.QuantizedInference import Func_loadQuantizedModel
+            model = Func_loadQuantizedModel(Condition, Variant, Epoch, Mode=Precision)
+        else:
+            model = Func_loadModel(Condition, Variant, Epoch)
+
+    if Physical:
+        with span('CalcParam.normalise'):
+            InputMatrix = model.InputScaler.normalise(InputMatrix)
+        OutputMatrix = Func_forwardBatch(model, InputMatrix, ChunkSize)
+        with span('CalcParam.denormalise'):
+            return model.OutputScaler.denormalise(OutputMatrix)
+
+    return Func_forwardBatch(model, InputMatrix, ChunkSize)
+
+
+def Func_forwardBatch(model, InputMatrix, ChunkSize=4096):
+    # Vectorised forward pass of an already loaded model in chunks of ChunkSize rows
+    InputMatrix = np.atleast_2d(np.asarray(InputMatrix, dtype=np.float32))
+    OutputMatrix = np.empty((InputMatrix.shape[0], 17), dtype=np.float32)
+
+    with span('CalcParam.forward'), torch.no_grad():
+        for Start in range(0, InputMatrix.shape[0], ChunkSize):
+            Eingangswerte = torch.from_numpy(InputMatrix[Start:Start + ChunkSize])
+            OutputMatrix[Start:Start + ChunkSize] = model(Eingangswerte).numpy()
+
+    return OutputMatrix
+
+
+def Func_inputsFromArgs(Variant, argsValues):
+    # Input order of the networks, see shapeTrainData()
+    if Variant == 1:
+        print("Leuchtdichte: " + str(argsValues.L) +
+              " Farbort x: " + str(argsValues.Fx) +
+              " Farbort y: " + str(argsValues.Fy))
+        return [argsValues.L, argsValues.Fx, argsValues.Fy]
+
+    if Variant == 2:
+        print("Lcone: " + str(argsValues.Lcone) +
+              " Mcone: " + str(argsValues.Mcone) +
+              " Scone: " + str(argsValues.Scone) +
+              " Mel: " + str(argsValues.Mel))
+        return [argsValues.Scone, argsValues.Mcone, argsValues.Lcone, argsValues.Mel]
+
+    if Variant == 3:
+        print("Leuchtdichte: " + str(argsValues.L) +
+              " Farbort x: " + str(argsValues.Fx) +
+              " Farbort y: " + str(argsValues.Fy) +
+              " Mel: " + str(argsValues.Mel))
+        return [argsValues.L, argsValues.Fx, argsValues.Fy, argsValues.Mel]
+
+    raise ValueError('Unknown Variant ' + str(Variant))
 
 
 def calcParam_from_NN(Variant, argsValues):
+    print(('Many' if argsValues.Condition == 'Multi' else argsValues.Condition) + ' - Variant ' + str(Variant))
+
+    Eingangswerte = Func_inputsFromArgs(Variant, argsValues)
+
+    OutputMatrix = calcParam_from_NN_Batch(Condition=argsValues.Condition, Variant=Variant,
+                                           InputMatrix=Eingangswerte, Epoch=argsValues.Epoch,
+                                           Physical=argsValues.Physical, Cache=argsValues.PredictionCache)
 
-    if argsValues.Condition == 'Single':
-
-        if Variant == 1:
-            print('Single - Variant 1')
-            print("Leuchtdichte: " + str(argsValues.L) +
-                  " Farbort x: " + str(argsValues.Fx) +
-                  " Farbort y: " + str(argsValues.Fy))
-
-            Leuchtdichte = argsValues.L
-            Farbort_x = argsValues.Fx
-            Farbort_y = argsValues.Fy
-            PATH = "A03_Models/FF/Intrapersonal_SingleSubject/Variant_1_Lxy/FF_Variant_1_BatchSize_7_epoch=3999.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array(
-                [argsValues.L, argsValues.Fx, argsValues.Fy])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
-
-            # Eingangswerte:
-            # 470 nm - Leuchtdichte: 0 Farbort x: 0 Farbort y: 0
-            # 530 nm - Leuchtdichte: 0.886363636363642 Farbort x: 0.0509930220075148 Farbort y: 1
-            # 610 nm - Leuchtdichte: 0.977272727272716 Farbort x: 0.932045089 Farbort y: 0.932045089
-            # 660 nm - Leuchtdichte: 0.545454545 Farbort x: 1 Farbort y: 0.361349796
-
-        if Variant == 2:
-            print('Single - Variant 2')
-            print("Lcone: " + str(argsValues.Lcone) +
-                  " Mcone: " + str(argsValues.Mcone) +
-                  " Scone: " + str(argsValues.Scone) +
-                  " Mel: " + str(argsValues.Mel))
-
-            Lcone = argsValues.Lcone
-            Mcone = argsValues.Mcone
-            Scone = argsValues.Scone
-            Mel = argsValues.Mel
-            PATH = "A03_Models/FF/Intrapersonal_SingleSubject/Variant_2_LMSMEL/FF_Variant_2_BatchSize_7_epoch=2900.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array([argsValues.Scone,
-                                      argsValues.Mcone,
-                                      argsValues.Lcone,
-                                      argsValues.Mel])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
-
-        if Variant == 3:
-            print('Single - Variant 3')
-            print("Leuchtdichte: " + str(argsValues.L) +
-                  " Farbort x: " + str(argsValues.Fx) +
-                  " Farbort y: " + str(argsValues.Fy) +
-                  " Mel: " + str(argsValues.Mel))
-
-            Leuchtdichte = argsValues.L
-            Farbort_x = argsValues.Fx
-            Farbort_y = argsValues.Fy
-            Mel = argsValues.Mel
-
-            PATH = "A03_Models/FF/Intrapersonal_SingleSubject/Variant_3_LxyMel/FF_Variant_3_BatchSize_7_epoch=3999.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array([argsValues.L,
-                                      argsValues.Fx,
-                                      argsValues.Fy,
-                                      argsValues.Mel])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
-
-    if argsValues.Condition == 'Multi':
-        if Variant == 1:
-            print('Many - Variant 1')
-            print("Leuchtdichte: " + str(argsValues.L) +
-                  " Farbort x: " + str(argsValues.Fx) +
-                  " Farbort y: " + str(argsValues.Fy))
-
-            Leuchtdichte = argsValues.L
-            Farbort_x = argsValues.Fx
-            Farbort_y = argsValues.Fy
-            PATH = "A03_Models/FF/Interpersonal_ManySubject/Variant_1_Lxy/FF_Variant_1_BatchSize_7_epoch=800.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array(
-                [argsValues.L, argsValues.Fx, argsValues.Fy])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
-
-            # Eingangswerte:
-            # 470 nm - Leuchtdichte: 0 Farbort x: 0 Farbort y: 0
-            # 530 nm - Leuchtdichte: 0.886363636363642 Farbort x: 0.0509930220075148 Farbort y: 1
-            # 610 nm - Leuchtdichte: 0.977272727272716 Farbort x: 0.932045089 Farbort y: 0.932045089
-            # 660 nm - Leuchtdichte: 0.545454545 Farbort x: 1 Farbort y: 0.361349796
-
-        if Variant == 2:
-            print('Many - Variant 2')
-            print("Lcone: " + str(argsValues.Lcone) +
-                  " Mcone: " + str(argsValues.Mcone) +
-                  " Scone: " + str(argsValues.Scone) +
-                  " Mel: " + str(argsValues.Mel))
-
-            Lcone = argsValues.Lcone
-            Mcone = argsValues.Mcone
-            Scone = argsValues.Scone
-            Mel = argsValues.Mel
-            PATH = "A03_Models/FF/Interpersonal_ManySubject/Variant_2_LMSMEL/FF_Variant_2_BatchSize_7_epoch=3800.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array([argsValues.Scone,
-                                      argsValues.Mcone,
-                                      argsValues.Lcone,
-                                      argsValues.Mel])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
-
-        if Variant == 3:
-            print('Many - Variant 3')
-            print("Leuchtdichte: " + str(argsValues.L) +
-                  " Farbort x: " + str(argsValues.Fx) +
-                  " Farbort y: " + str(argsValues.Fy) +
-                  " Mel: " + str(argsValues.Mel))
-
-            Leuchtdichte = argsValues.L
-            Farbort_x = argsValues.Fx
-            Farbort_y = argsValues.Fy
-            Mel = argsValues.Mel
-
-            PATH = "A03_Models/FF/Interpersonal_ManySubject/Variant_3_LxyMel/FF_Variant_3_BatchSize_7_epoch=3800.ckpt"
-            model = FF_Class.FeedForward.load_from_checkpoint(PATH)
-            model.eval()
-
-            Eingangswerte = np.array([argsValues.L,
-                                      argsValues.Fx,
-                                      argsValues.Fy,
-                                      argsValues.Mel])
-
-            Eingangswerte = torch.from_numpy(Eingangswerte).float()
-
-            output = model(Eingangswerte)
-
-            output_np = output.data.numpy()
-
-            dataset = pd.DataFrame({'f_p': output_np[0],
-                                    'f_s': output_np[1],
-                                    'P_0': output_np[2],
-                                    'tp': output_np[3],
-                                    'ts': output_np[4],
-                                    'Delta_tp': output_np[5],
-                                    'Delta_ts': output_np[6],
-                                    'p1': output_np[7],
-                                    'p2': output_np[8],
-                                    'p3': output_np[9],
-                                    'p4': output_np[10],
-                                    'p5': output_np[11],
-                                    'p6': output_np[12],
-                                    'p7': output_np[13],
-                                    'p8': output_np[14],
-                                    'p9': output_np[15],
-                                    'p10': output_np[16]}, index=[0])
-
-            dataset.to_csv('output.csv', index=False)
+    Func_writeOutputMatrix('output.csv', OutputMatrix)
+
+    # Eingangswerte:
+    # 470 nm - Leuchtdichte: 0 Farbort x: 0 Farbort y: 0
+    # 530 nm - Leuchtdichte: 0.886363636363642 Farbort x: 0.0509930220075148 Farbort y: 1
+    # 610 nm - Leuchtdichte: 0.977272727272716 Farbort x: 0.932045089 Farbort y: 0.932045089
+    # 660 nm - Leuchtdichte: 0.545454545 Farbort x: 1 Farbort y: 0.361349796
 
 
 if __name__ == "__main__":
@@ -316,10 +185,49 @@ if __name__ == "__main__":
     parser.add_argument('--Mcone', type=float, default=0)
     parser.add_argument('--Scone', type=float, default=0)
     parser.add_argument('--Mel', type=float, default=0)
+    parser.add_argument('--Epoch', type=int, default=None)
+    parser.add_argument('--InputFile', type=str, default=None)
+    parser.add_argument('--OutputFile', type=str, default='output.csv')
+    parser.add_argument('--ChunkSize', type=int, default=4096)
+    parser.add_argument('--Physical', action='store_true')
+    parser.add_argument('--Fused', action='store_true')
+    parser.add_argument('--Precision', type=str, default='float32', choices=['float32', 'float16', 'int8'])
+    parser.add_argument('--Cache', type=str, nargs='?', default=None, const='default',
+                        help='Persistent prediction cache, optional path of the .sqlite file')
+    parser.add_argument('--CacheStats', action='store_true')
+    parser.add_argument('--Profile', action='store_true')
+    parser.add_argument('--ProfileTrace', type=str, default=None)
+    parser.add_argument('--CProfile', type=str, default=None)
 
     args = parser.parse_args()
-    calcParam_from_NN(Variant=args.Variant, argsValues=args)
-    print("Values calculated and exported to csv")
+    if args.Fused and args.Precision != 'float32':
+        parser.error('--Fused runs in float32 and cannot be combined with --Precision ' + args.Precision)
+
+    # Timers (also with PUPILMODEL_PROFILE=1), the report is printed at the end of the process
+    if args.Profile or args.ProfileTrace is not None or args.CProfile is not None:
+        Profiling.Func_enable(Trace=args.ProfileTrace, CProfile=args.CProfile)
+    if Profiling.Enabled:
+        Profiling.Func_record('CalcParam.import', ImportStart, ImportEnd)
+
+    args.PredictionCache = None
+    if args.Cache is not None:
+        from A01_Functions.PredictionCache import PredictionCache, CachePath_Default
+        args.PredictionCache = PredictionCache(CachePath_Default if args.Cache == 'default' else args.Cache)
+
+    if args.InputFile is not None:
+        InputMatrix = Func_readInputMatrix(args.InputFile, args.Variant)
+        OutputMatrix = calcParam_from_NN_Batch(Condition=args.Condition, Variant=args.Variant,
+                                               InputMatrix=InputMatrix, ChunkSize=args.ChunkSize, Epoch=args.Epoch,
+                                               Physical=args.Physical, Fused=args.Fused,
+                                               Precision=args.Precision, Cache=args.PredictionCache)
+        Func_writeOutputMatrix(args.OutputFile, OutputMatrix)
+        print(str(OutputMatrix.shape[0]) + " values calculated and exported to " + args.OutputFile)
+    else:
+        calcParam_from_NN(Variant=args.Variant, argsValues=args)
+        print("Values calculated and exported to csv")
+
+    if args.PredictionCache is not None and args.CacheStats:
+        print('Prediction cache: ' + str(args.PredictionCache.statistics()))
 
     # Zum ausführen der verschiedenen Varianten müssen folgende Befehle eingegeben werden
     # Variante 1: python CalcParam.py --Condition Single --Variant 1 --L 0 --Fx 0 --Fy 0
@@ -329,3 +237,5 @@ if __name__ == "__main__":
     # Variante 1: python CalcParam.py --Condition Multi --Variant 1 --L 0 --Fx 0 --Fy 0
     # Variante 2: python CalcParam.py --Condition Multi --Variant 2 --Lcone 0 --Mcone 0 --Scone 0 --Mel 0
     # Variante 3: python CalcParam.py --Condition Multi --Variant 1 --L 0 --Fx 0 --Fy 0 --Mel 0
+
+    # Batch: python CalcParam.py --Condition Single --Variant 1 --InputFile stimuli.csv --OutputFile output.csv
@@ -0,0 +1,77 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Thin client for CalcParam_Server.py with the same arguments and the same output.csv as CalcParam.py.
+# Only the standard library is imported, so a call does not pay the start-up time of torch and pandas.
+
+import csv
+import json
+import sys
+import urllib.request
+import urllib.error
+from argparse import ArgumentParser
+
+
+def Func_requestParam(Condition, Variant, Inputs, Host='127.0.0.1', Port=8765, Timeout=30, Physical=False):
+    Body = json.dumps({'Condition': Condition, 'Variant': Variant, 'Inputs': Inputs,
+                       'Physical': Physical}).encode('utf-8')
+    Request = urllib.request.Request('http://' + Host + ':' + str(Port) + '/predict', data=Body,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(Request, timeout=Timeout) as Response:
+            Result = json.loads(Response.read().decode('utf-8'))
+    except urllib.error.HTTPError as Error:
+        raise RuntimeError(json.loads(Error.read().decode('utf-8'))['Error'])
+
+    return Result['Labels'], Result['Parameters']
+
+
+def Func_inputsFromArgs(Variant, argsValues):
+    # Same input order as calcParam_from_NN() in CalcParam.py
+    if Variant == 1:
+        return [argsValues.L, argsValues.Fx, argsValues.Fy]
+    if Variant == 2:
+        return [argsValues.Scone, argsValues.Mcone, argsValues.Lcone, argsValues.Mel]
+    if Variant == 3:
+        return [argsValues.L, argsValues.Fx, argsValues.Fy, argsValues.Mel]
+
+    raise ValueError('Unknown Variant ' + str(Variant))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Condition', type=str, default='Single')
+    parser.add_argument('--Variant', type=int, default=1)
+    parser.add_argument('--L', type=float, default=0)
+    parser.add_argument('--Fx', type=float, default=0)
+    parser.add_argument('--Fy', type=float, default=0)
+    parser.add_argument('--Lcone', type=float, default=0)
+    parser.add_argument('--Mcone', type=float, default=0)
+    parser.add_argument('--Scone', type=float, default=0)
+    parser.add_argument('--Mel', type=float, default=0)
+    parser.add_argument('--OutputFile', type=str, default='output.csv')
+    parser.add_argument('--Host', type=str, default='127.0.0.1')
+    parser.add_argument('--Port', type=int, default=8765)
+    parser.add_argument('--Physical', action='store_true')
+
+    args = parser.parse_args()
+
+    try:
+        [Labels, Parameters] = Func_requestParam(args.Condition, args.Variant,
+                                                 [Func_inputsFromArgs(args.Variant, args)],
+                                                 Host=args.Host, Port=args.Port, Physical=args.Physical)
+    except (RuntimeError, ValueError, urllib.error.URLError) as Error:
+        print('Prediction failed: ' + str(Error))
+        sys.exit(1)
+
+    with open(args.OutputFile, 'w', newline='') as File:
+        Writer = csv.writer(File)
+        Writer.writerow(Labels)
+        Writer.writerows(Parameters)
+
+    print("Values calculated and exported to csv")
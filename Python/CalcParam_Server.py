@@ -0,0 +1,116 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Long-running localhost HTTP server which loads the Single/Multi x Variant 1/2/3 networks once
+# and answers prediction requests with the 17 normalised model parameters.
+#
+# Requests:
+#   GET  /health   -> {"Models": [<paths of the loaded checkpoints>]}
+#   POST /predict  <- {"Condition": "Single", "Variant": 1, "Inputs": [[L, Fx, Fy], ...], "Epoch": optional,
+#                      "Physical": optional}
+#                  -> {"Labels": ["f_p", ..., "p10"], "Parameters": [[...17 values...], ...]}
+# With "Physical": true, inputs and parameters are given in absolute units instead of normalised values.
+# The rows of "Inputs" follow the input order of shapeTrainData() (see CalcParam.py).
+
+import json
+import numpy as np
+import torch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from argparse import ArgumentParser
+from A01_Functions.ReadData import shapeTrainData
+from A01_Functions.ModelRegistry import DefaultEpochs, Func_loadModel, Func_getCheckpointPath, Func_setCacheSize, Cache
+from CalcParam import Func_forwardBatch
+
+
+def Func_loadAllModels():
+    # Warm up the model registry cache with the published networks
+    for (Condition, Variant) in DefaultEpochs.keys():
+        Func_loadModel(Condition, Variant)
+        print('Loaded ' + Condition + ' - Variant ' + str(Variant) + ': ' + Func_getCheckpointPath(Condition, Variant))
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    ChunkSize = 4096
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.sendJson(200, {'Models': sorted(str(Key) for Key in Cache.keys())})
+        else:
+            self.sendJson(404, {'Error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.sendJson(404, {'Error': 'Unknown path ' + self.path})
+            return
+
+        try:
+            Length = int(self.headers.get('Content-Length', 0))
+            Request = json.loads(self.rfile.read(Length).decode('utf-8'))
+            Variant = int(Request['Variant'])
+            model = Func_loadModel(Request['Condition'], Variant, Request.get('Epoch'))
+
+            InputSize = model.InputSize
+            Inputs = np.asarray(Request['Inputs'], dtype=np.float64)
+
+            if Inputs.ndim != 2 or Inputs.shape[0] == 0 or Inputs.shape[1] != InputSize:
+                raise ValueError('Variant ' + str(Variant) + ' expects rows with ' + str(InputSize) + ' values')
+
+        except (KeyError, TypeError, ValueError, OSError) as Error:
+            self.sendJson(400, {'Error': str(Error)})
+            return
+
+        if Request.get('Physical', False):
+            OutputMatrix = model.OutputScaler.denormalise(
+                Func_forwardBatch(model, model.InputScaler.normalise(Inputs), self.ChunkSize))
+        else:
+            OutputMatrix = Func_forwardBatch(model, Inputs, self.ChunkSize)
+        [InputtLabels, TargetLabels] = shapeTrainData(1)
+        self.sendJson(200, {'Labels': TargetLabels, 'Parameters': OutputMatrix.tolist()})
+
+    def sendJson(self, Status, Content):
+        Body = json.dumps(Content).encode('utf-8')
+        self.send_response(Status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(Body)))
+        self.end_headers()
+        self.wfile.write(Body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Host', type=str, default='127.0.0.1')
+    parser.add_argument('--Port', type=int, default=8765)
+    parser.add_argument('--ChunkSize', type=int, default=4096)
+    parser.add_argument('--Threads', type=int, default=0)
+    parser.add_argument('--CacheSize', type=int, default=6)
+
+    args = parser.parse_args()
+
+    if args.Threads > 0:
+        torch.set_num_threads(args.Threads)
+
+    Func_setCacheSize(args.CacheSize)
+    Func_loadAllModels()
+    PredictionHandler.ChunkSize = args.ChunkSize
+
+    server = ThreadingHTTPServer((args.Host, args.Port), PredictionHandler)
+    print('Serving pupil model parameters on http://' + args.Host + ':' + str(args.Port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    # Start the server once from the folder Python/:
+    # python CalcParam_Server.py --Port 8765
+    # and replace CalcParam.py with CalcParam_Client.py in existing calls (same arguments, same output.csv)
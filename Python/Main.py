@@ -17,6 +17,13 @@ import pytorch_lightning as pl
 from argparse import Namespace
 from argparse import ArgumentParser
 from pytorch_lightning.callbacks import ModelCheckpoint
+from A01_Functions.FastTraining import Func_runFastTraining
+from A01_Functions.EnsembleTraining import Func_runEnsembleTraining
+from A01_Functions.ValidationTraining import Func_runValidationTraining, Func_conditionFromDataPath
+from A01_Functions.IncrementalTraining import Func_runIncrementalTraining
+from A01_Functions.ModelRegistry import Func_getCheckpointPath
+import time
+from A01_Functions import Profiling
 
 
 pd.set_option('display.width', 1000)
@@ -26,7 +33,12 @@ torch.set_printoptions(linewidth=200, edgeitems=4)
 
 
 def Func_runTraining(Epoch, numHiddenNeuron_1, numHiddenNeuron_2, Variant,
-                     BatchSize, learningRate):
+                     BatchSize, learningRate, DataPath=DataPath_Default, OutputFolder='', Seed=None, Archive=False):
+    # OutputFolder: prefix of the folders A03_Models/FF/ and A04_Results_Training/ (e.g. one folder per sweep job)
+    # Archive: every 100th epoch into one checkpoint archive A03_Models/FF/<Name>.ckpa instead of .ckpt files
+
+    if Seed is not None:
+        torch.manual_seed(Seed)
 
     if Variant == 1:
         InputSize = 3
@@ -40,7 +52,8 @@ def Func_runTraining(Epoch, numHiddenNeuron_1, numHiddenNeuron_2, Variant,
                         Variant=Variant,
                         BatchSize=BatchSize,
                         learningRate=learningRate,
-                        InputSize=InputSize)
+                        InputSize=InputSize,
+                        DataPath=DataPath)
 
     # **{"layer_1_dim": numHiddenNeuron_1,
     #        "layer_2_dim": numHiddenNeuron_2,
@@ -55,26 +68,58 @@ def Func_runTraining(Epoch, numHiddenNeuron_1, numHiddenNeuron_2, Variant,
 
     CheckpointNameStr = 'FF_Variant_' + str(Variant) + '_BatchSize_' + str(BatchSize) + '_'
 
-    ModelPath = 'A03_Models/FF/' + CheckpointNameStr
+    ModelPath = OutputFolder + 'A03_Models/FF/' + CheckpointNameStr
+
+    Callbacks = [FF_Class.MyCallback(PlotName=PlotNameStr, DataName=PlotNameStr, ModelPath=ModelPath,
+                                     ResultFolder=OutputFolder + 'A04_Results_Training/')]
 
-    checkpoint_callback = ModelCheckpoint(filepath='A03_Models/FF/' + CheckpointNameStr + '{epoch}',
-                                          save_top_k=-1,
-                                          period=100)
+    if Archive:
+        checkpoint_callback = False
+        Callbacks.append(FF_Class.ArchiveCallback(ModelPath.rstrip('_') + '.ckpa', Period=100))
+    else:
+        checkpoint_callback = ModelCheckpoint(filepath=OutputFolder + 'A03_Models/FF/' + CheckpointNameStr +
+                                              '{epoch}',
+                                              save_top_k=-1,
+                                              period=100)
 
     trainer = pl.Trainer(progress_bar_refresh_rate=0, logger=False,
                          checkpoint_callback=checkpoint_callback,  # oder False
-                         callbacks=[FF_Class.MyCallback(PlotName=PlotNameStr, DataName=PlotNameStr,
-                                                        ModelPath=ModelPath)],
+                         callbacks=Callbacks,
                          max_epochs=Epoch, reload_dataloaders_every_epoch=False)
+
+    Start = time.time()
     trainer.fit(Model)
+    Duration = time.time() - Start
+
+    print('Lightning training: ' + str(Epoch) + ' epochs in {:.2f} seconds ({:.1f} Epochs/s)'.format(
+        Duration, Epoch / Duration))
+
+    return Model, Epoch / Duration
 
 
 if __name__ == "__main__":
 
     parser = ArgumentParser()
     parser.add_argument('--Variant', type=int, default=1)
+    parser.add_argument('--Engine', type=str, default='Lightning', choices=['Lightning', 'Fast', 'Ensemble',
+                                                                              'Validation', 'Incremental'])
+    parser.add_argument('--Members', type=int, default=8)
+    parser.add_argument('--Archive', action='store_true')
+    parser.add_argument('--DataPath', type=str, default=DataPath_Default)
+    parser.add_argument('--Profile', action='store_true')
+    parser.add_argument('--Split', type=str, default='holdout', choices=['holdout', 'loo'])
+    parser.add_argument('--Patience', type=int, default=200)
+    parser.add_argument('--Condition', type=str, default=None, help='Default: Condition of --DataPath')
+    parser.add_argument('--Checkpoint', type=str, default=None, help='Start of --Engine Incremental, default: '
+                                                                     'selected checkpoint of the Condition')
+    parser.add_argument('--FineTuneEpochs', type=int, default=None, help='Default: scaled by the new rows')
+    parser.add_argument('--ReplayWeight', type=float, default=1.0)
+    parser.add_argument('--UpdateManifest', action='store_true')
     args = parser.parse_args()
 
+    if args.Profile:
+        Profiling.Func_enable()
+
     Epoch = 4000
     numHiddenNeuron_1 = 40
     numHiddenNeuron_2 = 80
@@ -88,5 +133,32 @@ if __name__ == "__main__":
           " BatchSize: " + str(BatchSize) +
           " learningRate: " + str(learningRate))
 
-    Func_runTraining(Epoch=Epoch, numHiddenNeuron_1=numHiddenNeuron_1, numHiddenNeuron_2=numHiddenNeuron_2,
-                     Variant=args.Variant, BatchSize=BatchSize, learningRate=learningRate)
+    if args.Engine == 'Fast':
+        Func_runFastTraining(Epoch=Epoch, numHiddenNeuron_1=numHiddenNeuron_1, numHiddenNeuron_2=numHiddenNeuron_2,
+                             Variant=args.Variant, BatchSize=BatchSize, learningRate=learningRate,
+                             DataPath=args.DataPath, PlotFolder='A04_Results_Training/01_Plots/',
+                             ArchivePath='A03_Models/FF/FF_Variant_' + str(args.Variant) + '_BatchSize_' +
+                                         str(BatchSize) + '.ckpa' if args.Archive else None)
+    elif args.Engine == 'Validation':
+        Func_runValidationTraining(Condition=args.Condition if args.Condition is not None else
+                                   Func_conditionFromDataPath(args.DataPath),
+                                   Variant=args.Variant, Epoch=Epoch, numHiddenNeuron_1=numHiddenNeuron_1,
+                                   numHiddenNeuron_2=numHiddenNeuron_2, BatchSize=BatchSize,
+                                   learningRate=learningRate, DataPath=args.DataPath, Split=args.Split,
+                                   Patience=args.Patience)
+    elif args.Engine == 'Incremental':
+        Condition = args.Condition if args.Condition is not None else Func_conditionFromDataPath(args.DataPath)
+        Func_runIncrementalTraining(CheckpointPath=args.Checkpoint if args.Checkpoint is not None else
+                                    Func_getCheckpointPath(Condition, args.Variant),
+                                    DataPath=args.DataPath, Condition=Condition, Epoch=args.FineTuneEpochs,
+                                    ReplayWeight=args.ReplayWeight, FullSchedule=Epoch,
+                                    UpdateManifest=args.UpdateManifest)
+    elif args.Engine == 'Ensemble':
+        Func_runEnsembleTraining(Epoch=Epoch, numHiddenNeuron_1=numHiddenNeuron_1, numHiddenNeuron_2=numHiddenNeuron_2,
+                                 Variant=args.Variant, BatchSize=BatchSize, learningRate=learningRate,
+                                 NumMembers=args.Members, DataPath=args.DataPath,
+                                 PlotFolder='A04_Results_Training/01_Plots/')
+    else:
+        Func_runTraining(Epoch=Epoch, numHiddenNeuron_1=numHiddenNeuron_1, numHiddenNeuron_2=numHiddenNeuron_2,
+                         Variant=args.Variant, BatchSize=BatchSize, learningRate=learningRate,
+                         DataPath=args.DataPath, Archive=args.Archive)
@@ -0,0 +1,212 @@
+# Description:
+# Demo code from the article:
+# Deep learning based pupil model predicts time and wavelength dependent light responses
+# Technical University of Darmstadt, Laboratory of Lighting Technology
+# Published in Scientific Reports
+# Link: www.nature.com/articles/s41598-020-79908-5
+# GitHub Link: https://github.com/BZandi/DL-PupilModel
+
+# Hyperparameter sweep over Func_runTraining() / Func_runFastTraining() in a process pool.
+# The sweep is described by a .json file, e.g.
+#   {"Engine": "Fast", "Search": "grid",
+#    "Parameters": {"Variant": [1, 2, 3], "numHiddenNeuron_1": [40], "numHiddenNeuron_2": [80],
+#                   "BatchSize": [7], "learningRate": [0.001, 0.0005], "Epoch": [4000], "Seed": [0, 1],
+#                   "DataPath": ["A00_Data/TrainData_Many_Subject.csv",
+#                                "A00_Data/TrainData_Individual_Subject.csv"]}}
+# "Search": "random" draws "NumSamples" distinct configurations of the grid (with "Seed" for the draw), at most
+# all configurations of the grid.
+# Every job writes its checkpoints, plots and logs into its own folder SweepFolder/<Job>/ with the usual
+# A03_Models/FF/ and A04_Results_Training/ layout and a result.json with the final MSE/MAE. Jobs with a
+# result.json are skipped, so an interrupted sweep is resumed by starting it again.
+# All result.json files are collected into SweepFolder/results.csv.
+#
+# Run from the folder Python/:
+#   python Sweep.py --Spec sweep.json --SweepFolder A05_Sweeps/Sweep_1/ --Workers 4
+
+import os
+import json
+import random
+import hashlib
+import itertools
+import multiprocessing
+import pandas as pd
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from A01_Functions.ReadData import DataPath_Default
+
+# Values of Main.py for parameters which are not part of the spec
+DefaultParameters = {'Variant': 1,
+                     'numHiddenNeuron_1': 40,
+                     'numHiddenNeuron_2': 80,
+                     'BatchSize': 7,
+                     'learningRate': 0.001,
+                     'Epoch': 4000,
+                     'Seed': None,
+                     'DataPath': DataPath_Default}
+
+
+def Func_expandSpec(Spec):
+    # List of configurations (dicts with all keys of DefaultParameters) described by the spec
+    Parameters = dict(Spec.get('Parameters', {}))
+    Unknown = set(Parameters) - set(DefaultParameters)
+    if Unknown:
+        raise KeyError('Unknown sweep parameters: ' + ', '.join(sorted(Unknown)))
+
+    Names = list(DefaultParameters.keys())
+    Values = [list(Parameters.get(Name, [DefaultParameters[Name]])) for Name in Names]
+
+    Search = Spec.get('Search', 'grid')
+    if Search == 'grid':
+        return [dict(zip(Names, Combination)) for Combination in itertools.product(*Values)]
+    if Search == 'random':
+        # Grid positions without replacement, decoded in the order of itertools.product()
+        Sizes = [len(Value) for Value in Values]
+        GridSize = 1
+        for Size in Sizes:
+            GridSize *= Size
+        NumSamples = int(Spec.get('NumSamples', 10))
+        if NumSamples > GridSize:
+            print('NumSamples ' + str(NumSamples) + ' is larger than the grid, all ' + str(GridSize) +
+                  ' configurations are used')
+
+        Configs = []
+        for Position in random.Random(Spec.get('Seed', 0)).sample(range(GridSize), min(NumSamples, GridSize)):
+            Combination = []
+            for Value, Size in zip(reversed(Values), reversed(Sizes)):
+                [Position, Index] = divmod(Position, Size)
+                Combination.append(Value[Index])
+            Configs.append(dict(zip(Names, reversed(Combination))))
+        return Configs
+
+    raise ValueError('Unknown Search ' + str(Search) + ' (grid or random)')
+
+
+def Func_jobName(Config):
+    # Readable and unique folder name of a configuration
+    Hash = hashlib.sha1(json.dumps(Config, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+
+    return 'Variant_' + str(Config['Variant']) + '_Hidden_' + str(Config['numHiddenNeuron_1']) + '_' + \
+           str(Config['numHiddenNeuron_2']) + '_BatchSize_' + str(Config['BatchSize']) + '_' + Hash
+
+
+def Func_evaluateModel(Model, Variant, DataPath):
+    # Final MSE/MAE of the trained model on the whole training data
+    import torch
+    from A01_Functions.ReadData import Func_readDataIn
+
+    [TrainInputMatrix, TrainTargetMatrix] = Func_readDataIn(Variant, DataPath)
+    Model = Model.cpu().eval()
+
+    with torch.no_grad():
+        Difference = Model(TrainInputMatrix) - TrainTargetMatrix
+
+    return float((Difference ** 2).mean()), float(Difference.abs().mean())
+
+
+def Func_runJob(Config, JobFolder, Engine):
+    # Runs in a worker process: one training with all outputs below JobFolder
+    import torch
+
+    # One intra-op thread per worker, the parallelism comes from the process pool
+    torch.set_num_threads(1)
+
+    OutputFolder = JobFolder.rstrip('/') + '/'
+    for Folder in ['A03_Models/FF/', 'A04_Results_Training/01_Plots/', 'A04_Results_Training/02_Data/']:
+        os.makedirs(OutputFolder + Folder, exist_ok=True)
+
+    TrainParameters = {Name: Config[Name] for Name in ['Epoch', 'numHiddenNeuron_1', 'numHiddenNeuron_2',
+                                                       'Variant', 'BatchSize', 'learningRate', 'DataPath',
+                                                       'Seed']}
+
+    if Engine == 'Fast':
+        from A01_Functions.FastTraining import Func_runFastTraining
+        [Model, EpochsPerSecond] = Func_runFastTraining(ModelFolder=OutputFolder + 'A03_Models/FF/',
+                                                        DataFolder=OutputFolder + 'A04_Results_Training/02_Data/',
+                                                        PlotFolder=OutputFolder + 'A04_Results_Training/01_Plots/',
+                                                        PrintPeriod=0, **TrainParameters)
+    else:
+        from Main import Func_runTraining
+        [Model, EpochsPerSecond] = Func_runTraining(OutputFolder=OutputFolder, **TrainParameters)
+
+    [MSE, MAE] = Func_evaluateModel(Model, Config['Variant'], Config['DataPath'])
+
+    Result = dict(Config, Job=os.path.basename(JobFolder.rstrip('/')), Engine=Engine, MSE=MSE, MAE=MAE,
+                  EpochsPerSecond=EpochsPerSecond)
+
+    # Written last and atomically: a job counts as finished only with a complete result.json
+    with open(os.path.join(JobFolder, 'result.json.tmp'), 'w') as File:
+        json.dump(Result, File, indent=2)
+    os.replace(os.path.join(JobFolder, 'result.json.tmp'), os.path.join(JobFolder, 'result.json'))
+
+    return Result
+
+
+def Func_collectResults(SweepFolder):
+    # All finished jobs of the sweep as one table, best configuration first
+    Results = []
+    for Job in sorted(os.listdir(SweepFolder)):
+        PATH = os.path.join(SweepFolder, Job, 'result.json')
+        if os.path.isfile(PATH):
+            with open(PATH) as File:
+                Results.append(json.load(File))
+
+    Table = pd.DataFrame(Results)
+    if len(Table) > 0:
+        Table = Table.sort_values('MSE').reset_index(drop=True)
+    Table.to_csv(os.path.join(SweepFolder, 'results.csv'), index=False)
+
+    return Table
+
+
+def Func_runSweep(Spec, SweepFolder, Workers=None):
+    Engine = Spec.get('Engine', 'Lightning')
+    if Engine not in ['Lightning', 'Fast']:
+        raise ValueError('Unknown Engine ' + str(Engine) + ' (Lightning or Fast)')
+
+    os.makedirs(SweepFolder, exist_ok=True)
+    with open(os.path.join(SweepFolder, 'spec.json'), 'w') as File:
+        json.dump(Spec, File, indent=2)
+
+    Jobs = {}
+    for Config in Func_expandSpec(Spec):
+        Jobs[os.path.join(SweepFolder, Func_jobName(Config))] = Config
+
+    Pending = {JobFolder: Config for JobFolder, Config in Jobs.items()
+               if not os.path.isfile(os.path.join(JobFolder, 'result.json'))}
+
+    print('Sweep: ' + str(len(Jobs)) + ' jobs, ' + str(len(Jobs) - len(Pending)) + ' finished, ' +
+          str(len(Pending)) + ' to run', flush=True)
+
+    if Workers is None:
+        Workers = os.cpu_count() or 1
+
+    if len(Pending) > 0:
+        # spawn: the workers do not inherit the torch thread pools or the state of the parent process
+        with ProcessPoolExecutor(max_workers=min(Workers, len(Pending)),
+                                 mp_context=multiprocessing.get_context('spawn')) as Executor:
+            Futures = {Executor.submit(Func_runJob, Config, JobFolder, Engine): JobFolder
+                       for JobFolder, Config in Pending.items()}
+
+            for Future in as_completed(Futures):
+                JobFolder = Futures[Future]
+                try:
+                    Result = Future.result()
+                    print('Finished ' + JobFolder + ': MSE {:.9f} MAE {:.9f}'.format(Result['MSE'], Result['MAE']))
+                except Exception as Error:
+                    print('Failed ' + JobFolder + ': ' + repr(Error))
+
+    return Func_collectResults(SweepFolder)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--Spec', type=str, required=True)
+    parser.add_argument('--SweepFolder', type=str, default='A05_Sweeps/Sweep/')
+    parser.add_argument('--Workers', type=int, default=None)
+    args = parser.parse_args()
+
+    with open(args.Spec) as File:
+        Spec = json.load(File)
+
+    Table = Func_runSweep(Spec, args.SweepFolder, Workers=args.Workers)
+    print(Table.to_string())